@@ -20,14 +20,75 @@ def create_app():
     app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///vertical_search.db')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False # Suppress warning
 
+    # Search ranking: bm25 column weights for title/abstract and how strongly
+    # relevance favours recent years (0 disables it).
+    app.config['SEARCH_TITLE_WEIGHT'] = float(os.getenv('SEARCH_TITLE_WEIGHT', '10.0'))
+    app.config['SEARCH_ABSTRACT_WEIGHT'] = float(os.getenv('SEARCH_ABSTRACT_WEIGHT', '1.0'))
+    app.config['SEARCH_RECENCY_BOOST'] = float(os.getenv('SEARCH_RECENCY_BOOST', '0.0'))
+    # Results per page (overridable with ?per_page= up to the maximum).
+    app.config['SEARCH_PAGE_SIZE'] = int(os.getenv('SEARCH_PAGE_SIZE', '20'))
+    app.config['SEARCH_MAX_PAGE_SIZE'] = int(os.getenv('SEARCH_MAX_PAGE_SIZE', '100'))
+    # Show each cluster of near-duplicate publications (app/dedup.py) once.
+    app.config['SEARCH_COLLAPSE_DUPLICATES'] = os.getenv('SEARCH_COLLAPSE_DUPLICATES', '1') not in ('0', 'false', 'no')
+    # Time allowed for "did you mean" suggestions when a search has no
+    # results, in milliseconds (0 disables them), see app/spelling.py.
+    app.config['SEARCH_SPELLING_BUDGET_MS'] = float(os.getenv('SEARCH_SPELLING_BUDGET_MS', '50'))
+    # Where the search page reads from: 'sqlite' (the database) or 'snapshot',
+    # the read-only export that scripts/export_snapshot.py publishes under
+    # SNAPSHOT_DIR (see app/snapshot.py). Workers look for a newer snapshot
+    # every SNAPSHOT_CHECK_INTERVAL seconds and switch to it without a restart.
+    app.config['SEARCH_BACKEND'] = os.getenv('SEARCH_BACKEND', 'sqlite')
+    app.config['SNAPSHOT_DIR'] = os.getenv('SNAPSHOT_DIR', 'snapshots')
+    app.config['SNAPSHOT_CHECK_INTERVAL'] = float(os.getenv('SNAPSHOT_CHECK_INTERVAL', '5'))
+    # Number of authors listed in the author facet.
+    app.config['FACET_AUTHOR_LIMIT'] = int(os.getenv('FACET_AUTHOR_LIMIT', '10'))
+
+    # Search result cache: entries kept per worker (0 disables caching), their
+    # lifetime in seconds, and an optional SQLite file shared by all workers.
+    app.config['RESULT_CACHE_SIZE'] = int(os.getenv('RESULT_CACHE_SIZE', '1024'))
+    app.config['RESULT_CACHE_TTL'] = int(os.getenv('RESULT_CACHE_TTL', '300'))
+    app.config['RESULT_CACHE_PATH'] = os.getenv('RESULT_CACHE_PATH')
+
+    # Request/SQL metrics served on /metrics, and the threshold in
+    # milliseconds above which statements are logged with their query plan
+    # (0 disables the slow-query log).
+    app.config['METRICS_ENABLED'] = os.getenv('METRICS_ENABLED', '1') not in ('0', 'false', 'no')
+    app.config['SLOW_QUERY_MS'] = float(os.getenv('SLOW_QUERY_MS', '0') or 0)
+
     # Initialize the database
-    from app.database import init_db
+    from app.database import init_db, close_read_session
     with app.app_context():
         init_db() # Create tables if they don't exist
 
+    # Request-scoped read sessions are closed when the app context ends
+    app.teardown_appcontext(close_read_session)
+
+    # Request timing and SQL instrumentation
+    if app.config['METRICS_ENABLED']:
+        from app import metrics
+        from app.database import engine, reader_engine
+        metrics.init_app(app, {'writer': engine, 'reader': reader_engine})
+
+    # Set up the search result cache
+    from app.cache import ResultCache
+    if app.config['RESULT_CACHE_SIZE'] > 0:
+        app.extensions['result_cache'] = ResultCache(
+            app.config['RESULT_CACHE_SIZE'], app.config['RESULT_CACHE_TTL'], app.config['RESULT_CACHE_PATH']
+        )
+
+    # Set up the snapshot search backend
+    if app.config['SEARCH_BACKEND'] == 'snapshot':
+        from app.snapshot import SnapshotStore
+        app.extensions['snapshot_store'] = SnapshotStore(
+            app.config['SNAPSHOT_DIR'], app.config['SNAPSHOT_CHECK_INTERVAL'], log=app.logger.warning
+        )
+    elif app.config['SEARCH_BACKEND'] != 'sqlite':
+        raise ValueError(f"Unknown SEARCH_BACKEND '{app.config['SEARCH_BACKEND']}': use 'sqlite' or 'snapshot'")
+
     # Register blueprints (routes)
-    from . import routes
+    from . import routes, api
     app.register_blueprint(routes.bp)
+    app.register_blueprint(api.bp)
 
     # Optional: Add error handles, context processors, etc. here
     return app
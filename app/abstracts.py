@@ -0,0 +1,239 @@
+# app/abstracts.py
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from bs4 import BeautifulSoup
+from sqlalchemy import DateTime, bindparam, select, text
+from sqlalchemy.dialects.sqlite import insert
+
+from app.crawler import AsyncCrawler
+from app.cache import bump_index_generation
+from app.dedup import DuplicateDetector
+from app.models import AbstractFetchFailure
+
+# Where PurePortal puts the abstract on a publication's detail page, most
+# specific first. The citation meta tag is a fallback for older templates.
+ABSTRACT_SELECTORS = [
+    'div.rendering_abstractportal div.textblock',
+    'div.rendering_abstractportal',
+    'section.abstract div.textblock',
+]
+
+# Pages that were fetched successfully but have no abstract are stored as ''
+# so that reruns can tell "checked, nothing there" apart from "never fetched".
+NO_ABSTRACT = ''
+
+# A detail page that fails with a client error (404 for a removed page, 410,
+# 403) will fail the same way on the next run, so it is skipped for a
+# cool-off that doubles with every failed attempt, up to the maximum.
+# Network errors, 429 and 5xx are transient and retried on every run.
+FAILURE_COOLOFF = timedelta(days=7)
+MAX_FAILURE_COOLOFF = timedelta(days=180)
+
+
+def _now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def is_permanent_failure(result):
+    """True for a fetch that ended in an HTTP 4xx other than 429 Too Many Requests."""
+    return result.status is not None and 400 <= result.status < 500 and result.status != 429
+
+
+def failure_cooloff(attempts):
+    """How long to skip a page after its `attempts`-th permanent failure."""
+    return min(FAILURE_COOLOFF * 2 ** min(attempts - 1, 8), MAX_FAILURE_COOLOFF)
+
+
+def extract_abstract(html):
+    """
+    Returns the abstract text from a publication detail page, or None if the
+    page does not contain one.
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    for selector in ABSTRACT_SELECTORS:
+        node = soup.select_one(selector)
+        if node:
+            abstract = node.get_text(" ", strip=True)
+            if abstract:
+                return abstract
+    meta = soup.find('meta', attrs={'name': 'citation_abstract'})
+    if meta and meta.get('content', '').strip():
+        return meta['content'].strip()
+    return None
+
+
+def pending_publications(engine, limit=None, retry_failed=False):
+    """
+    Returns (id, publication_link) for every publication whose detail page
+    has not been fetched yet. Rows that already have an abstract (or were
+    marked as having none) are skipped, so reruns only touch new rows, and
+    so are pages that failed permanently until their cool-off has passed
+    (unless `retry_failed`).
+    """
+    sql = (
+        "SELECT p.id, p.publication_link FROM publications p "
+        "LEFT JOIN abstract_fetch_failures f ON f.publication_id = p.id "
+        "WHERE p.abstract IS NULL"
+    )
+    if not retry_failed:
+        sql += " AND (f.retry_after IS NULL OR f.retry_after <= :now)"
+    sql += " ORDER BY p.id"
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    statement = text(sql)
+    if not retry_failed:
+        statement = statement.bindparams(bindparam('now', _now(), type_=DateTime))
+    with engine.connect() as connection:
+        return connection.execute(statement).fetchall()
+
+
+def write_abstracts(engine, batch, dedup=True):
+    """
+    Writes a batch of {'id': ..., 'abstract': ...} rows to publications in
+    one transaction; the FTS triggers re-index the updated rows. With
+    `dedup`, rows that got an abstract are re-checked for near-duplicates
+    (app/dedup.py): a copy listed under a reworded title can only be found
+    through its abstract.
+    """
+    with engine.begin() as connection:
+        connection.execute(text("UPDATE publications SET abstract = :abstract WHERE id = :id"), batch)
+        connection.execute(text("DELETE FROM abstract_fetch_failures WHERE publication_id = :id"), batch)
+        if dedup:
+            DuplicateDetector().recheck(connection, [row['id'] for row in batch if row['abstract']])
+        bump_index_generation(connection)
+
+
+def record_fetch_failures(engine, failures, now=None):
+    """
+    Records a batch of {'id': ..., 'status': ...} permanent failures in
+    abstract_fetch_failures, counting the attempt and pushing retry_after
+    out by failure_cooloff().
+    """
+    now = now or _now()
+    table = AbstractFetchFailure.__table__
+    with engine.begin() as connection:
+        attempts = dict(connection.execute(
+            select(table.c.publication_id, table.c.attempts)
+            .where(table.c.publication_id.in_([failure['id'] for failure in failures]))
+        ).fetchall())
+        rows = []
+        for failure in failures:
+            count = attempts.get(failure['id'], 0) + 1
+            rows.append({
+                'publication_id': failure['id'],
+                'status': failure['status'],
+                'attempts': count,
+                'last_attempt': now,
+                'retry_after': now + failure_cooloff(count),
+            })
+        statement = insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=['publication_id'],
+            set_={column: statement.excluded[column] for column in ('status', 'attempts', 'last_attempt', 'retry_after')},
+        )
+        connection.execute(statement, rows)
+
+
+class AbstractFetcher:
+    """
+    Second crawl stage: visits each publication's detail page with a fixed
+    pool of workers and writes the extracted abstracts back in batches,
+    along with the pages that failed permanently.
+
+    Workers pull links from a bounded queue, so a slow page only ties up its
+    own worker. Retries and backoff come from AsyncCrawler.fetch. Parsing
+    and database writes run in threads, so fetching continues while a page
+    is parsed or a batch is committed.
+    """
+
+    def __init__(self, engine, workers=8, rate=2.0, batch_size=100, retries=3, backoff=2.0, dedup=True):
+        self.engine = engine
+        self.dedup = dedup
+        self.workers = workers
+        self.rate = rate
+        self.batch_size = batch_size
+        self.retries = retries
+        self.backoff = backoff
+        self.fetched = 0
+        self.found = 0
+        self.failed = 0
+        self.failed_permanently = 0
+        self.written = 0
+
+    async def run(self, rows):
+        queue = asyncio.Queue(maxsize=self.workers * 2)
+        results = asyncio.Queue()
+
+        async with AsyncCrawler(rate=self.rate, burst=self.workers, max_in_flight=self.workers,
+                                retries=self.retries, backoff=self.backoff) as crawler:
+            writer = asyncio.create_task(self._writer(results))
+            workers = [asyncio.create_task(self._worker(crawler, queue, results)) for _ in range(self.workers)]
+            try:
+                for row in rows:
+                    await queue.put(row)
+                for _ in workers:
+                    await queue.put(None)
+                await asyncio.gather(*workers)
+            finally:
+                for worker in workers:
+                    worker.cancel()
+                await results.put(None)
+                await writer
+
+    async def _worker(self, crawler, queue, results):
+        while True:
+            row = await queue.get()
+            if row is None:
+                return
+            publication_id, link = row
+            result = await crawler.fetch(link)
+            if not result.ok:
+                self.failed += 1
+                print(f"Error fetching {link}: {result.error}")
+                if is_permanent_failure(result):
+                    self.failed_permanently += 1
+                    await results.put({'id': publication_id, 'status': result.status})
+                continue
+            self.fetched += 1
+            abstract = await asyncio.to_thread(extract_abstract, result.text)
+            if abstract:
+                self.found += 1
+            await results.put({'id': publication_id, 'abstract': abstract or NO_ABSTRACT})
+
+    async def _writer(self, results):
+        batch = []
+        while True:
+            item = await results.get()
+            if item is not None:
+                batch.append(item)
+            if batch and (item is None or len(batch) >= self.batch_size):
+                abstracts = [row for row in batch if 'abstract' in row]
+                failures = [row for row in batch if 'status' in row]
+                await asyncio.to_thread(self._write, abstracts, failures)
+                self.written += len(abstracts)
+                print(f"Wrote {self.written} abstracts ({self.found} found, {self.failed} failed so far, "
+                      f"{self.failed_permanently} of them permanently).")
+                batch = []
+            if item is None:
+                return
+
+    def _write(self, abstracts, failures):
+        if abstracts:
+            write_abstracts(self.engine, abstracts, self.dedup)
+        if failures:
+            record_fetch_failures(self.engine, failures)
+
+
+def fetch_missing_abstracts(engine, workers=8, rate=2.0, batch_size=100, limit=None, dedup=True, retry_failed=False):
+    """
+    Runs the abstract stage for every publication still missing one, except
+    those cooling off after a permanent failure unless `retry_failed`.
+    Returns the AbstractFetcher so callers can report its counters.
+    """
+    rows = pending_publications(engine, limit, retry_failed)
+    print(f"{len(rows)} publications need an abstract.")
+    fetcher = AbstractFetcher(engine, workers=workers, rate=rate, batch_size=batch_size, dedup=dedup)
+    if rows:
+        asyncio.run(fetcher.run(rows))
+    return fetcher
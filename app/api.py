@@ -0,0 +1,189 @@
+# app/api.py
+import json
+
+from flask import Blueprint, Response, current_app, jsonify, request
+from sqlalchemy.exc import OperationalError
+
+from app.database import get_read_session, reader_engine
+from app.routes import search_args, search_filters, cached_search, cached_facets, cached_suggestions
+from app.search import iter_publications, mark_highlights
+from app.authors import suggest_authors
+
+bp = Blueprint('api', __name__, url_prefix='/api')
+
+# Every field a record can carry, and the ones returned when the client
+# doesn't ask for specific fields with ?fields=a,b,c.
+API_FIELDS = ('id', 'title', 'publication_link', 'publication_year', 'abstract',
+              'authors', 'rank', 'title_highlight', 'snippet', 'duplicates')
+DEFAULT_FIELDS = ('id', 'title', 'publication_link', 'publication_year', 'authors')
+
+# Rows pulled from the database cursor per batch while exporting.
+EXPORT_BATCH_SIZE = 500
+
+# Default and maximum number of author suggestions.
+SUGGEST_LIMIT = 10
+MAX_SUGGEST_LIMIT = 50
+
+
+class BadRequest(ValueError):
+    pass
+
+
+def parse_fields(value):
+    """Reads ?fields= into a tuple of field names in API_FIELDS order."""
+    if not value:
+        return DEFAULT_FIELDS
+    requested = {field.strip() for field in value.split(',') if field.strip()}
+    unknown = requested.difference(API_FIELDS)
+    if unknown:
+        raise BadRequest(f"Unknown fields: {', '.join(sorted(unknown))}. "
+                         f"Available fields: {', '.join(API_FIELDS)}")
+    return tuple(field for field in API_FIELDS if field in requested)
+
+
+def hit_record(hit, fields):
+    """
+    Compact dict for one SearchHit with only the requested fields. Highlights
+    are rendered as escaped HTML with <mark> tags, like on the search page.
+    """
+    record = {}
+    for field in fields:
+        if field == 'authors':
+            record['authors'] = [{'id': author.id, 'name': author.name, 'author_link': author.author_link}
+                                 for author in hit.authors]
+        elif field in ('title_highlight', 'snippet'):
+            value = getattr(hit, field)
+            record[field] = str(mark_highlights(value)) if value else None
+        else:
+            record[field] = getattr(hit, field)
+    return record
+
+
+def error_response(message, status=400):
+    return jsonify({'error': message}), status
+
+
+@bp.route('/search', methods=['GET'])
+def search():
+    """
+    JSON version of the search page: same query, sort, cursor and filter
+    parameters, one page of compact records plus the cursors for the
+    neighbouring pages and the facet counts (omitted with ?facets=0).
+    A first page without results also carries "did you mean" suggestions;
+    unlike the search page, the API never swaps in their results.
+    """
+    try:
+        fields = parse_fields(request.args.get('fields'))
+    except BadRequest as e:
+        return error_response(str(e))
+    params = search_args(request.args)
+
+    with_facets = request.args.get('facets', '1') not in ('0', 'false')
+
+    try:
+        db_session = get_read_session()
+        page = cached_search(db_session, params)
+        facets = cached_facets(db_session, params) if with_facets else None
+        suggestions = None
+        if not page.hits and not params['after'] and not params['before']:
+            suggestions = cached_suggestions(db_session, params)
+    except ValueError as e:
+        return error_response(str(e)) # Malformed or foreign cursor
+    except OperationalError as e:
+        current_app.logger.info(f"Rejected search query {params['query']!r}: {e.orig}")
+        return error_response("Invalid search query.")
+
+    response = {
+        'query': params['query'],
+        'sort': params['sort'],
+        'per_page': params['page_size'],
+        'filters': {'year_from': params['year_from'], 'year_to': params['year_to'], 'authors': list(params['authors'])},
+        'results': [hit_record(hit, fields) for hit in page.hits],
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor,
+    }
+    if suggestions is not None:
+        response['suggestions'] = [{'query': suggestion.query, 'corrections': [list(pair) for pair in suggestion.corrections]}
+                                   for suggestion in suggestions]
+    if facets is not None:
+        response['facets'] = {
+            'years': [year._asdict() for year in facets.years],
+            'authors': [author._asdict() for author in facets.authors],
+        }
+    return jsonify(response)
+
+
+def export_lines(connection, query, sort, fields, filters=None, collapse=True):
+    """Yields one NDJSON line per matching publication and closes the connection at the end."""
+    try:
+        hits = iter_publications(
+            connection, query, sort, batch_size=EXPORT_BATCH_SIZE,
+            with_highlights='title_highlight' in fields or 'snippet' in fields,
+            with_authors='authors' in fields,
+            title_weight=current_app.config['SEARCH_TITLE_WEIGHT'],
+            abstract_weight=current_app.config['SEARCH_ABSTRACT_WEIGHT'],
+            recency_boost=current_app.config['SEARCH_RECENCY_BOOST'],
+            filters=filters, collapse=collapse,
+        )
+        for hit in hits:
+            yield json.dumps(hit_record(hit, fields), ensure_ascii=False, separators=(',', ':')) + '\n'
+    finally:
+        connection.close()
+
+
+@bp.route('/export', methods=['GET'])
+def export():
+    """
+    Streams every publication matching ?query= (all of them without one) and
+    the year/author filters as newline-delimited JSON, in ?sort= order. Rows are read from the database
+    cursor in batches while the response is being written, so memory use does
+    not grow with the size of the result set.
+    """
+    try:
+        fields = parse_fields(request.args.get('fields'))
+    except BadRequest as e:
+        return error_response(str(e))
+    params = search_args(request.args)
+
+    # The generator outlives the request context, so it gets its own
+    # connection instead of the request-scoped read session.
+    lines = export_lines(reader_engine.connect(), params['query'], params['sort'], fields,
+                         search_filters(params), params['collapse'])
+    # Pull the first line now so that a bad query still gets a proper 400
+    # instead of a truncated 200 stream.
+    try:
+        first = next(lines, '')
+    except OperationalError as e:
+        current_app.logger.info(f"Rejected export query {params['query']!r}: {e.orig}")
+        return error_response("Invalid search query.")
+
+    def generate():
+        try:
+            yield first
+            yield from lines
+        finally:
+            lines.close() # Releases the connection if the client disconnects early
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+
+@bp.route('/authors/suggest', methods=['GET'])
+def authors_suggest():
+    """
+    Author autocomplete: ?q= is matched against normalized author names
+    (case, diacritics and punctuation ignored), anywhere in the name.
+    Spellings of the same person are merged into one suggestion.
+    """
+    query = request.args.get('q', '').strip()
+    limit = max(1, min(request.args.get('limit', SUGGEST_LIMIT, type=int), MAX_SUGGEST_LIMIT))
+    suggestions = suggest_authors(get_read_session(), query, limit) if query else []
+    return jsonify({
+        'q': query,
+        'authors': [{
+            'id': suggestion.id,
+            'name': suggestion.name,
+            'author_link': suggestion.author_link,
+            'publication_count': suggestion.publication_count,
+            'variant_ids': list(suggestion.variant_ids),
+        } for suggestion in suggestions],
+    })
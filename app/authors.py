@@ -0,0 +1,185 @@
+# app/authors.py
+import re
+import unicodedata
+from collections import namedtuple
+
+from sqlalchemy import text
+
+# One autocomplete entry. Authors whose names share a name_key (e.g.
+# 'Smith, J.' and 'Smíth, John') are folded into one entry: the one with the
+# most publications is shown and the others are listed in variant_ids.
+AuthorSuggestion = namedtuple('AuthorSuggestion', ['id', 'name', 'author_link', 'publication_count', 'variant_ids'])
+
+AuthorProfile = namedtuple('AuthorProfile', ['id', 'name', 'author_link', 'name_key', 'publication_count'])
+
+# Query words shorter than a trigram can't use the index on their own.
+TRIGRAM_LENGTH = 3
+
+
+NON_WORD_PATTERN = re.compile(r'[\W_]+')
+
+
+def fold(value):
+    """Lowercase ASCII-ish form of a string: diacritics and punctuation removed, spaces collapsed."""
+    value = value or ''
+    if not value.isascii(): # ASCII text has nothing to decompose, and most titles are ASCII
+        value = ''.join(char for char in unicodedata.normalize('NFKD', value) if not unicodedata.combining(char))
+    return ' '.join(NON_WORD_PATTERN.sub(' ', value.casefold()).split())
+
+
+def normalize_name(name):
+    """The searchable form of an author name, e.g. 'Šimić, Ana-Marija' -> 'simic ana marija'."""
+    return fold(name)
+
+
+def name_key(name):
+    """
+    Surname plus first initial, which is what the spellings of one person on
+    PurePortal have in common: 'Smith, J.', 'Smith, John', 'John A. Smith'
+    and 'Smíth, J.' all give 'smith j'. Names are 'Surname, Given' when
+    they have a comma and 'Given Surname' otherwise.
+    """
+    if ',' in name:
+        surname, given = name.split(',', 1)
+    else:
+        parts = name.split()
+        surname, given = (parts[-1], ' '.join(parts[:-1])) if parts else ('', '')
+    given_words = fold(given).split()
+    return f"{fold(surname)} {given_words[0][0] if given_words else ''}".strip()
+
+
+# Trigram index over the normalized names, so both prefixes and substrings
+# of three or more characters are index lookups. External content over
+# authors, kept in sync by triggers like publications_fts.
+CREATE_AUTHORS_FTS_SQL = """
+CREATE VIRTUAL TABLE authors_fts USING fts5(
+    normalized_name,
+    content='authors', content_rowid='id',
+    tokenize='trigram'
+)
+"""
+
+AUTHORS_FTS_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS authors_fts_ai AFTER INSERT ON authors BEGIN
+        INSERT INTO authors_fts (rowid, normalized_name) VALUES (new.id, new.normalized_name);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS authors_fts_ad AFTER DELETE ON authors BEGIN
+        INSERT INTO authors_fts (authors_fts, rowid, normalized_name) VALUES ('delete', old.id, old.normalized_name);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS authors_fts_au AFTER UPDATE OF normalized_name ON authors BEGIN
+        INSERT INTO authors_fts (authors_fts, rowid, normalized_name) VALUES ('delete', old.id, old.normalized_name);
+        INSERT INTO authors_fts (rowid, normalized_name) VALUES (new.id, new.normalized_name);
+    END
+    """,
+]
+
+
+def backfill_name_keys(connection):
+    """Fills normalized_name/name_key for authors written before they existed. Returns the row count."""
+    rows = connection.execute(text(
+        "SELECT id, name FROM authors WHERE normalized_name IS NULL OR name_key IS NULL"
+    )).fetchall()
+    if rows:
+        connection.execute(
+            text("UPDATE authors SET normalized_name = :normalized_name, name_key = :name_key WHERE id = :id"),
+            [{'id': author_id, 'normalized_name': normalize_name(name), 'name_key': name_key(name)}
+             for author_id, name in rows]
+        )
+    return len(rows)
+
+
+def ensure_authors_fts(connection):
+    """
+    Called by init_db() after the columns exist: backfills the name keys,
+    then creates authors_fts (and indexes every author) if it is missing.
+    Returns 'created' or 'exists'.
+    """
+    backfill_name_keys(connection)
+    exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type='table' AND name='authors_fts'")
+    ).scalar()
+    if not exists:
+        connection.execute(text(CREATE_AUTHORS_FTS_SQL))
+    for trigger in AUTHORS_FTS_TRIGGERS:
+        connection.execute(text(trigger))
+    if exists:
+        return 'exists'
+    connection.execute(text("INSERT INTO authors_fts (authors_fts) VALUES ('rebuild')"))
+    return 'created'
+
+
+# Candidates are ranked by whether the name starts with the query, then by
+# how many publications the author has.
+SUGGEST_SQL = """
+SELECT a.id, a.name, a.author_link, a.name_key, coalesce(f.count, 0) AS publication_count
+FROM {source}
+LEFT JOIN facet_author_counts f ON f.author_id = a.id
+{where}
+ORDER BY a.normalized_name LIKE :starts_with DESC, publication_count DESC, a.name
+LIMIT :limit
+"""
+
+
+def suggest_authors(connection, query, limit=10):
+    """
+    Autocomplete for author names. Words of three or more characters are
+    matched anywhere in the name through authors_fts; shorter words narrow
+    those matches with LIKE. A query made only of short words falls back to
+    a prefix range scan on the normalized_name index.
+    """
+    folded = fold(query)
+    if not folded:
+        return []
+    words = folded.split()
+    long_words = [word for word in words if len(word) >= TRIGRAM_LENGTH]
+    params = {'starts_with': folded + '%', 'limit': limit * 3} # Extra rows to fill in after folding variants
+
+    if long_words:
+        source = "authors_fts JOIN authors a ON a.id = authors_fts.rowid"
+        # Folded words only contain letters, digits and spaces, so quoting them is enough.
+        conditions = ["authors_fts MATCH :match"]
+        params['match'] = ' AND '.join(f'"{word}"' for word in long_words)
+        for i, word in enumerate(word for word in words if len(word) < TRIGRAM_LENGTH):
+            conditions.append(f"a.normalized_name LIKE :short{i}")
+            params[f'short{i}'] = f'%{word}%'
+    else:
+        source = "authors a"
+        conditions = ["a.normalized_name >= :prefix", "a.normalized_name < :prefix_end"]
+        params.update(prefix=folded, prefix_end=folded + '\uffff')
+
+    rows = connection.execute(text(SUGGEST_SQL.format(
+        source=source, where=f"WHERE {' AND '.join(conditions)}"
+    )), params).fetchall()
+
+    suggestions = {}
+    for author_id, name, author_link, key, publication_count in rows:
+        if key in suggestions:
+            suggestion = suggestions[key]
+            suggestions[key] = suggestion._replace(
+                publication_count=suggestion.publication_count + publication_count,
+                variant_ids=suggestion.variant_ids + (author_id,),
+            )
+        elif len(suggestions) < limit:
+            suggestions[key] = AuthorSuggestion(author_id, name, author_link, publication_count, ())
+    return list(suggestions.values())
+
+
+def get_author(connection, author_id):
+    """AuthorProfile for an id, or None."""
+    row = connection.execute(text(
+        "SELECT a.id, a.name, a.author_link, a.name_key, coalesce(f.count, 0) FROM authors a "
+        "LEFT JOIN facet_author_counts f ON f.author_id = a.id WHERE a.id = :id"
+    ), {'id': author_id}).fetchone()
+    return AuthorProfile(*row) if row is not None else None
+
+
+def author_variants(connection, author):
+    """Other authors sharing the given AuthorProfile's name_key, as (id, name) pairs."""
+    return connection.execute(text(
+        "SELECT id, name FROM authors WHERE name_key = :key AND id != :id ORDER BY name"
+    ), {'key': author.name_key, 'id': author.id}).fetchall()
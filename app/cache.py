@@ -0,0 +1,235 @@
+# app/cache.py
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import text
+
+from app.query import match_expression
+from app.search import SearchHit, AuthorRef, SearchPage
+from app.facets import Facets, YearCount, AuthorCount
+
+GENERATION_KEY = 'generation'
+
+
+def get_index_generation(connection):
+    """Current index generation (0 for a database that was never ingested into)."""
+    value = connection.execute(
+        text("SELECT value FROM index_meta WHERE key = :key"), {'key': GENERATION_KEY}
+    ).scalar()
+    return value or 0
+
+
+def bump_index_generation(connection):
+    """
+    Increments the index generation. Writers call this inside the transaction
+    that changes searchable data, so the new generation becomes visible in
+    the same commit as the data and no cached result can outlive it.
+    """
+    connection.execute(text(
+        "INSERT INTO index_meta (key, value) VALUES (:key, 1) "
+        "ON CONFLICT (key) DO UPDATE SET value = value + 1"
+    ), {'key': GENERATION_KEY})
+
+
+def normalize_query(query):
+    """
+    Form of a query for use in cache keys: the MATCH expression it is run as
+    (app/query.py), so spellings that search the same way share an entry,
+    made case- and whitespace-insensitive. Operators stay distinct from
+    words, as terms are quoted ('a OR b' vs 'a "or" b').
+    """
+    match = match_expression(query) if query else None
+    return ' '.join((match if match is not None else query).lower().split())
+
+
+def dump_page(page):
+    """Serializes a SearchPage into compact JSON (rows as plain arrays)."""
+    return json.dumps([
+        [list(hit[:-1]) + [[list(author) for author in hit.authors]] for hit in page.hits],
+        page.next_cursor,
+        page.prev_cursor,
+    ], separators=(',', ':'))
+
+
+def load_page(data):
+    """Inverse of dump_page()."""
+    rows, next_cursor, prev_cursor = json.loads(data)
+    hits = [SearchHit(*row[:-1], authors=tuple(AuthorRef(*author) for author in row[-1])) for row in rows]
+    return SearchPage(hits, next_cursor, prev_cursor)
+
+
+def dump_facets(facets):
+    """Serializes Facets into compact JSON."""
+    return json.dumps([[list(year) for year in facets.years], [list(author) for author in facets.authors]],
+                      separators=(',', ':'))
+
+
+def load_facets(data):
+    """Inverse of dump_facets()."""
+    years, authors = json.loads(data)
+    return Facets([YearCount(*year) for year in years], [AuthorCount(*author) for author in authors])
+
+
+class LRUCache:
+    """
+    Bounded, thread-safe in-process LRU with a per-entry TTL. Values are kept
+    as-is, so callers should store compact immutable data (tuples).
+    """
+
+    def __init__(self, max_entries=1024, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+class SQLiteCacheTier:
+    """
+    Optional second tier shared by every worker process on the host: a small
+    SQLite file holding serialized pages. Rows from older index generations
+    are deleted whenever a newer generation is written.
+    """
+
+    def __init__(self, path, ttl=300):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._newest_generation = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS result_cache ("
+                "key TEXT PRIMARY KEY, generation INTEGER NOT NULL, expires_at REAL NOT NULL, value TEXT NOT NULL)"
+            )
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF") # A lost cache entry is just a miss
+            self._local.connection = connection
+        return connection
+
+    def get(self, key):
+        row = self._connection().execute(
+            "SELECT value FROM result_cache WHERE key = ? AND expires_at >= ?", (key, time.time())
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def put(self, key, generation, value):
+        connection = self._connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO result_cache (key, generation, expires_at, value) VALUES (?, ?, ?, ?)",
+            (key, generation, time.time() + self.ttl, value)
+        )
+        if self._newest_generation != generation:
+            self._newest_generation = generation
+            deleted = connection.execute(
+                "DELETE FROM result_cache WHERE generation < ? OR expires_at < ?", (generation, time.time())
+            ).rowcount
+            self.evictions += max(deleted, 0)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+class ResultCache:
+    """
+    Two-tier cache for SearchPages (and Facets) keyed on (index generation,
+    normalized query, sort, page size, cursors, filters). Since the
+    generation is part of the key, bumping it on ingest makes every older
+    entry unreachable at once.
+    """
+
+    def __init__(self, max_entries=1024, ttl=300, shared_path=None):
+        self.local = LRUCache(max_entries, ttl)
+        self.shared = SQLiteCacheTier(shared_path, ttl) if shared_path else None
+
+    @staticmethod
+    def make_key(generation, params, kind='page'):
+        """
+        Facets and spelling suggestions don't depend on sort, page size or
+        cursors, so their keys leave them out and every page of a search
+        shares one entry.
+        """
+        if kind in ('facets', 'suggestions'):
+            params = dict(params, sort=None, page_size=None, after=None, before=None)
+        return json.dumps([
+            kind, generation, normalize_query(params['query']), params['sort'],
+            params['page_size'], params['after'], params['before'],
+            params.get('year_from'), params.get('year_to'), list(params.get('authors', ())),
+            params.get('collapse', True),
+        ], separators=(',', ':'))
+
+    def get(self, key, load=load_page):
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            data = self.shared.get(key)
+            if data is not None:
+                value = load(data)
+                self.local.put(key, value)
+        return value
+
+    def put(self, key, generation, value, dump=dump_page):
+        self.local.put(key, value)
+        if self.shared is not None:
+            self.shared.put(key, generation, dump(value))
+
+    def stats(self):
+        stats = {'local': self.local.stats()}
+        if self.shared is not None:
+            stats['shared'] = self.shared.stats()
+        return stats
@@ -0,0 +1,111 @@
+# app/crawl_state.py
+import hashlib
+from datetime import datetime, timezone
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+
+from app.models import CrawlState, CrawlCheckpoint
+
+# The result list runs from the <ul class="list-results"> to the last
+# list-result-item. Everything outside it (session tokens, timestamps, the
+# pagination bar) may change on every request without the results changing.
+RESULTS_START_MARKER = 'list-results'
+RESULT_ITEM_MARKER = 'list-result-item'
+
+
+def _now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def results_fingerprint(html):
+    """
+    Returns a sha256 of the page's result-list markup, or of the whole page if
+    the markers are missing. Equal fingerprints mean the parsed records would
+    be identical, so the page can be skipped without parsing it.
+    """
+    start = html.find(RESULTS_START_MARKER)
+    last_item = html.rfind(RESULT_ITEM_MARKER)
+    if start != -1 and last_item != -1:
+        end = html.find('</li>', last_item)
+        html = html[start:end if end != -1 else len(html)]
+    return hashlib.sha256(html.encode('utf-8')).hexdigest()
+
+
+class CrawlStateStore:
+    """
+    Reads and writes crawl_state and crawl_checkpoints. States for a crawl
+    are loaded up front with one query; each update is its own small
+    transaction, written after the page's records were ingested.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.states = {}
+
+    def load(self, urls):
+        urls = list(urls)
+        with self.engine.connect() as connection:
+            for start in range(0, len(urls), 500):
+                rows = connection.execute(
+                    select(CrawlState.url, CrawlState.etag, CrawlState.last_modified, CrawlState.content_hash)
+                    .where(CrawlState.url.in_(urls[start:start + 500]))
+                ).fetchall()
+                self.states.update({row.url: row for row in rows})
+
+    def conditional_headers(self, url):
+        """If-None-Match / If-Modified-Since headers for a URL seen before."""
+        state = self.states.get(url)
+        headers = {}
+        if state is not None:
+            if state.etag:
+                headers['If-None-Match'] = state.etag
+            if state.last_modified:
+                headers['If-Modified-Since'] = state.last_modified
+        return headers
+
+    def is_unchanged(self, url, content_hash):
+        state = self.states.get(url)
+        return state is not None and state.content_hash == content_hash
+
+    def save(self, url, headers, content_hash):
+        """Records the validators and fingerprint from a 200 response."""
+        values = {
+            'url': url,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'content_hash': content_hash,
+            'last_crawled': _now(),
+        }
+        statement = insert(CrawlState.__table__).values(**values)
+        statement = statement.on_conflict_do_update(index_elements=['url'], set_=values)
+        with self.engine.begin() as connection:
+            connection.execute(statement)
+
+    def touch(self, url):
+        """Marks a URL as re-checked after a 304 Not Modified."""
+        with self.engine.begin() as connection:
+            connection.execute(
+                CrawlState.__table__.update().where(CrawlState.url == url).values(last_crawled=_now())
+            )
+
+    def checkpoint(self, root_url):
+        """Returns the stored CrawlCheckpoint row for a listing root, or None."""
+        with self.engine.connect() as connection:
+            return connection.execute(
+                select(CrawlCheckpoint.last_page, CrawlCheckpoint.total_pages, CrawlCheckpoint.completed)
+                .where(CrawlCheckpoint.root_url == root_url)
+            ).first()
+
+    def save_checkpoint(self, root_url, last_page, total_pages, completed=False):
+        values = {
+            'root_url': root_url,
+            'last_page': last_page,
+            'total_pages': total_pages,
+            'completed': completed,
+            'updated_at': _now(),
+        }
+        statement = insert(CrawlCheckpoint.__table__).values(**values)
+        statement = statement.on_conflict_do_update(index_elements=['root_url'], set_=values)
+        with self.engine.begin() as connection:
+            connection.execute(statement)
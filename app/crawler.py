@@ -0,0 +1,212 @@
+# app/crawler.py
+import asyncio
+import time
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from app.metrics import CRAWLER_FETCHES, CRAWLER_RATE_LIMIT_WAIT_SECONDS
+
+DEFAULT_USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+)
+
+# Status codes worth retrying: rate limiting and transient server failures.
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class FetchResult(namedtuple('FetchResult', ['url', 'status', 'text', 'headers', 'source', 'error'])):
+    """
+    Outcome of a single fetch. 'headers' is case-insensitive for HTTP
+    responses. 'source' is 'http' or 'browser' depending on which path
+    produced the page; 'error' is set when every attempt failed.
+    """
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class TokenBucket:
+    """
+    Classic token bucket: refills at `rate` tokens per second up to `capacity`.
+    Waiters queue on a lock, so requests to one host go out in arrival order.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Takes one token, sleeping until it is available. Returns seconds waited."""
+        waited = 0.0
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+                waited += delay
+                await asyncio.sleep(delay)
+
+
+class HostRateLimiter:
+    """
+    Lazily creates one TokenBucket per host so politeness is enforced per
+    server, regardless of how many URLs for that host are in flight.
+    """
+
+    def __init__(self, rate, burst=1, overrides=None):
+        self.rate = rate
+        self.burst = burst
+        self.overrides = overrides or {}  # host -> (rate, burst)
+        self.buckets = {}
+
+    def bucket_for(self, url):
+        host = urlsplit(url).netloc.lower()
+        bucket = self.buckets.get(host)
+        if bucket is None:
+            rate, burst = self.overrides.get(host, (self.rate, self.burst))
+            bucket = self.buckets[host] = TokenBucket(rate, burst)
+        return bucket
+
+    async def acquire(self, url):
+        """Waits for a token for `url`'s host and records the wait. Returns seconds waited."""
+        waited = await self.bucket_for(url).acquire()
+        CRAWLER_RATE_LIMIT_WAIT_SECONDS.observe(waited, host=urlsplit(url).netloc.lower())
+        return waited
+
+
+class AsyncCrawler:
+    """
+    Concurrent page fetcher built on a pooled aiohttp session.
+
+    Every request first takes a token from its host's bucket and a slot from
+    the global in-flight semaphore. Transient failures are retried with
+    exponential backoff. If `needs_browser(result)` says a page could not be
+    served over plain HTTP (e.g. JavaScript-rendered or bot-walled), the URL is
+    handed to the optional synchronous `browser_fallback(url) -> html`, which
+    runs in a worker thread one page at a time.
+
+    Use as an async context manager so the connection pool is closed cleanly.
+    """
+
+    def __init__(self, rate=1.0, burst=1, max_in_flight=4, timeout=30, retries=2, backoff=1.0,
+                 user_agent=DEFAULT_USER_AGENT, browser_fallback=None, needs_browser=None,
+                 rate_overrides=None):
+        self.limiter = HostRateLimiter(rate, burst, rate_overrides)
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.user_agent = user_agent
+        self.browser_fallback = browser_fallback
+        self.needs_browser = needs_browser
+        self.session = None
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        self._browser_lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.max_in_flight, ttl_dns_cache=300)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers={'User-Agent': self.user_agent},
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.session.close()
+        self.session = None
+
+    async def _get(self, url, headers):
+        async with self._in_flight:
+            await self.limiter.acquire(url)
+            async with self.session.get(url, headers=headers) as response:
+                text = await response.text(errors='replace')
+                CRAWLER_FETCHES.inc(source='http', status=str(response.status))
+                return FetchResult(url, response.status, text, response.headers.copy(), 'http', None)
+
+    async def _render(self, url):
+        async with self._browser_lock:
+            await self.limiter.acquire(url)
+            text = await asyncio.to_thread(self.browser_fallback, url)
+        CRAWLER_FETCHES.inc(source='browser', status='200')
+        return FetchResult(url, 200, text, {}, 'browser', None)
+
+    async def fetch(self, url, headers=None):
+        """
+        Fetches one URL. Never raises for network/HTTP failures; inspect
+        `result.ok` / `result.error` instead.
+        """
+        last_error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(self.backoff * (2 ** (attempt - 1)))
+            try:
+                result = await self._get(url, headers)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                CRAWLER_FETCHES.inc(source='http', status='error')
+                last_error = e
+                continue
+            if result.status in RETRYABLE_STATUSES:
+                last_error = RuntimeError(f"HTTP {result.status}")
+                continue
+            if self.browser_fallback and self.needs_browser and self.needs_browser(result):
+                break
+            if result.status >= 400:
+                return result._replace(error=RuntimeError(f"HTTP {result.status}"))
+            return result
+
+        if self.browser_fallback:
+            try:
+                return await self._render(url)
+            except Exception as e:
+                last_error = e
+        return FetchResult(url, None, None, {}, 'http', last_error)
+
+    async def fetch_many(self, urls, headers=None):
+        """
+        Fetches `urls` concurrently and yields FetchResults as they complete
+        (not in input order). Concurrency is bounded by the in-flight limit and
+        the per-host rate limits.
+        """
+        tasks = [asyncio.ensure_future(self.fetch(url, headers)) for url in urls]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def fetch_ordered(self, urls, headers_for=None, window=None):
+        """
+        Fetches `urls` with up to `window` requests running ahead of the
+        consumer (default: the in-flight limit) and yields FetchResults in
+        input order. Stopping iteration early (wrap in contextlib.aclosing)
+        cancels whatever is still outstanding, so at most `window` - 1
+        fetches are wasted when a crawl terminates early.
+        """
+        urls = list(urls)
+        window = window or self.max_in_flight
+        pending = {}
+        try:
+            for index, url in enumerate(urls):
+                for ahead in range(index, min(index + window, len(urls))):
+                    if ahead not in pending:
+                        ahead_url = urls[ahead]
+                        headers = headers_for(ahead_url) if headers_for else None
+                        pending[ahead] = asyncio.ensure_future(self.fetch(ahead_url, headers))
+                yield await pending.pop(index)
+        finally:
+            for task in pending.values():
+                task.cancel()
@@ -1,56 +1,164 @@
 # app/database.py
-from sqlalchemy import create_engine, text
+from flask import g
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
 import os
 
 # Get database URL from environment variable
 DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///vertical_search.db')
 
-# Create a SQLAlchemy engine
-# connect_args={'check_same_thread': False} is necessary for SQLite in Flask
-# when multiple threads access the same connection, which can happen with default Flask setup.
-engine = create_engine(DATABASE_URL, connect_args={'check_same_thread': False})
+# Connection tuning, applied to every new SQLite connection. WAL lets the web
+# readers keep reading while the scraper commits; with WAL, synchronous=NORMAL
+# is still safe against corruption and only risks the last commit on power loss.
+# cache_size is in KiB when negative.
+SQLITE_PRAGMAS = {
+    'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
+    'cache_size': int(os.getenv('SQLITE_CACHE_SIZE', '-65536')),
+    'temp_store': os.getenv('SQLITE_TEMP_STORE', 'MEMORY'),
+    'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', '5000')),
+}
 
-# Create a configured "Session" class
+# Number of pooled read-only connections kept by each web worker.
+READER_POOL_SIZE = int(os.getenv('SQLITE_READER_POOL_SIZE', '8'))
+
+# Pragmas a read-only connection may not (or need not) set.
+WRITER_ONLY_PRAGMAS = {'journal_mode', 'synchronous'}
+
+def _set_pragmas(engine, pragmas, read_only=False):
+    """Registers a connect hook that applies `pragmas` to every new DBAPI connection."""
+    @event.listens_for(engine, 'connect')
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            if read_only and name in WRITER_ONLY_PRAGMAS:
+                continue
+            cursor.execute(f"PRAGMA {name} = {value}")
+        if read_only:
+            cursor.execute("PRAGMA query_only = 1")
+        cursor.close()
+
+def create_engines(url=DATABASE_URL, pragmas=SQLITE_PRAGMAS, reader_pool_size=READER_POOL_SIZE):
+    """
+    Builds the (writer, reader) engine pair for a database URL.
+
+    The writer holds a single connection, so every write in a process goes
+    through one dedicated connection and writers never contend with each
+    other for SQLite's write lock. The reader is a pool of read-only
+    connections (mode=ro plus query_only) for web traffic. Databases that
+    are not files (e.g. in-memory) use the writer for reads as well.
+    """
+    # connect_args={'check_same_thread': False} is necessary for SQLite in Flask
+    # when multiple threads access the same connection, which can happen with default Flask setup.
+    writer = create_engine(url, connect_args={'check_same_thread': False}, pool_size=1, max_overflow=0)
+    _set_pragmas(writer, pragmas)
+
+    database = make_url(url).database
+    if not url.startswith('sqlite') or not database or database == ':memory:':
+        return writer, writer
+
+    reader = create_engine(
+        f"sqlite:///file:{os.path.abspath(database)}?mode=ro&uri=true",
+        connect_args={'check_same_thread': False},
+        pool_size=reader_pool_size, max_overflow=reader_pool_size,
+    )
+    _set_pragmas(reader, pragmas, read_only=True)
+    return writer, reader
+
+# Create the SQLAlchemy engines: 'engine' is the writer used by the scraper
+# and other ingest scripts, 'reader_engine' serves web requests.
+engine, reader_engine = create_engines(DATABASE_URL)
+
+# Create configured "Session" classes for writing and for read-only access
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSession = sessionmaker(autocommit=False, autoflush=False, bind=reader_engine)
 
 # Base class for declarative models
 Base = declarative_base()
 
-def init_db():
+def _add_missing_columns(bind, tables):
+    """
+    create_all never alters existing tables, so add nullable columns that
+    were introduced since the database was created. Their values are filled
+    in by the step that owns them (e.g. backfill_name_keys).
+    """
+    with bind.begin() as connection:
+        for table in tables:
+            existing = {row[1] for row in connection.execute(text(f"PRAGMA table_info({table.name})"))}
+            for column in table.columns:
+                if column.name not in existing and column.nullable:
+                    column_type = column.type.compile(dialect=bind.dialect)
+                    connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+                    print(f"Added column {table.name}.{column.name}.")
+
+def init_db(bind=None):
     """
     Initializes the database by creating all tables defined in models
     and ensuring the FTS5 table is created as a virtual table.
+    Uses the application engine unless another engine is given via `bind`
+    (e.g. a scratch database for benchmarks).
     """
     import app.models # Import models to ensure Base knows about them
 
-    # Create standard tables if they don't exist
-    Base.metadata.create_all(bind=engine)
+    bind = bind if bind is not None else engine
+
+    # Create standard tables if they don't exist. The FTS table is left out:
+    # create_all would otherwise create it as a plain table, which MATCH
+    # queries cannot run against.
+    regular_tables = [table for table in Base.metadata.sorted_tables if table.name != 'publications_fts']
+    Base.metadata.create_all(bind=bind, tables=regular_tables)
+    _add_missing_columns(bind, regular_tables)
+    # create_all only builds indexes together with new tables, so add any
+    # index introduced since an existing database was created. Names are
+    # checked against sqlite_master because SQLAlchemy cannot reflect
+    # expression indexes, which makes checkfirst unreliable for them.
+    with bind.connect() as connection:
+        existing_indexes = {row[0] for row in connection.execute(text("SELECT name FROM sqlite_master WHERE type='index'"))}
+    for table in regular_tables:
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                index.create(bind=bind)
     print("Standard database tables created or already exist.")
 
     # Explicitly create the FTS5 virtual table if it doesn't exist
     # This is necessary because SQLAlchemy's declarative base doesn't
     # directly support CREATE VIRTUAL TABLE syntax via __table_args__.
-    with engine.connect() as connection:
-        # Check if the FTS table already exists
-        result = connection.execute(text("SELECT name FROM sqlite_master WHERE type='table' AND name='publications_fts';")).fetchone()
-        if result is None:
-            # If not, create the virtual FTS5 table
-            # The columns here must match the ones defined in PublicationFTS model
-            # that you want to be indexed for full-text search.
-            create_fts_table_sql = """
-            CREATE VIRTUAL TABLE publications_fts USING fts5(title, abstract);
-            """
-            connection.execute(text(create_fts_table_sql))
-            connection.commit() # Commit the DDL operation
-            print("FTS5 virtual table 'publications_fts' created.")
-        else:
-            print("FTS5 virtual table 'publications_fts' already exists.")
-
-def get_db():
-    """Dependency to get a database session."""
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+    # It is an external-content table over publications, kept in sync by
+    # triggers; tables from older versions are migrated (see app/fts.py).
+    from app.fts import ensure_fts
+    with bind.begin() as connection:
+        outcome = ensure_fts(connection)
+    print({
+        'created': "FTS5 virtual table 'publications_fts' created.",
+        'migrated': "FTS5 virtual table 'publications_fts' migrated to external content and rebuilt.",
+        'exists': "FTS5 virtual table 'publications_fts' already exists.",
+    }[outcome])
+
+    # Facet count tables are maintained by triggers (see app/facets.py).
+    from app.facets import ensure_facets
+    with bind.begin() as connection:
+        if ensure_facets(connection) == 'created':
+            print("Facet count triggers installed and counts rebuilt.")
+
+    # Trigram index for author autocomplete (see app/authors.py).
+    from app.authors import ensure_authors_fts
+    with bind.begin() as connection:
+        if ensure_authors_fts(connection) == 'created':
+            print("Author name index 'authors_fts' created.")
+
+def get_read_session():
+    """
+    Returns the read-only session for the current Flask app context, opening
+    it on first use. close_read_session() releases it at teardown.
+    """
+    if 'db_session' not in g:
+        g.db_session = ReadSession()
+    return g.db_session
+
+def close_read_session(exception=None):
+    """App-context teardown hook: returns the request's connection to the pool."""
+    db_session = g.pop('db_session', None)
+    if db_session is not None:
+        db_session.close()
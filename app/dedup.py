@@ -0,0 +1,408 @@
+# app/dedup.py
+import hashlib
+import random
+import re
+import zlib
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+from sqlalchemy import bindparam, text
+
+from app.authors import fold, name_key
+from app.cache import bump_index_generation
+
+# Near-duplicate detection for publications listed twice under different
+# links (e.g. by two units, or with a retyped title). Titles are compared as
+# sets of character shingles and abstracts as sets of word shingles;
+# MinHash signatures of those sets are split into LSH bands, and each band
+# is hashed into a bucket stored in publication_lsh_buckets. Publications
+# sharing any bucket are candidates, so a new publication is checked
+# against a handful of rows rather than the whole collection. Candidates
+# are then verified exactly (see is_near_duplicate) before a publication is
+# marked as a duplicate.
+
+SHINGLE_SIZE = 4 # Characters per title shingle
+ABSTRACT_SHINGLE_WORDS = 3
+NUM_PERMUTATIONS = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERMUTATIONS // BANDS
+# With 16 bands of 4 rows, titles with a shingle Jaccard similarity of 0.7
+# become candidates with probability 1 - (1 - 0.7**4)**16 = 0.988, while
+# pairs below 0.3 rarely do (0.12).
+# Abstracts only need to catch near-copies (SAME_ABSTRACT_THRESHOLD): with 8
+# bands of 8 rows, 0.9 gives 1 - (1 - 0.9**8)**8 = 0.989 and 0.5 only 0.03,
+# so the boilerplate sentences abstracts share don't flood the buckets.
+ABSTRACT_BANDS = 8
+TITLE_THRESHOLD = 0.7
+ABSTRACT_THRESHOLD = 0.5
+# Abstracts this similar make a duplicate even when the title was reworded.
+SAME_ABSTRACT_THRESHOLD = 0.9
+# Titles shorter than this many shingles ("Editorial", "Book review") are
+# too generic to tell apart and are never marked as duplicates.
+MIN_SHINGLES = 8
+# Abstracts shorter than this many shingles ("No abstract available") get
+# no buckets and can't make a duplicate on their own.
+MIN_ABSTRACT_SHINGLES = 20
+# Candidates verified per publication; the ones sharing the most buckets first.
+MAX_CANDIDATES = 100
+MAX_BUCKET_MEMBERS = 20
+
+# Universal hashing (a * x + b) mod p over 32-bit shingle hashes. p < 2**32
+# keeps a * x + b within uint64. The seed is fixed: stored buckets are only
+# comparable with buckets computed from the same permutations.
+MINHASH_PRIME = 4294967291
+MINHASH_SEED = 1
+_permutations = random.Random(MINHASH_SEED)
+MINHASH_A = np.array([_permutations.randrange(1, MINHASH_PRIME) for _ in range(NUM_PERMUTATIONS)], dtype=np.uint64)
+MINHASH_B = np.array([_permutations.randrange(0, MINHASH_PRIME) for _ in range(NUM_PERMUTATIONS)], dtype=np.uint64)
+
+NUMBER_PATTERN = re.compile(r'\d+')
+
+# What verification needs to know about one publication. 'author_keys' is
+# a frozenset of app.authors.name_key() values; 'canonical_id' is the id of
+# the cluster's canonical publication (its own id if it is canonical).
+DedupDoc = namedtuple('DedupDoc', ['id', 'title', 'year', 'abstract', 'author_keys', 'canonical_id'],
+                      defaults=[frozenset(), None])
+
+
+@lru_cache(maxsize=4096)
+def title_shingles(title):
+    """Character shingles of the folded title (case, diacritics and punctuation ignored)."""
+    folded = fold(title)
+    if len(folded) <= SHINGLE_SIZE:
+        return frozenset([folded] if folded else [])
+    return frozenset(folded[i:i + SHINGLE_SIZE] for i in range(len(folded) - SHINGLE_SIZE + 1))
+
+
+@lru_cache(maxsize=4096)
+def abstract_shingles(abstract):
+    words = fold(abstract).split()
+    return frozenset(' '.join(words[i:i + ABSTRACT_SHINGLE_WORDS])
+                     for i in range(max(1, len(words) - ABSTRACT_SHINGLE_WORDS + 1)))
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def minhash(shingles):
+    """MinHash signature (NUM_PERMUTATIONS uint32 values) of a non-empty shingle set."""
+    hashes = np.fromiter((zlib.crc32(shingle.encode('utf-8')) for shingle in shingles),
+                         dtype=np.uint64, count=len(shingles))
+    return ((MINHASH_A[:, None] * hashes[None, :] + MINHASH_B[:, None]) % MINHASH_PRIME).min(axis=1).astype(np.uint32)
+
+
+def band_buckets(signature, bands=BANDS, first_band=0):
+    """
+    One signed 64-bit bucket key per LSH band; the band number is part of
+    the key, so title and abstract bands (numbered from `first_band`) never
+    share a bucket.
+    """
+    buckets = []
+    rows_per_band = len(signature) // bands
+    for band in range(bands):
+        rows = signature[band * rows_per_band:(band + 1) * rows_per_band].tobytes()
+        digest = hashlib.blake2b(bytes([first_band + band]) + rows, digest_size=8).digest()
+        buckets.append(int.from_bytes(digest, 'big', signed=True))
+    return buckets
+
+
+def title_buckets(title):
+    """LSH buckets of a title, or [] for titles too short to deduplicate."""
+    shingles = title_shingles(title)
+    if len(shingles) < MIN_SHINGLES:
+        return []
+    return band_buckets(minhash(shingles))
+
+
+def abstract_buckets(abstract):
+    """LSH buckets of an abstract, or [] for a missing or too short one."""
+    if not abstract:
+        return []
+    shingles = abstract_shingles(abstract)
+    if len(shingles) < MIN_ABSTRACT_SHINGLES:
+        return []
+    return band_buckets(minhash(shingles), ABSTRACT_BANDS, first_band=BANDS)
+
+
+def doc_buckets(doc):
+    """All LSH buckets of a DedupDoc: its title's and, if it has one, its abstract's."""
+    return title_buckets(doc.title) + abstract_buckets(doc.abstract)
+
+
+def is_near_duplicate(a, b, threshold=TITLE_THRESHOLD):
+    """
+    Exact check of two candidates (DedupDocs). Besides similar titles (or,
+    for a reworded title, nearly identical abstracts), the publications
+    must not contradict each other: the same year and at least one shared
+    author when both are known, the same numbers in the title ('Part 1' vs
+    'Part 2', volumes, years) and similar abstracts when both have one.
+    """
+    if a.year is not None and b.year is not None and a.year != b.year:
+        return False
+    if a.author_keys and b.author_keys and a.author_keys.isdisjoint(b.author_keys):
+        return False
+    if NUMBER_PATTERN.findall(a.title) != NUMBER_PATTERN.findall(b.title):
+        return False
+    titles = title_shingles(a.title), title_shingles(b.title)
+    similar_titles = min(map(len, titles)) >= MIN_SHINGLES and jaccard(*titles) >= threshold
+    if a.abstract and b.abstract:
+        shingles_a, shingles_b = abstract_shingles(a.abstract), abstract_shingles(b.abstract)
+        similarity = jaccard(shingles_a, shingles_b)
+        if similar_titles:
+            return similarity >= ABSTRACT_THRESHOLD
+        return (min(len(shingles_a), len(shingles_b)) >= MIN_ABSTRACT_SHINGLES
+                and similarity >= SAME_ABSTRACT_THRESHOLD)
+    return similar_titles
+
+
+def record_author_keys(authors):
+    """name_key()s of a PublicationRecord's (name, link) author pairs."""
+    return frozenset(name_key(name) for name, _ in authors)
+
+
+# The newest MAX_BUCKET_MEMBERS of each bucket. Common title patterns fill
+# some buckets with unrelated publications; capping them keeps the lookup
+# cost flat as the collection grows, and a real duplicate shares several
+# buckets with its original, so it is still found through the others.
+BUCKET_LOOKUP_SQL = """
+SELECT b.bucket, b.publication_id, p.publication_year
+FROM (
+    SELECT bucket, publication_id,
+           row_number() OVER (PARTITION BY bucket ORDER BY publication_id DESC) AS position
+    FROM {table}
+    WHERE bucket IN :buckets
+) AS b
+JOIN publications p ON p.id = b.publication_id
+WHERE b.position <= :max_members
+"""
+
+CANDIDATES_SQL = text(
+    "SELECT id, title, publication_year, abstract, coalesce(canonical_id, id) FROM publications WHERE id IN :ids"
+).bindparams(bindparam('ids', expanding=True))
+
+CANDIDATE_AUTHORS_SQL = text("""
+SELECT x.publication_id, a.name_key
+FROM publication_authors_association x
+JOIN authors a ON a.id = x.author_id
+WHERE x.publication_id IN :ids
+""").bindparams(bindparam('ids', expanding=True))
+
+INSERT_BUCKETS_SQL = "INSERT OR IGNORE INTO {table} (bucket, publication_id) VALUES (:bucket, :publication_id)"
+
+SET_CANONICAL_SQL = text("UPDATE publications SET canonical_id = :canonical_id WHERE id = :id")
+
+# Points a whole cluster (its canonical publication and its duplicates) at
+# a new canonical publication, which itself becomes canonical.
+MERGE_CLUSTER_SQL = text(
+    "UPDATE publications SET canonical_id = nullif(:canonical_id, id) "
+    "WHERE id = :old_canonical_id OR canonical_id = :old_canonical_id"
+)
+
+BUCKETS_TABLE = 'publication_lsh_buckets'
+# deduplicate_all() rebuilds the buckets here and swaps them in at the end.
+REBUILD_BUCKETS_TABLE = 'publication_lsh_buckets_rebuild'
+
+
+class DuplicateDetector:
+    """
+    Assigns canonical_id to newly written publications. Call assign() in the
+    transaction that inserted them; it looks up their LSH buckets (one IN
+    query per `chunk_size` buckets), verifies the candidates, records the
+    new buckets and points each duplicate at its cluster's canonical
+    publication, which is the earliest one (lowest id). Buckets are read
+    from and written to `table`.
+    """
+
+    def __init__(self, threshold=TITLE_THRESHOLD, chunk_size=500, table=BUCKETS_TABLE):
+        self.threshold = threshold
+        self.chunk_size = chunk_size
+        self.bucket_lookup = text(BUCKET_LOOKUP_SQL.format(table=table)).bindparams(bindparam('buckets', expanding=True))
+        self.insert_buckets = text(INSERT_BUCKETS_SQL.format(table=table))
+
+    def _chunks(self, items):
+        items = list(items)
+        for start in range(0, len(items), self.chunk_size):
+            yield items[start:start + self.chunk_size]
+
+    def _bucket_members(self, connection, buckets):
+        """{bucket: [(publication_id, year), ...]} for the stored publications in `buckets`."""
+        members = {}
+        for chunk in self._chunks(buckets):
+            for bucket, publication_id, year in connection.execute(self.bucket_lookup, {'buckets': chunk, 'max_members': MAX_BUCKET_MEMBERS}):
+                members.setdefault(bucket, []).append((publication_id, year))
+        return members
+
+    def load_docs(self, connection, ids):
+        """DedupDocs of stored publications, by id."""
+        docs, author_keys = {}, {}
+        for chunk in self._chunks(ids):
+            for publication_id, key in connection.execute(CANDIDATE_AUTHORS_SQL, {'ids': chunk}):
+                author_keys.setdefault(publication_id, set()).add(key)
+            for publication_id, title, year, abstract, canonical_id in connection.execute(CANDIDATES_SQL, {'ids': chunk}):
+                docs[publication_id] = DedupDoc(publication_id, title, year, abstract,
+                                                frozenset(author_keys.get(publication_id, ())), canonical_id)
+        return docs
+
+    def assign(self, connection, docs, reset=False):
+        """
+        Checks `docs` (DedupDocs of publications already in the table, not
+        yet in publication_lsh_buckets) against the indexed publications and
+        against each other, in id order. Returns {id: canonical_id} for the
+        near-duplicates found. With `reset`, publications without a match
+        get their canonical_id cleared (used when re-deduplicating).
+        """
+        docs = sorted(docs, key=lambda doc: doc.id)
+        buckets = {doc.id: doc_buckets(doc) for doc in docs}
+        members = self._bucket_members(connection, {bucket for keys in buckets.values() for bucket in keys})
+        candidates = self._candidates(docs, buckets, members)
+        batch = {doc.id: doc for doc in docs}
+        stored = self.load_docs(connection, {other for others in candidates.values() for other in others} - set(batch))
+
+        canonical = {}
+        updates = []
+        for doc in docs:
+            roots = []
+            for other in candidates[doc.id]:
+                candidate = batch.get(other) or stored.get(other)
+                if candidate is None:
+                    continue
+                if is_near_duplicate(doc, candidate, self.threshold):
+                    # Batch members' stored canonical_id is not current yet.
+                    roots.append(canonical.get(other, other) if other in batch else candidate.canonical_id)
+            if roots:
+                canonical[doc.id] = min(roots)
+                updates.append({'id': doc.id, 'canonical_id': canonical[doc.id]})
+            elif reset:
+                updates.append({'id': doc.id, 'canonical_id': None})
+
+        self._insert_buckets(connection, buckets)
+        if updates:
+            connection.execute(SET_CANONICAL_SQL, updates)
+        return canonical
+
+    def _candidates(self, docs, buckets, members):
+        """
+        {id: candidate ids} per doc, the ones sharing the most buckets first;
+        later docs see earlier ones as candidates. Years are compared here
+        already: common title patterns fill some buckets, and most of their
+        members can be ruled out unloaded.
+        """
+        candidates = {}
+        for doc in docs:
+            counts = {}
+            for bucket in buckets[doc.id]:
+                for other, year in members.get(bucket, ()):
+                    if other != doc.id and (doc.year is None or year is None or year == doc.year):
+                        counts[other] = counts.get(other, 0) + 1
+            candidates[doc.id] = sorted(counts, key=lambda other: (-counts[other], other))[:MAX_CANDIDATES]
+            for bucket in buckets[doc.id]:
+                members.setdefault(bucket, []).append((doc.id, doc.year))
+        return candidates
+
+    def _insert_buckets(self, connection, buckets):
+        rows = [{'bucket': bucket, 'publication_id': doc_id} for doc_id, keys in buckets.items() for bucket in keys]
+        if rows:
+            connection.execute(self.insert_buckets, rows)
+
+    def recheck(self, connection, ids):
+        """
+        Re-checks stored publications whose abstract has just been written:
+        adds their abstract buckets and merges their cluster with the
+        cluster of any near-duplicate found, in either direction, so that
+        the earliest publication of the merged cluster is canonical.
+        Returns {old canonical id: new canonical id} for the clusters moved.
+        """
+        docs = list(self.load_docs(connection, ids).values())
+        buckets = {doc.id: doc_buckets(doc) for doc in docs}
+        members = self._bucket_members(connection, {bucket for keys in buckets.values() for bucket in keys})
+        candidates = self._candidates(docs, buckets, members)
+        others = self.load_docs(connection, {other for found in candidates.values() for other in found})
+
+        # Union-find over canonical ids; the smallest id of a group wins.
+        parent = {}
+
+        def root(node):
+            while parent.get(node, node) != node:
+                node = parent[node]
+            return node
+
+        for doc in docs:
+            for other in candidates[doc.id]:
+                candidate = others.get(other)
+                if candidate is not None and is_near_duplicate(doc, candidate, self.threshold):
+                    first, second = sorted((root(doc.canonical_id), root(candidate.canonical_id)))
+                    if first != second:
+                        parent[second] = first
+        moved = {node: root(node) for node in parent}
+        if moved:
+            connection.execute(MERGE_CLUSTER_SQL, [{'old_canonical_id': old, 'canonical_id': new}
+                                                   for old, new in moved.items()])
+        self._insert_buckets(connection, buckets)
+        return moved
+
+
+def deduplicate_all(engine, threshold=TITLE_THRESHOLD, batch_size=2000, dry_run=False, log=print):
+    """
+    Batch mode for databases ingested before deduplication, or after a
+    change of threshold: rebuilds publication_lsh_buckets and re-derives
+    every canonical_id, walking the publications in id order so the
+    earliest of each cluster stays canonical. Each batch is committed on
+    its own (bumping the index generation), so the ingest lock is never
+    held for long; `dry_run` runs everything in one transaction and rolls
+    it back.
+
+    The buckets are built in a staging table and swapped in at the end, so
+    ingests running meanwhile (or after a crash) keep checking against the
+    complete old set. Returns {duplicate id: canonical id}.
+    """
+    detector = DuplicateDetector(threshold, table=REBUILD_BUCKETS_TABLE)
+    duplicates = {}
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        connection.execute(text(f"DROP TABLE IF EXISTS {REBUILD_BUCKETS_TABLE}")) # Left by an interrupted run
+        connection.execute(text(
+            f"CREATE TABLE {REBUILD_BUCKETS_TABLE} (bucket INTEGER NOT NULL, publication_id INTEGER NOT NULL, "
+            f"PRIMARY KEY (bucket, publication_id)) WITHOUT ROWID"
+        ))
+        last_id = 0
+        examined = 0
+        while True:
+            ids = connection.execute(
+                text("SELECT id FROM publications WHERE id > :last_id ORDER BY id LIMIT :limit"),
+                {'last_id': last_id, 'limit': batch_size}
+            ).scalars().all()
+            if not ids:
+                break
+            duplicates.update(detector.assign(connection, detector.load_docs(connection, ids).values(), reset=True))
+            examined += len(ids)
+            last_id = ids[-1]
+            if not dry_run:
+                bump_index_generation(connection)
+                transaction.commit()
+                transaction = connection.begin()
+            log(f"  {examined} publications checked, {len(duplicates)} near-duplicates so far...")
+        if not dry_run:
+            # A fresh transaction, as a read one can't be upgraded once another writer committed.
+            transaction.commit()
+            transaction = connection.begin()
+        # Publications ingested after the walk ended were checked against the
+        # old buckets and indexed there; keep theirs.
+        connection.execute(text(
+            f"INSERT OR IGNORE INTO {REBUILD_BUCKETS_TABLE} (bucket, publication_id) "
+            f"SELECT bucket, publication_id FROM {BUCKETS_TABLE} WHERE publication_id > :last_id"
+        ), {'last_id': last_id})
+        connection.execute(text(f"DELETE FROM {BUCKETS_TABLE}"))
+        connection.execute(text(
+            f"INSERT INTO {BUCKETS_TABLE} (bucket, publication_id) "
+            f"SELECT bucket, publication_id FROM {REBUILD_BUCKETS_TABLE}"
+        ))
+        connection.execute(text(f"DROP TABLE {REBUILD_BUCKETS_TABLE}"))
+        if dry_run:
+            transaction.rollback()
+        else:
+            transaction.commit()
+    return duplicates
@@ -0,0 +1,295 @@
+# app/facets.py
+from collections import namedtuple
+
+from sqlalchemy import bindparam, text
+
+from app.query import match_expression
+from app.search import filter_conditions
+
+# Facet counts shown next to results: a year histogram (oldest first) and the
+# authors with the most matching publications.
+Facets = namedtuple('Facets', ['years', 'authors'])
+YearCount = namedtuple('YearCount', ['year', 'count'])
+AuthorCount = namedtuple('AuthorCount', ['id', 'name', 'count'])
+
+# facet_year_counts and facet_author_counts hold the counts for the whole
+# collection, and facet_author_year_counts the author counts per year.
+# Triggers keep them current for every writer, so the unfiltered and the
+# year-filtered facets are index reads instead of a GROUP BY over the join.
+# Unknown years are counted under 0. Rows that drop to zero are removed.
+FACET_TRIGGERS = {
+    'facet_years_ai': """
+    CREATE TRIGGER IF NOT EXISTS facet_years_ai AFTER INSERT ON publications BEGIN
+        INSERT INTO facet_year_counts (year, count) VALUES (coalesce(new.publication_year, 0), 1)
+            ON CONFLICT (year) DO UPDATE SET count = count + 1;
+    END
+    """,
+    'facet_years_ad': """
+    CREATE TRIGGER IF NOT EXISTS facet_years_ad AFTER DELETE ON publications BEGIN
+        UPDATE facet_year_counts SET count = count - 1 WHERE year = coalesce(old.publication_year, 0);
+        DELETE FROM facet_year_counts WHERE year = coalesce(old.publication_year, 0) AND count <= 0;
+    END
+    """,
+    'facet_years_au': """
+    CREATE TRIGGER IF NOT EXISTS facet_years_au AFTER UPDATE OF publication_year ON publications
+    WHEN coalesce(old.publication_year, 0) != coalesce(new.publication_year, 0) BEGIN
+        UPDATE facet_year_counts SET count = count - 1 WHERE year = coalesce(old.publication_year, 0);
+        DELETE FROM facet_year_counts WHERE year = coalesce(old.publication_year, 0) AND count <= 0;
+        INSERT INTO facet_year_counts (year, count) VALUES (coalesce(new.publication_year, 0), 1)
+            ON CONFLICT (year) DO UPDATE SET count = count + 1;
+    END
+    """,
+    'facet_authors_ai': """
+    CREATE TRIGGER IF NOT EXISTS facet_authors_ai AFTER INSERT ON publication_authors_association
+    WHEN new.author_id IS NOT NULL BEGIN
+        INSERT INTO facet_author_counts (author_id, count) VALUES (new.author_id, 1)
+            ON CONFLICT (author_id) DO UPDATE SET count = count + 1;
+    END
+    """,
+    'facet_authors_ad': """
+    CREATE TRIGGER IF NOT EXISTS facet_authors_ad AFTER DELETE ON publication_authors_association
+    WHEN old.author_id IS NOT NULL BEGIN
+        UPDATE facet_author_counts SET count = count - 1 WHERE author_id = old.author_id;
+        DELETE FROM facet_author_counts WHERE author_id = old.author_id AND count <= 0;
+    END
+    """,
+    'facet_authors_au': """
+    CREATE TRIGGER IF NOT EXISTS facet_authors_au AFTER UPDATE OF author_id ON publication_authors_association
+    WHEN old.author_id IS NOT new.author_id BEGIN
+        UPDATE facet_author_counts SET count = count - 1 WHERE author_id = old.author_id;
+        DELETE FROM facet_author_counts WHERE author_id = old.author_id AND count <= 0;
+        INSERT INTO facet_author_counts (author_id, count) SELECT new.author_id, 1 WHERE new.author_id IS NOT NULL
+            ON CONFLICT (author_id) DO UPDATE SET count = count + 1;
+    END
+    """,
+    'facet_author_years_ai': """
+    CREATE TRIGGER IF NOT EXISTS facet_author_years_ai AFTER INSERT ON publication_authors_association
+    WHEN new.author_id IS NOT NULL BEGIN
+        INSERT INTO facet_author_year_counts (author_id, year, count)
+            SELECT new.author_id, coalesce(publication_year, 0), 1 FROM publications WHERE id = new.publication_id
+            ON CONFLICT (author_id, year) DO UPDATE SET count = count + 1;
+    END
+    """,
+    'facet_author_years_ad': """
+    CREATE TRIGGER IF NOT EXISTS facet_author_years_ad AFTER DELETE ON publication_authors_association
+    WHEN old.author_id IS NOT NULL BEGIN
+        UPDATE facet_author_year_counts SET count = count - 1 WHERE author_id = old.author_id
+            AND year = (SELECT coalesce(publication_year, 0) FROM publications WHERE id = old.publication_id);
+        DELETE FROM facet_author_year_counts WHERE author_id = old.author_id AND count <= 0;
+    END
+    """,
+    'facet_author_years_au': """
+    CREATE TRIGGER IF NOT EXISTS facet_author_years_au AFTER UPDATE OF author_id, publication_id
+    ON publication_authors_association
+    WHEN old.author_id IS NOT new.author_id OR old.publication_id IS NOT new.publication_id BEGIN
+        UPDATE facet_author_year_counts SET count = count - 1 WHERE author_id = old.author_id
+            AND year = (SELECT coalesce(publication_year, 0) FROM publications WHERE id = old.publication_id);
+        DELETE FROM facet_author_year_counts WHERE author_id = old.author_id AND count <= 0;
+        INSERT INTO facet_author_year_counts (author_id, year, count)
+            SELECT new.author_id, coalesce(publication_year, 0), 1 FROM publications
+            WHERE id = new.publication_id AND new.author_id IS NOT NULL
+            ON CONFLICT (author_id, year) DO UPDATE SET count = count + 1;
+    END
+    """,
+    # A publication's authors move with it when its year changes, and leave
+    # the counts when it is deleted (its association rows can't find a year
+    # after that).
+    'facet_author_years_pu': """
+    CREATE TRIGGER IF NOT EXISTS facet_author_years_pu AFTER UPDATE OF publication_year ON publications
+    WHEN coalesce(old.publication_year, 0) != coalesce(new.publication_year, 0) BEGIN
+        UPDATE facet_author_year_counts SET count = count - (
+            SELECT count(*) FROM publication_authors_association x
+            WHERE x.publication_id = old.id AND x.author_id = facet_author_year_counts.author_id
+        ) WHERE year = coalesce(old.publication_year, 0)
+            AND author_id IN (SELECT author_id FROM publication_authors_association WHERE publication_id = old.id);
+        DELETE FROM facet_author_year_counts WHERE year = coalesce(old.publication_year, 0) AND count <= 0
+            AND author_id IN (SELECT author_id FROM publication_authors_association WHERE publication_id = old.id);
+        INSERT INTO facet_author_year_counts (author_id, year, count)
+            SELECT author_id, coalesce(new.publication_year, 0), count(*) FROM publication_authors_association
+            WHERE publication_id = new.id AND author_id IS NOT NULL GROUP BY author_id
+            ON CONFLICT (author_id, year) DO UPDATE SET count = count + excluded.count;
+    END
+    """,
+    'facet_author_years_pd': """
+    CREATE TRIGGER IF NOT EXISTS facet_author_years_pd AFTER DELETE ON publications BEGIN
+        UPDATE facet_author_year_counts SET count = count - (
+            SELECT count(*) FROM publication_authors_association x
+            WHERE x.publication_id = old.id AND x.author_id = facet_author_year_counts.author_id
+        ) WHERE year = coalesce(old.publication_year, 0)
+            AND author_id IN (SELECT author_id FROM publication_authors_association WHERE publication_id = old.id);
+        DELETE FROM facet_author_year_counts WHERE year = coalesce(old.publication_year, 0) AND count <= 0
+            AND author_id IN (SELECT author_id FROM publication_authors_association WHERE publication_id = old.id);
+    END
+    """,
+}
+
+
+def rebuild_facets(connection):
+    """Recounts the aggregate tables from scratch."""
+    connection.execute(text("DELETE FROM facet_year_counts"))
+    connection.execute(text(
+        "INSERT INTO facet_year_counts (year, count) "
+        "SELECT coalesce(publication_year, 0), count(*) FROM publications GROUP BY 1"
+    ))
+    connection.execute(text("DELETE FROM facet_author_counts"))
+    connection.execute(text(
+        "INSERT INTO facet_author_counts (author_id, count) "
+        "SELECT author_id, count(*) FROM publication_authors_association "
+        "WHERE author_id IS NOT NULL GROUP BY author_id"
+    ))
+    connection.execute(text("DELETE FROM facet_author_year_counts"))
+    connection.execute(text(
+        "INSERT INTO facet_author_year_counts (author_id, year, count) "
+        "SELECT x.author_id, coalesce(p.publication_year, 0), count(*) FROM publication_authors_association x "
+        "JOIN publications p ON p.id = x.publication_id WHERE x.author_id IS NOT NULL GROUP BY 1, 2"
+    ))
+
+
+def ensure_facets(connection):
+    """
+    Called by init_db(): installs the triggers, and recounts when any of them
+    was missing (a new database, or one written by an older version whose
+    counts can't be trusted). Returns 'created' or 'exists'.
+    """
+    existing = {row[0] for row in connection.execute(text("SELECT name FROM sqlite_master WHERE type='trigger'"))}
+    for trigger in FACET_TRIGGERS.values():
+        connection.execute(text(trigger))
+    if set(FACET_TRIGGERS).issubset(existing):
+        return 'exists'
+    rebuild_facets(connection)
+    return 'created'
+
+
+# Authors visited per round by _authors_from_year_totals().
+FACET_SCAN_BATCH = 100
+
+
+# Match set of a query (or of the whole collection), exposing the columns
+# filter_conditions() refers to.
+MATCH_SQL = """
+SELECT id, year_key FROM (
+    SELECT p.id, coalesce(p.publication_year, 0) AS year_key
+    FROM publications_fts
+    JOIN publications p ON p.id = publications_fts.rowid
+    WHERE publications_fts MATCH :query
+) AS hits
+{where}
+"""
+
+ALL_SQL = """
+SELECT id, year_key FROM (
+    SELECT p.id, coalesce(p.publication_year, 0) AS year_key FROM publications p
+) AS hits
+{where}
+"""
+
+
+def _years_from_totals(connection, filters):
+    conditions, params = ["year > 0"], {}
+    if filters is not None and filters.year_from is not None:
+        conditions.append("year >= :year_from")
+        params['year_from'] = filters.year_from
+    if filters is not None and filters.year_to is not None:
+        conditions.append("year <= :year_to")
+        params['year_to'] = filters.year_to
+    rows = connection.execute(text(
+        f"SELECT year, count FROM facet_year_counts WHERE {' AND '.join(conditions)} ORDER BY year"
+    ), params)
+    return [YearCount(*row) for row in rows]
+
+
+def _authors_from_totals(connection, limit):
+    # Walks the count index backwards, so only `limit` rows are read.
+    rows = connection.execute(text(
+        "SELECT a.id, a.name, f.count FROM facet_author_counts f JOIN authors a ON a.id = f.author_id "
+        "ORDER BY f.count DESC, f.author_id DESC LIMIT :limit"
+    ), {'limit': limit})
+    return [AuthorCount(*row) for row in rows]
+
+
+def _authors_from_year_totals(connection, filters, limit):
+    """
+    Top authors within a year range. An author's count in the range can't
+    exceed their total, so authors are visited in facet_author_counts order
+    and their per-year rows summed a batch at a time, stopping once the
+    `limit`-th best range count beats every total left. Bounds match the
+    year_key conditions of filter_conditions().
+    """
+    conditions, params = ["author_id IN :ids"], {}
+    if filters.year_from is not None:
+        conditions.append("year >= :year_from")
+        params['year_from'] = filters.year_from
+    if filters.year_to is not None:
+        conditions.append("year <= :year_to")
+        params['year_to'] = filters.year_to
+    sums = text(
+        f"SELECT author_id, sum(count) FROM facet_author_year_counts WHERE {' AND '.join(conditions)} "
+        f"GROUP BY author_id"
+    ).bindparams(bindparam('ids', expanding=True))
+    walk = text(
+        "SELECT author_id, count FROM facet_author_counts WHERE (count, author_id) < (:count, :author_id) "
+        "ORDER BY count DESC, author_id DESC LIMIT :batch"
+    )
+    found, key = [], (float('inf'), 0)
+    while True:
+        batch = connection.execute(walk, {'count': key[0], 'author_id': key[1],
+                                          'batch': FACET_SCAN_BATCH}).fetchall()
+        if not batch:
+            break
+        found.extend((n, author_id) for author_id, n in connection.execute(
+            sums, dict(params, ids=[author_id for author_id, _ in batch])))
+        found = sorted(found, reverse=True)[:limit]
+        key = (batch[-1][1], batch[-1][0])
+        if len(batch) < FACET_SCAN_BATCH or (len(found) == limit and found[-1][0] > key[0]):
+            break
+    names = author_names(connection, [author_id for _, author_id in found])
+    return [AuthorCount(author_id, names[author_id], n) for n, author_id in found]
+
+
+def facet_counts(connection, query=None, filters=None, author_limit=10):
+    """
+    Returns the Facets for a search. Without a query or author filter the
+    counts come straight from the aggregate tables (summed over the year
+    range, if any). Otherwise they are counted over the query's match set
+    only, which the FTS index and the association indexes keep proportional
+    to the number of matches rather than to the size of the collection.
+    """
+    author_ids = filters.author_ids if filters is not None else ()
+    has_year_range = filters is not None and (filters.year_from is not None or filters.year_to is not None)
+    if not query and not author_ids:
+        years = _years_from_totals(connection, filters)
+        if not has_year_range:
+            return Facets(years, _authors_from_totals(connection, author_limit))
+        return Facets(years, _authors_from_year_totals(connection, filters, author_limit))
+
+    conditions, params = filter_conditions(filters)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    matches = (MATCH_SQL if query else ALL_SQL).format(where=where)
+    if query:
+        params['query'] = match_expression(query)
+        if params['query'] is None:
+            return Facets([], [])
+
+    rows = connection.execute(text(
+        f"SELECT year_key, count(*) FROM ({matches}) WHERE year_key > 0 GROUP BY year_key ORDER BY year_key"
+    ), params)
+    years = [YearCount(*row) for row in rows]
+    rows = connection.execute(text(
+        f"SELECT a.id, a.name, count(*) AS n FROM ({matches}) AS m "
+        f"JOIN publication_authors_association x ON x.publication_id = m.id "
+        f"JOIN authors a ON a.id = x.author_id "
+        f"GROUP BY a.id ORDER BY n DESC, a.id DESC LIMIT :limit"
+    ), dict(params, limit=author_limit))
+    return Facets(years, [AuthorCount(*row) for row in rows])
+
+
+AUTHOR_NAMES_SQL = text(
+    "SELECT id, name FROM authors WHERE id IN :ids"
+).bindparams(bindparam('ids', expanding=True))
+
+
+def author_names(connection, author_ids):
+    """{id: name} for the given author ids (e.g. to label active filters)."""
+    if not author_ids:
+        return {}
+    return dict(connection.execute(AUTHOR_NAMES_SQL, {'ids': list(author_ids)}).fetchall())
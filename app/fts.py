@@ -0,0 +1,123 @@
+# app/fts.py
+import os
+
+from sqlalchemy import text
+
+from app.cache import bump_index_generation
+
+# Tokenizer and prefix-index settings for publications_fts. 'porter unicode61'
+# stems English words; 'unicode61' alone matches exact word forms. Each prefix
+# length gets its own index, so 'econ*' is a direct lookup instead of a
+# vocabulary scan. Changing either setting requires `manage_fts.py migrate`.
+FTS_TOKENIZER = os.getenv('FTS_TOKENIZER', 'porter unicode61 remove_diacritics 2')
+FTS_PREFIX = os.getenv('FTS_PREFIX', '2 3 4')
+
+# External-content table: the index stores only tokens and reads column
+# values from publications, so the text is no longer kept twice.
+CREATE_FTS_SQL = """
+CREATE VIRTUAL TABLE publications_fts USING fts5(
+    title, abstract,
+    content='publications', content_rowid='id',
+    tokenize='{tokenizer}', prefix='{prefix}'
+)
+"""
+
+# The triggers keep the index in sync for every writer, not only the scraper.
+# External-content deletes must pass the old values exactly as indexed.
+FTS_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS publications_fts_ai AFTER INSERT ON publications BEGIN
+        INSERT INTO publications_fts (rowid, title, abstract) VALUES (new.id, new.title, new.abstract);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS publications_fts_ad AFTER DELETE ON publications BEGIN
+        INSERT INTO publications_fts (publications_fts, rowid, title, abstract)
+        VALUES ('delete', old.id, old.title, old.abstract);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS publications_fts_au AFTER UPDATE OF title, abstract ON publications BEGIN
+        INSERT INTO publications_fts (publications_fts, rowid, title, abstract)
+        VALUES ('delete', old.id, old.title, old.abstract);
+        INSERT INTO publications_fts (rowid, title, abstract) VALUES (new.id, new.title, new.abstract);
+    END
+    """,
+]
+
+
+# Read-only view of the index vocabulary: one row per indexed term (after
+# stemming) with the number of publications containing it. Used by the
+# spelling suggestions in app/spelling.py.
+CREATE_VOCAB_SQL = "CREATE VIRTUAL TABLE IF NOT EXISTS publications_vocab USING fts5vocab(publications_fts, 'row')"
+
+
+def fts_table_sql(connection):
+    """The CREATE statement of the current publications_fts, or None if it doesn't exist."""
+    return connection.execute(
+        text("SELECT sql FROM sqlite_master WHERE type='table' AND name='publications_fts'")
+    ).scalar()
+
+
+def is_external_content(create_sql):
+    return create_sql is not None and "content='publications'" in create_sql.replace('"', "'")
+
+
+def create_fts(connection, tokenizer=FTS_TOKENIZER, prefix=FTS_PREFIX):
+    """Creates the external-content table and its triggers (the table must not exist)."""
+    connection.execute(text(CREATE_FTS_SQL.format(tokenizer=tokenizer, prefix=prefix)))
+    for trigger in FTS_TRIGGERS:
+        connection.execute(text(trigger))
+    connection.execute(text(CREATE_VOCAB_SQL))
+
+
+def rebuild_fts(connection):
+    """Re-indexes every row of publications from scratch."""
+    connection.execute(text("INSERT INTO publications_fts (publications_fts) VALUES ('rebuild')"))
+
+
+def optimize_fts(connection):
+    """Merges all index segments into one; worth running after a large ingest."""
+    connection.execute(text("INSERT INTO publications_fts (publications_fts) VALUES ('optimize')"))
+
+
+def integrity_check_fts(connection):
+    """
+    Verifies the index and that it matches the content of publications.
+    Raises sqlalchemy.exc.DatabaseError (SQLITE_CORRUPT_VTAB) on mismatch.
+    """
+    connection.execute(text("INSERT INTO publications_fts (publications_fts, rank) VALUES ('integrity-check', 1)"))
+
+
+def migrate_fts(connection, tokenizer=FTS_TOKENIZER, prefix=FTS_PREFIX):
+    """
+    Replaces whatever publications_fts currently is (a standalone FTS5 table,
+    a plain table from old versions, or an external-content table with other
+    settings) by an external-content table with the given settings, then
+    rebuilds it from publications.
+    """
+    for trigger in ('publications_fts_ai', 'publications_fts_ad', 'publications_fts_au'):
+        connection.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+    connection.execute(text("DROP TABLE IF EXISTS publications_fts"))
+    create_fts(connection, tokenizer, prefix)
+    rebuild_fts(connection)
+    bump_index_generation(connection) # Tokenization changed, so cached results may be wrong
+
+
+def ensure_fts(connection):
+    """
+    Called by init_db(): creates the index for a new database and migrates
+    one built by an older version. Returns what was done, for logging.
+    """
+    create_sql = fts_table_sql(connection)
+    if create_sql is None:
+        create_fts(connection)
+        rebuild_fts(connection) # Picks up rows if publications already has data
+        return 'created'
+    if not is_external_content(create_sql):
+        migrate_fts(connection)
+        return 'migrated'
+    for trigger in FTS_TRIGGERS:
+        connection.execute(text(trigger))
+    connection.execute(text(CREATE_VOCAB_SQL))
+    return 'exists'
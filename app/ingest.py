@@ -0,0 +1,247 @@
+# app/ingest.py
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.dialects.sqlite import insert
+
+from app.models import Publication, Author, PublicationSource, publication_authors_association
+from app.cache import bump_index_generation
+from app.dedup import DedupDoc, DuplicateDetector, record_author_keys
+from app.metrics import INGEST_NEAR_DUPLICATES
+
+# One parsed listing entry. 'authors' is a tuple of (name, author_link) pairs
+# in the order they appear on the page.
+PublicationRecord = namedtuple(
+    'PublicationRecord',
+    ['title', 'publication_link', 'publication_year', 'abstract', 'authors']
+)
+
+# Keeps IN (...) lists comfortably below SQLite's bound-parameter limit.
+IN_CHUNK_SIZE = 500
+
+
+def _chunks(items, size=IN_CHUNK_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def ingest_records_row_by_row(db_session, records):
+    """
+    Original ORM ingest path: one lookup query per author and per publication,
+    with a flush after every insert; the FTS index is updated by triggers.
+    Kept as the reference implementation and as the "before" side of the
+    ingest benchmark.
+    Returns (added_count, skipped_count).
+    """
+    added_count = 0
+    skipped_count = 0
+
+    for record in records:
+        current_authors = []
+        for author_name, author_link in record.authors:
+            author_obj = db_session.query(Author).filter_by(name=author_name).first()
+            if not author_obj and author_link:
+                # Same profile listed under another spelling, as BulkIngester resolves it.
+                author_obj = db_session.query(Author).filter_by(author_link=author_link).first()
+            if not author_obj:
+                author_obj = Author(name=author_name, author_link=author_link)
+                db_session.add(author_obj)
+                db_session.flush()
+            current_authors.append(author_obj)
+
+        existing_publication = db_session.query(Publication).filter_by(publication_link=record.publication_link).first()
+
+        if existing_publication:
+            for author_obj in current_authors:
+                if author_obj not in existing_publication.authors:
+                    existing_publication.authors.append(author_obj)
+            skipped_count += 1
+        else:
+            publication = Publication(
+                title=record.title,
+                publication_link=record.publication_link,
+                publication_year=record.publication_year,
+                abstract=record.abstract
+            )
+            publication.authors.extend(current_authors)
+            db_session.add(publication)
+            db_session.flush()
+
+            added_count += 1
+
+    if records:
+        bump_index_generation(db_session) # Committed together with the caller's commit
+    return added_count, skipped_count
+
+
+class BulkIngester:
+    """
+    Batched ingest path. Each call to ingest() writes one batch of
+    PublicationRecords in a single transaction:
+
+    1. authors are resolved against an in-memory name -> id table (loaded once
+       per ingester); unknown names are inserted with one executemany and
+       resolved with one IN query,
+    2. existing publication_links are resolved with one IN query,
+    3. new publications and all missing association rows are written with
+       executemany / INSERT ... ON CONFLICT DO NOTHING (the FTS index is
+       updated by triggers),
+    4. new publications are checked for near-duplicates (app/dedup.py) and
+       duplicates get their canonical_id, unless `dedup` is False.
+
+    The ingester is not thread-safe; use one per writer.
+    """
+
+    def __init__(self, engine, dedup=True):
+        self.engine = engine
+        self.author_ids = None
+        self.detector = DuplicateDetector() if dedup else None
+
+    def _load_authors(self, connection):
+        self.author_ids = dict(connection.execute(text("SELECT name, id FROM authors")).fetchall())
+
+    def _resolve_authors(self, connection, records):
+        """
+        Inserts the batch's unknown authors and returns their {name: id}. The
+        caller merges it into author_ids once the transaction has committed;
+        ids from a rolled-back batch can be handed out again by SQLite.
+        """
+        if self.author_ids is None:
+            self._load_authors(connection)
+
+        new_authors = {}
+        for record in records:
+            for name, link in record.authors:
+                if name not in self.author_ids and name not in new_authors:
+                    new_authors[name] = link
+        resolved = {}
+        if not new_authors:
+            return resolved
+
+        connection.execute(
+            insert(Author.__table__).on_conflict_do_nothing(),
+            [{'name': name, 'author_link': link} for name, link in new_authors.items()]
+        )
+        lookup = text("SELECT name, id FROM authors WHERE name IN :names").bindparams(bindparam('names', expanding=True))
+        for chunk in _chunks(new_authors):
+            resolved.update(connection.execute(lookup, {'names': chunk}).fetchall())
+
+        # A name can fail to insert because its author_link already belongs to
+        # an author stored under a different spelling; map it to that author.
+        unresolved = {new_authors[name]: name for name in new_authors if name not in resolved and new_authors[name]}
+        if unresolved:
+            lookup = text("SELECT author_link, id FROM authors WHERE author_link IN :links").bindparams(bindparam('links', expanding=True))
+            for chunk in _chunks(unresolved):
+                for link, author_id in connection.execute(lookup, {'links': chunk}).fetchall():
+                    resolved[unresolved[link]] = author_id
+        return resolved
+
+    def _existing_links(self, connection, links):
+        lookup = text("SELECT publication_link, id FROM publications WHERE publication_link IN :links").bindparams(bindparam('links', expanding=True))
+        found = {}
+        for chunk in _chunks(links):
+            found.update(connection.execute(lookup, {'links': chunk}).fetchall())
+        return found
+
+    def _existing_pairs(self, connection, publication_ids):
+        lookup = text(
+            "SELECT publication_id, author_id FROM publication_authors_association WHERE publication_id IN :ids"
+        ).bindparams(bindparam('ids', expanding=True))
+        pairs = set()
+        for chunk in _chunks(publication_ids):
+            pairs.update(tuple(row) for row in connection.execute(lookup, {'ids': chunk}).fetchall())
+        return pairs
+
+    def known_to_source(self, links, source):
+        """The subset of `links` already recorded as listed by `source`."""
+        lookup = text(
+            "SELECT p.publication_link FROM publication_sources s JOIN publications p ON p.id = s.publication_id "
+            "WHERE s.source = :source AND p.publication_link IN :links"
+        ).bindparams(bindparam('links', expanding=True))
+        known = set()
+        with self.engine.connect() as connection:
+            for chunk in _chunks(set(links)):
+                known.update(row[0] for row in connection.execute(lookup, {'source': source, 'links': chunk}))
+        return known
+
+    def _record_source(self, connection, publication_ids, source):
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        statement = insert(PublicationSource.__table__)
+        statement = statement.on_conflict_do_update(
+            index_elements=['publication_id', 'source'], set_={'last_seen': statement.excluded.last_seen}
+        )
+        connection.execute(statement, [
+            {'publication_id': publication_id, 'source': source, 'first_seen': now, 'last_seen': now}
+            for publication_id in publication_ids
+        ])
+
+    def _mark_duplicates(self, connection, by_link, new_links, link_ids):
+        docs = []
+        for link in new_links:
+            record = by_link[link][0]
+            authors = [author for link_record in by_link[link] for author in link_record.authors]
+            docs.append(DedupDoc(link_ids[link], record.title, record.publication_year, record.abstract,
+                                 record_author_keys(authors)))
+        duplicates = self.detector.assign(connection, docs)
+        INGEST_NEAR_DUPLICATES.inc(len(duplicates))
+
+    def ingest(self, records, source=None):
+        """
+        Writes a batch of PublicationRecords. Records repeating a link within
+        the batch are merged. With a `source` name, every publication in the
+        batch (new or already stored) is recorded in publication_sources.
+        Returns (added_count, skipped_count), counted per input record like
+        ingest_records_row_by_row.
+        """
+        records = list(records)
+        if not records:
+            return 0, 0
+
+        by_link = {}
+        for record in records:
+            by_link.setdefault(record.publication_link, []).append(record)
+
+        with self.engine.begin() as connection:
+            resolved = self._resolve_authors(connection, records)
+            existing = self._existing_links(connection, by_link)
+
+            new_links = [link for link in by_link if link not in existing]
+            if new_links:
+                connection.execute(
+                    insert(Publication.__table__).on_conflict_do_nothing(),
+                    [{
+                        'title': by_link[link][0].title,
+                        'publication_link': link,
+                        'publication_year': by_link[link][0].publication_year,
+                        'abstract': by_link[link][0].abstract,
+                    } for link in new_links]
+                )
+                inserted = self._existing_links(connection, new_links)
+                link_ids = {**existing, **inserted}
+            else:
+                link_ids = existing
+
+            # Only publications that already existed can have association rows.
+            pairs = self._existing_pairs(connection, existing.values()) if existing else set()
+            new_pairs = []
+            for link, link_records in by_link.items():
+                publication_id = link_ids[link]
+                for record in link_records:
+                    for name, _ in record.authors:
+                        author_id = resolved.get(name, self.author_ids.get(name))
+                        if author_id is not None and (publication_id, author_id) not in pairs:
+                            pairs.add((publication_id, author_id))
+                            new_pairs.append({'publication_id': publication_id, 'author_id': author_id})
+            if new_pairs:
+                connection.execute(publication_authors_association.insert(), new_pairs)
+            if new_links and self.detector is not None:
+                self._mark_duplicates(connection, by_link, new_links, link_ids)
+            if source is not None:
+                self._record_source(connection, set(link_ids.values()), source)
+            if new_links or new_pairs:
+                bump_index_generation(connection)
+        self.author_ids.update(resolved)
+
+        return len(new_links), len(records) - len(new_links)
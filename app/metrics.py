@@ -0,0 +1,399 @@
+# app/metrics.py
+import logging
+import os
+import threading
+import time
+
+from flask import g, has_request_context, request, template_rendered, before_render_template
+from sqlalchemy import event
+
+# Histogram buckets in seconds: whole requests, single SQL statements, and
+# statements issued per request (a plain count).
+REQUEST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+PAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+WAIT_BUCKETS = (0.0, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Statements slower than this (in milliseconds) are logged together with
+# their EXPLAIN QUERY PLAN. Unset or 0 turns the slow-query log off.
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '0') or 0)
+
+slow_query_log = logging.getLogger('app.slow_queries')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    One metric family. Samples are keyed by their label values, which are
+    passed as keyword arguments: `REQUESTS.inc(endpoint='main.index')`.
+    """
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} expects labels {self.labels}, got {tuple(labels)}")
+        return tuple(labels[name] for name in self.labels)
+
+    def samples(self):
+        """(suffix, label values, extra labels, value) tuples for the text format."""
+        with self._lock:
+            return [('', key, (), value) for key, value in sorted(self._values.items())]
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labels, key, extra)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def total(self):
+        """Sum over every label combination."""
+        with self._lock:
+            return sum(self._values.values())
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    """Cumulative-bucket histogram with _sum and _count, as Prometheus expects."""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=REQUEST_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][index] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def value(self, **labels):
+        """(count, sum) of the observations with these labels."""
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return (state[2], state[1]) if state else (0, 0.0)
+
+    def totals(self):
+        """(count, sum) over every label combination."""
+        with self._lock:
+            return (sum(state[2] for state in self._values.values()),
+                    sum(state[1] for state in self._values.values()))
+
+    def samples(self):
+        with self._lock:
+            snapshot = [(key, list(state[0]), state[1], state[2]) for key, state in sorted(self._values.items())]
+        samples = []
+        for key, bucket_counts, total, count in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                samples.append(('_bucket', key, (('le', _format_value(float(bound))),), cumulative))
+            samples.append(('_bucket', key, (('le', '+Inf'),), count))
+            samples.append(('_sum', key, (), total))
+            samples.append(('_count', key, (), count))
+        return samples
+
+
+class MetricsRegistry:
+    """Holds metric families and renders them in the Prometheus text format."""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def _register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self._register(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=()):
+        return self._register(Gauge(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=REQUEST_BUCKETS):
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """
+        Writes the current values to `path` (atomically, via a temporary
+        file), e.g. for node_exporter's textfile collector after a scraper run.
+        """
+        temporary = f"{path}.tmp"
+        with open(temporary, 'w') as handle:
+            handle.write(self.render())
+        os.replace(temporary, path)
+
+
+REGISTRY = MetricsRegistry()
+
+# Web requests
+HTTP_REQUESTS = REGISTRY.counter(
+    'http_requests_total', "Requests handled, by endpoint, method and status.", ('endpoint', 'method', 'status'))
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    'http_request_duration_seconds', "Time from routing to the response object, by endpoint.", ('endpoint',))
+HTTP_PHASE_SECONDS = REGISTRY.histogram(
+    'http_request_phase_seconds',
+    "Request time split into SQL execution (db), template rendering (render) and everything "
+    "else in the view, mostly fetching rows and building result objects (hydrate).",
+    ('endpoint', 'phase'))
+HTTP_REQUEST_STATEMENTS = REGISTRY.histogram(
+    'http_request_sql_statements', "SQL statements executed per request.", ('endpoint',), COUNT_BUCKETS)
+
+SEARCH_SPELLING = REGISTRY.counter(
+    'search_spelling_suggestions_total',
+    "Spelling suggestion lookups for searches without results, by outcome (suggested, none, over_budget).",
+    ('outcome',))
+SEARCH_SNAPSHOT_SWAPS = REGISTRY.counter(
+    'search_snapshot_swaps_total',
+    "Switches to a newly published search snapshot (app/snapshot.py), by outcome (swapped, failed).", ('outcome',))
+SEARCH_SNAPSHOT_GENERATION = REGISTRY.gauge(
+    'search_snapshot_generation', "Index generation of the search snapshot this worker serves.")
+
+# SQL, for every instrumented engine (web and scraper alike)
+SQL_STATEMENTS = REGISTRY.counter(
+    'sql_statements_total', "SQL statements executed, by engine and statement type.", ('engine', 'statement'))
+SQL_STATEMENT_SECONDS = REGISTRY.histogram(
+    'sql_statement_duration_seconds', "Cursor execute time, by engine and statement type.",
+    ('engine', 'statement'), SQL_BUCKETS)
+SQL_SLOW_STATEMENTS = REGISTRY.counter(
+    'sql_slow_statements_total', "Statements over the SLOW_QUERY_MS threshold.", ('engine', 'statement'))
+
+# Crawler and scraper
+CRAWLER_FETCHES = REGISTRY.counter(
+    'crawler_fetches_total', "Completed fetch attempts, by source ('http'/'browser') and status.",
+    ('source', 'status'))
+CRAWLER_RATE_LIMIT_WAIT_SECONDS = REGISTRY.histogram(
+    'crawler_rate_limit_wait_seconds', "Time requests spent waiting for their host's token bucket.",
+    ('host',), WAIT_BUCKETS)
+SCRAPER_PAGES = REGISTRY.counter(
+    'scraper_pages_total',
+    "Listing pages handled, by crawl source and outcome (ingested, unchanged, not_modified, empty, failed).",
+    ('source', 'outcome'))
+SCRAPER_PARSE_SECONDS = REGISTRY.histogram(
+    'scraper_parse_seconds', "Time to parse one listing page into records.", (), PAGE_BUCKETS)
+SCRAPER_INGEST_SECONDS = REGISTRY.histogram(
+    'scraper_ingest_seconds', "Time to write one listing page's records.", (), PAGE_BUCKETS)
+SCRAPER_PUBLICATIONS = REGISTRY.counter(
+    'scraper_publications_total',
+    "Publications seen on listing pages, by crawl source and outcome (added, skipped).",
+    ('source', 'outcome'))
+SCRAPER_PAGES_PER_SECOND = REGISTRY.gauge(
+    'scraper_pages_per_second', "Listing pages handled per second over the last run.")
+
+# Ingest (app/ingest.py)
+INGEST_NEAR_DUPLICATES = REGISTRY.counter(
+    'ingest_near_duplicates_total', "New publications marked as near-duplicates of a stored one (app/dedup.py).")
+
+# Staged ingest pipeline (app/pipeline.py)
+PIPELINE_ITEMS = REGISTRY.counter(
+    'pipeline_stage_items_total', "Items that left each ingest pipeline stage, by stage and outcome.",
+    ('stage', 'outcome'))
+PIPELINE_BUSY_SECONDS = REGISTRY.counter(
+    'pipeline_stage_busy_seconds_total', "Time each ingest pipeline stage spent working (summed over workers).",
+    ('stage',))
+PIPELINE_QUEUE_HIGH_WATER = REGISTRY.gauge(
+    'pipeline_queue_high_water', "Largest number of items seen waiting in each pipeline queue.", ('queue',))
+
+
+class RequestTimings:
+    """Per-request accumulator, kept on flask.g while a request is handled."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_seconds = 0.0
+        self.statements = 0
+        self.render_seconds = 0.0
+        self.render_started = None
+
+
+def _current_timings():
+    return g.get('request_timings') if has_request_context() else None
+
+
+def statement_type(statement):
+    """First keyword of a statement (SELECT, INSERT, ...), used as a label."""
+    words = statement.lstrip().split(None, 1)
+    return words[0].upper() if words else 'EMPTY'
+
+
+def explain_query_plan(dbapi_cursor, statement, parameters):
+    """
+    EXPLAIN QUERY PLAN for a statement as an indented tree, run on the
+    statement's own DBAPI connection. Returns None if SQLite refuses.
+    """
+    try:
+        rows = dbapi_cursor.connection.execute(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+    except Exception:
+        return None
+    depth = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append(f"{'  ' * depth[node_id]}{detail}")
+    return '\n'.join(lines)
+
+
+class EngineInstrumentation:
+    """
+    Cursor-level event hooks for one engine: statement counts and durations,
+    per-request DB time, and the optional slow-query log.
+    """
+
+    def __init__(self, engine, label, slow_query_ms=SLOW_QUERY_MS):
+        self.label = label
+        self.slow_query_ms = slow_query_ms
+        event.listen(engine, 'before_cursor_execute', self.before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self.after_cursor_execute)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        kind = statement_type(statement)
+        SQL_STATEMENTS.inc(engine=self.label, statement=kind)
+        SQL_STATEMENT_SECONDS.observe(elapsed, engine=self.label, statement=kind)
+
+        timings = _current_timings()
+        if timings is not None:
+            timings.db_seconds += elapsed
+            timings.statements += 1
+
+        if self.slow_query_ms and elapsed * 1000 >= self.slow_query_ms:
+            SQL_SLOW_STATEMENTS.inc(engine=self.label, statement=kind)
+            plan = None
+            if kind in ('SELECT', 'WITH') and not executemany:
+                plan = explain_query_plan(cursor, statement, parameters)
+            slow_query_log.warning(
+                "Slow query on %s engine (%.1f ms%s):\n%s\nparameters: %r\nquery plan:\n%s",
+                self.label, elapsed * 1000,
+                f", endpoint {request.endpoint}" if has_request_context() else '',
+                statement.strip(), parameters, plan or '(not available)',
+            )
+
+
+def instrument_engine(engine, label, slow_query_ms=SLOW_QUERY_MS):
+    """
+    Installs the SQL hooks on `engine` once; calling it again only updates
+    the slow-query threshold. Returns the EngineInstrumentation.
+    """
+    instrumentation = engine.__dict__.get('_metrics_instrumentation')
+    if instrumentation is None:
+        instrumentation = EngineInstrumentation(engine, label, slow_query_ms)
+        engine._metrics_instrumentation = instrumentation
+    else:
+        instrumentation.slow_query_ms = slow_query_ms
+    return instrumentation
+
+
+def _endpoint_label():
+    return request.endpoint or 'unmatched'
+
+
+def _start_request():
+    g.request_timings = RequestTimings()
+
+
+def _render_started(sender, template, context, **extra):
+    timings = _current_timings()
+    if timings is not None:
+        timings.render_started = time.perf_counter()
+
+
+def _render_finished(sender, template, context, **extra):
+    timings = _current_timings()
+    if timings is not None and timings.render_started is not None:
+        timings.render_seconds += time.perf_counter() - timings.render_started
+        timings.render_started = None
+
+
+def _finish_request(response):
+    """
+    Records the request's metrics. Streamed bodies (e.g. /api/export) are
+    generated after this point, so only their setup time is counted.
+    """
+    timings = g.pop('request_timings', None)
+    if timings is None:
+        return response
+    total = time.perf_counter() - timings.started
+    endpoint = _endpoint_label()
+    HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=str(response.status_code))
+    HTTP_REQUEST_SECONDS.observe(total, endpoint=endpoint)
+    HTTP_PHASE_SECONDS.observe(timings.db_seconds, endpoint=endpoint, phase='db')
+    HTTP_PHASE_SECONDS.observe(timings.render_seconds, endpoint=endpoint, phase='render')
+    HTTP_PHASE_SECONDS.observe(max(0.0, total - timings.db_seconds - timings.render_seconds),
+                               endpoint=endpoint, phase='hydrate')
+    HTTP_REQUEST_STATEMENTS.observe(timings.statements, endpoint=endpoint)
+    return response
+
+
+def init_app(app, engines):
+    """
+    Turns on request and SQL metrics for `app`. `engines` maps a label
+    ('writer', 'reader') to an engine; an engine listed twice (in-memory
+    databases read through the writer) is instrumented once.
+    """
+    for label, engine in engines.items():
+        instrument_engine(engine, label, app.config['SLOW_QUERY_MS'])
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    before_render_template.connect(_render_started, app)
+    template_rendered.connect(_render_finished, app)
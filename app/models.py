@@ -1,14 +1,19 @@
 # app/models.py
-from sqlalchemy import Column, Integer, String, ForeignKey, Table, Text
+from sqlalchemy import Column, Integer, Float, String, ForeignKey, Table, Text, Boolean, DateTime, Index, func
 from sqlalchemy.orm import relationship
 from app.database import Base
+from app.authors import normalize_name, name_key
 
 # Many-to-many association table for Publications and Authors
 publication_authors_association = Table(
     'publication_authors_association',
     Base.metadata,
     Column('publication_id', Integer, ForeignKey('publications.id')),
-    Column('author_id', Integer, ForeignKey('authors.id'))
+    Column('author_id', Integer, ForeignKey('authors.id')),
+    # One index per direction: loading a page's authors, and the
+    # publications of an author (author filter, facet counts).
+    Index('ix_publication_authors_publication_author', 'publication_id', 'author_id'),
+    Index('ix_publication_authors_author_publication', 'author_id', 'publication_id'),
 )
 
 class Publication(Base):
@@ -22,17 +27,33 @@ class Publication(Base):
     publication_link = Column(String, unique=True, nullable=False)
     publication_year = Column(Integer)
     abstract = Column(Text) # Storing abstract if available
+    # Earliest publication of a near-duplicate cluster (see app/dedup.py);
+    # NULL for publications that are canonical themselves.
+    canonical_id = Column(Integer, ForeignKey('publications.id'))
 
-    # Many-to-many relationship with Author
+    # Many-to-many relationship with Author. Loaded with one extra
+    # SELECT ... IN per query instead of one lazy load per publication.
     authors = relationship(
         'Author',
         secondary=publication_authors_association,
-        back_populates='publications'
+        back_populates='publications',
+        lazy='selectin'
     )
 
     def __repr__(self):
         return f"<Publication(id={self.id}, title='{self.title}')>"
 
+# Serves newest-first listings and their (year, id) keyset cursors; NULL years sort as 0.
+Index('ix_publications_year_id', func.coalesce(Publication.publication_year, 0), Publication.id)
+# Duplicates of a canonical publication; partial, as almost every row is NULL.
+Index('ix_publications_canonical_id', Publication.canonical_id, sqlite_where=Publication.canonical_id.isnot(None))
+
+def _normalized_name_default(context):
+    return normalize_name(context.get_current_parameters()['name'])
+
+def _name_key_default(context):
+    return name_key(context.get_current_parameters()['name'])
+
 class Author(Base):
     """
     Represents an author of a research publication.
@@ -42,6 +63,11 @@ class Author(Base):
     id = Column(Integer, primary_key=True)
     name = Column(String, nullable=False, unique=True) # Assuming author names are unique enough
     author_link = Column(String, unique=True) # Link to author's profile on PurePortal
+    # Derived from name on insert (ORM and Core alike), see app/authors.py.
+    # normalized_name feeds the authors_fts trigram index and short prefix
+    # lookups; name_key groups spellings of the same person.
+    normalized_name = Column(String, index=True, default=_normalized_name_default)
+    name_key = Column(String, index=True, default=_name_key_default)
 
     # Many-to-many relationship with Publication
     publications = relationship(
@@ -53,19 +79,215 @@ class Author(Base):
     def __repr__(self):
         return f"<Author(id={self.id}, name='{self.name}')>"
 
+class CrawlState(Base):
+    """
+    Per-URL fetch state for incremental recrawls: the validators needed for
+    conditional requests and a hash of the page's result list.
+    """
+    __tablename__ = 'crawl_state'
+
+    url = Column(String, primary_key=True)
+    etag = Column(String)
+    last_modified = Column(String)
+    content_hash = Column(String) # sha256 of the listing's result markup
+    last_crawled = Column(DateTime)
+
+    def __repr__(self):
+        return f"<CrawlState(url='{self.url}', content_hash='{self.content_hash}')>"
+
+class CrawlCheckpoint(Base):
+    """
+    Progress of the latest crawl of one listing root, so an interrupted crawl
+    can resume after the last page it finished.
+    """
+    __tablename__ = 'crawl_checkpoints'
+
+    root_url = Column(String, primary_key=True)
+    last_page = Column(Integer, nullable=False, default=0) # Highest page processed, in page order
+    total_pages = Column(Integer)
+    completed = Column(Boolean, nullable=False, default=False)
+    updated_at = Column(DateTime)
+
+    def __repr__(self):
+        return f"<CrawlCheckpoint(root_url='{self.root_url}', last_page={self.last_page}, completed={self.completed})>"
+
+class AbstractFetchFailure(Base):
+    """
+    A publication whose detail page failed permanently (HTTP 4xx other than
+    429, e.g. a removed page) in the abstract stage (see app/abstracts.py).
+    It is not fetched again until retry_after, which backs off with each
+    attempt; the row is dropped once an abstract is written.
+    """
+    __tablename__ = 'abstract_fetch_failures'
+
+    publication_id = Column(Integer, ForeignKey('publications.id'), primary_key=True)
+    status = Column(Integer, nullable=False) # HTTP status of the latest attempt
+    attempts = Column(Integer, nullable=False, default=1)
+    last_attempt = Column(DateTime, nullable=False)
+    retry_after = Column(DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<AbstractFetchFailure(publication_id={self.publication_id}, status={self.status}, attempts={self.attempts})>"
+
+class PublicationSource(Base):
+    """
+    Which crawl sources (listing roots, e.g. organisational units) list a
+    publication. A publication listed by several units is stored once and
+    has one row per unit, so each source can be re-crawled on its own.
+    """
+    __tablename__ = 'publication_sources'
+
+    publication_id = Column(Integer, ForeignKey('publications.id'), primary_key=True)
+    source = Column(String, primary_key=True) # CrawlSource.name
+    first_seen = Column(DateTime)
+    last_seen = Column(DateTime) # Last time a crawl of the source parsed it
+
+    __table_args__ = (
+        Index('ix_publication_sources_source_publication', 'source', 'publication_id'),
+    )
+
+    def __repr__(self):
+        return f"<PublicationSource(publication_id={self.publication_id}, source='{self.source}')>"
+
+class PublicationLSHBucket(Base):
+    """
+    LSH band buckets of each publication's title MinHash (see app/dedup.py).
+    Publications sharing a bucket are near-duplicate candidates.
+    """
+    __tablename__ = 'publication_lsh_buckets'
+
+    bucket = Column(Integer, primary_key=True, autoincrement=False) # Signed 64-bit hash of one band
+    publication_id = Column(Integer, ForeignKey('publications.id'), primary_key=True)
+
+    __table_args__ = {'sqlite_with_rowid': False}
+
+    def __repr__(self):
+        return f"<PublicationLSHBucket(bucket={self.bucket}, publication_id={self.publication_id})>"
+
+class RelatedPublication(Base):
+    """
+    Precomputed "related publications" (see app/related.py): the top
+    neighbours of each publication by TF-IDF cosine similarity, in rank
+    order, so one publication's list is a primary-key range scan.
+    """
+    __tablename__ = 'related_publications'
+
+    publication_id = Column(Integer, ForeignKey('publications.id'), primary_key=True)
+    rank = Column(Integer, primary_key=True, autoincrement=False) # 0 is the most similar
+    related_id = Column(Integer, ForeignKey('publications.id'), nullable=False)
+    score = Column(Float, nullable=False) # Cosine similarity, 0-1
+
+    __table_args__ = {'sqlite_with_rowid': False}
+
+    def __repr__(self):
+        return f"<RelatedPublication(publication_id={self.publication_id}, rank={self.rank}, related_id={self.related_id})>"
+
+class RelatedTerm(Base):
+    """Vocabulary and idf weights of the last full related-publications build."""
+    __tablename__ = 'related_terms'
+
+    term = Column(String, primary_key=True)
+    idf = Column(Float, nullable=False)
+
+    __table_args__ = {'sqlite_with_rowid': False}
+
+    def __repr__(self):
+        return f"<RelatedTerm(term='{self.term}', idf={self.idf})>"
+
+class SpellingTerm(Base):
+    """
+    Dictionary for spelling suggestions (see app/spelling.py): indexed terms
+    of publications_fts found in at least two publications, with that count.
+    """
+    __tablename__ = 'spelling_terms'
+
+    term = Column(String, primary_key=True)
+    documents = Column(Integer, nullable=False)
+
+    __table_args__ = {'sqlite_with_rowid': False}
+
+    def __repr__(self):
+        return f"<SpellingTerm(term='{self.term}', documents={self.documents})>"
+
+class SpellingDelete(Base):
+    """
+    Symmetric-delete index over spelling_terms: every string obtained by
+    deleting up to two characters from a term, so misspellings are found
+    by looking up their own deletions.
+    """
+    __tablename__ = 'spelling_deletes'
+
+    variant = Column(String, primary_key=True)
+    term = Column(String, primary_key=True)
+
+    __table_args__ = {'sqlite_with_rowid': False}
+
+    def __repr__(self):
+        return f"<SpellingDelete(variant='{self.variant}', term='{self.term}')>"
+
+class IndexMeta(Base):
+    """
+    Small key/value table for index-wide bookkeeping. 'generation' is bumped
+    by every ingest commit so cached search results can tell they are stale.
+    """
+    __tablename__ = 'index_meta'
+
+    key = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<IndexMeta(key='{self.key}', value={self.value})>"
+
+class FacetYearCount(Base):
+    """
+    Number of publications per year (0 for unknown), kept up to date by the
+    triggers in app/facets.py so the year histogram never needs a GROUP BY.
+    """
+    __tablename__ = 'facet_year_counts'
+
+    year = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<FacetYearCount(year={self.year}, count={self.count})>"
+
+class FacetAuthorCount(Base):
+    """Number of publications per author, maintained like FacetYearCount."""
+    __tablename__ = 'facet_author_counts'
+
+    author_id = Column(Integer, ForeignKey('authors.id'), primary_key=True)
+    count = Column(Integer, nullable=False, default=0, index=True) # Serves the "top authors" list
+
+    def __repr__(self):
+        return f"<FacetAuthorCount(author_id={self.author_id}, count={self.count})>"
+
+class FacetAuthorYearCount(Base):
+    """
+    Number of publications per author and year (0 for unknown), maintained
+    like FacetYearCount; summed over a year range for year-filtered facets.
+    """
+    __tablename__ = 'facet_author_year_counts'
+
+    author_id = Column(Integer, ForeignKey('authors.id'), primary_key=True)
+    year = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<FacetAuthorYearCount(author_id={self.author_id}, year={self.year}, count={self.count})>"
+
+# Year range scans read (author, count) straight from the index.
+Index('ix_facet_author_year_counts_year', FacetAuthorYearCount.year, FacetAuthorYearCount.author_id,
+      FacetAuthorYearCount.count)
+
 # --- FTS5 Table for Full-Text Search ---
-# Note: We remove 'sqlite_fts': True from __table_args__ here.
-# The FTS table will be created via raw SQL in app/database.py.
+# The FTS table is created via raw SQL in app/fts.py (called from init_db).
 class PublicationFTS(Base):
     """
-    Dedicated FTS5 table for full-text search on publication titles and abstracts.
-    The 'content' column will hold the searchable text.
-    The 'rowid' maps directly to the 'id' of the Publication table.
+    Read-only mapping of the FTS5 index on publication titles and abstracts.
+    It is an external-content table over 'publications' ('rowid' is
+    Publication.id) maintained by triggers, so never write to it directly.
     """
     __tablename__ = 'publications_fts'
-    # 'sqlite_autoincrement': True is still valid for rowid if it's a primary key
-    # in an FTS table, but we'll manage the FTS creation explicitly.
-    # We define the columns that will be indexed.
     rowid = Column(Integer, primary_key=True) # rowid maps to Publication.id
     title = Column(Text)
     abstract = Column(Text)
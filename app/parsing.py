@@ -0,0 +1,334 @@
+# app/parsing.py
+import os
+import re
+from collections import namedtuple
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+from app.ingest import PublicationRecord
+
+# Optional faster HTML backends; the BeautifulSoup parsers work without them.
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+
+class ListingPage(namedtuple('ListingPage', ['records', 'total_pages'])):
+    """
+    What the scraper needs from one listing page: its PublicationRecords
+    and the page count advertised by its pagination links.
+    """
+    __slots__ = ()
+
+
+YEAR_PATTERN = re.compile(r'\b(19|20)\d{2}\b')
+PAGE_HREF_PATTERN = re.compile(r'\?page=(\d+)$')
+
+# Listing parser used when none is requested: the first available of these.
+PREFERRED_PARSERS = ('selectolax', 'lxml', 'soup')
+
+
+# --- Reference implementation ---
+# The original BeautifulSoup code, kept as the definition of what every
+# faster parser below must return (see benchmarks/bench_parse.py).
+
+def get_total_pages(soup):
+    """
+    Attempts to find the total number of pages from the pagination links,
+    considering the ?page=X typically means actual_page_number = X + 1.
+    """
+    pagination_elements = soup.find_all(['a', 'span'], class_=['step', 'currentStep'])
+
+    max_actual_page_num_found = 1
+
+    for element in pagination_elements:
+        try:
+            if element.name == 'a' and 'step' in element.get('class', []):
+                href = element.get('href')
+                if href:
+                    match = PAGE_HREF_PATTERN.search(href)
+                    if match:
+                        actual_page_from_href = int(match.group(1)) + 1
+                        if actual_page_from_href > max_actual_page_num_found:
+                            max_actual_page_num_found = actual_page_from_href
+
+            elif element.name == 'span' and 'currentStep' in element.get('class', []):
+                current_page_text = int(element.get_text(strip=True))
+                if current_page_text > max_actual_page_num_found:
+                    max_actual_page_num_found = current_page_text
+
+            text_content = element.get_text(strip=True)
+            if text_content.isdigit():
+                page_num_from_text = int(text_content)
+                if page_num_from_text > max_actual_page_num_found:
+                    max_actual_page_num_found = page_num_from_text
+
+        except (ValueError, TypeError):
+            continue
+
+    return max_actual_page_num_found
+
+def parse_page_documents(soup):
+    """
+    Extracts the publications listed on a single page.
+    Returns a list of PublicationRecords.
+    """
+    records = []
+
+    documents = soup.find_all("li", {"class": "list-result-item"})
+
+    for doc in documents:
+        title_h3 = doc.find("h3", {"class": "title"})
+        if not title_h3:
+            continue
+
+        pub_link_tag = title_h3.find('a', {'class':'link'})
+        pub_title_span = title_h3.find('span')
+
+        if not pub_link_tag or not pub_title_span:
+            continue
+
+        pub_link = pub_link_tag.get('href')
+        pub_title = pub_title_span.text.strip()
+
+        authors_div = doc.find('div', {'class': 'relations persons'})
+        current_authors = []
+        if authors_div:
+            author_tags = authors_div.find_all('a', {'class': 'link person'})
+            for author_tag in author_tags:
+                name_span = author_tag.find('span')
+                if not name_span: # A person link without a name is no use as an author
+                    continue
+                author_name = name_span.text.strip()
+                author_link = author_tag.get('href')
+                current_authors.append((author_name, author_link))
+
+        publication_year = None
+        year_div = doc.find('div', class_='search-result-group')
+        if year_div:
+            match = YEAR_PATTERN.search(year_div.get_text(strip=True))
+            if match:
+                publication_year = int(match.group(0))
+
+        if publication_year is None:
+            date_span = doc.find('span', class_='date')
+            if date_span:
+                match = YEAR_PATTERN.search(date_span.text.strip())
+                if match:
+                    publication_year = int(match.group(0))
+
+        abstract_text = None
+        # Abstracts are not part of the list view; app/abstracts.py fetches
+        # them from each publication's detail page in a separate stage.
+
+        records.append(PublicationRecord(pub_title, pub_link, publication_year, abstract_text, tuple(current_authors)))
+
+    return records
+
+
+def parse_listing_reference(html):
+    """The original full-tree parse with Python's html.parser."""
+    soup = BeautifulSoup(html, "html.parser")
+    return ListingPage(parse_page_documents(soup), get_total_pages(soup))
+
+
+# --- Shared rules for the fast parsers ---
+
+def _year(group_text, date_text):
+    """Year from the result group heading, else from the date span (as parse_page_documents)."""
+    for text in (group_text, date_text):
+        if text is not None:
+            match = YEAR_PATTERN.search(text)
+            if match:
+                return int(match.group(0))
+    return None
+
+
+def _page_count(elements):
+    """
+    get_total_pages() over (tag, classes, href, stripped_text) tuples, one per
+    a/span element carrying a 'step' or 'currentStep' class.
+    """
+    highest = 1
+    for tag, classes, href, text in elements:
+        try:
+            if tag == 'a' and 'step' in classes:
+                match = PAGE_HREF_PATTERN.search(href) if href else None
+                if match:
+                    highest = max(highest, int(match.group(1)) + 1)
+            elif tag == 'span' and 'currentStep' in classes:
+                highest = max(highest, int(text))
+            if text.isdigit():
+                highest = max(highest, int(text))
+        except ValueError:
+            continue
+    return highest
+
+
+# --- BeautifulSoup with a SoupStrainer ---
+
+# Only result items and pagination links are built into the tree; the page
+# chrome around them is skipped by the tree builder. The strainer sees the
+# raw class attribute (not yet split into a list), hence the split().
+LISTING_CLASSES = {'list-result-item', 'step', 'currentStep'}
+LISTING_STRAINER = SoupStrainer(
+    ['li', 'a', 'span'], class_=lambda value: bool(value) and not LISTING_CLASSES.isdisjoint(value.split())
+)
+
+
+def _soup_features():
+    return 'lxml' if lxml is not None else 'html.parser'
+
+
+def parse_listing_soup(html):
+    """BeautifulSoup over just the listing subtrees, with lxml's tree builder when installed."""
+    soup = BeautifulSoup(html, _soup_features(), parse_only=LISTING_STRAINER)
+    return ListingPage(parse_page_documents(soup), get_total_pages(soup))
+
+
+# --- lxml ---
+
+def _has_class(name):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+LXML_ITEMS = f"//li[{_has_class('list-result-item')}]"
+LXML_TITLE = f".//h3[{_has_class('title')}]"
+LXML_TITLE_LINK = f".//a[{_has_class('link')}]"
+LXML_PERSONS = ".//div[normalize-space(@class)='relations persons']"
+LXML_PERSON_LINKS = ".//a[normalize-space(@class)='link person']"
+LXML_GROUP = f".//div[{_has_class('search-result-group')}]"
+LXML_DATE = f".//span[{_has_class('date')}]"
+LXML_STEPS = (f"//a[{_has_class('step')} or {_has_class('currentStep')}]"
+              f" | //span[{_has_class('step')} or {_has_class('currentStep')}]")
+
+
+def _lxml_text(node, strip=False):
+    """BeautifulSoup's .text (or get_text(strip=True)) for an lxml element."""
+    strings = node.xpath('.//text()')
+    if strip:
+        return ''.join(string.strip() for string in strings)
+    return ''.join(strings)
+
+
+def _first(node, path):
+    found = node.xpath(path)
+    return found[0] if found else None
+
+
+def parse_listing_lxml(html):
+    """lxml.html (libxml2) with XPath lookups."""
+    if isinstance(html, str):
+        html = html.encode('utf-8')
+    root = lxml.html.fromstring(html, parser=lxml.html.HTMLParser(encoding='utf-8'))
+    records = []
+    for doc in root.xpath(LXML_ITEMS):
+        title_h3 = _first(doc, LXML_TITLE)
+        if title_h3 is None:
+            continue
+        link = _first(title_h3, LXML_TITLE_LINK)
+        title_span = _first(title_h3, './/span')
+        if link is None or title_span is None:
+            continue
+
+        authors = []
+        persons = _first(doc, LXML_PERSONS)
+        if persons is not None:
+            for person in persons.xpath(LXML_PERSON_LINKS):
+                name_span = _first(person, './/span')
+                if name_span is not None:
+                    authors.append((_lxml_text(name_span).strip(), person.get('href')))
+
+        group = _first(doc, LXML_GROUP)
+        date = _first(doc, LXML_DATE)
+        year = _year(_lxml_text(group, strip=True) if group is not None else None,
+                     _lxml_text(date).strip() if date is not None else None)
+        records.append(PublicationRecord(_lxml_text(title_span).strip(), link.get('href'), year, None, tuple(authors)))
+
+    steps = [(element.tag, (element.get('class') or '').split(), element.get('href'), _lxml_text(element, strip=True))
+             for element in root.xpath(LXML_STEPS)]
+    return ListingPage(records, _page_count(steps))
+
+
+# --- selectolax (lexbor) ---
+
+def _exact_class(node, value):
+    """BeautifulSoup's {'class': 'a b'} match: the whole class attribute, whitespace-normalized."""
+    return ' '.join((node.attributes.get('class') or '').split()) == value
+
+
+def parse_listing_selectolax(html):
+    """selectolax's lexbor backend with CSS selectors."""
+    tree = LexborHTMLParser(html)
+    records = []
+    for doc in tree.css('li.list-result-item'):
+        title_h3 = doc.css_first('h3.title')
+        if title_h3 is None:
+            continue
+        link = title_h3.css_first('a.link')
+        title_span = title_h3.css_first('span')
+        if link is None or title_span is None:
+            continue
+
+        authors = []
+        persons = next((node for node in doc.css('div.relations.persons')
+                        if _exact_class(node, 'relations persons')), None)
+        if persons is not None:
+            for person in persons.css('a.link.person'):
+                if not _exact_class(person, 'link person'):
+                    continue
+                name_span = person.css_first('span')
+                if name_span is not None:
+                    authors.append((name_span.text().strip(), person.attributes.get('href')))
+
+        group = doc.css_first('div.search-result-group')
+        date = doc.css_first('span.date')
+        year = _year(group.text(separator='', strip=True) if group is not None else None,
+                     date.text().strip() if date is not None else None)
+        records.append(PublicationRecord(title_span.text().strip(), link.attributes.get('href'), year, None,
+                                         tuple(authors)))
+
+    steps = [(element.tag, (element.attributes.get('class') or '').split(), element.attributes.get('href'),
+              element.text(separator='', strip=True))
+             for element in tree.css('a.step, a.currentStep, span.step, span.currentStep')]
+    return ListingPage(records, _page_count(steps))
+
+
+LISTING_PARSERS = {
+    'reference': parse_listing_reference,
+    'soup': parse_listing_soup,
+    'lxml': parse_listing_lxml,
+    'selectolax': parse_listing_selectolax,
+}
+
+
+def available_listing_parsers():
+    """Names of the listing parsers whose libraries are installed."""
+    missing = set()
+    if lxml is None:
+        missing.add('lxml')
+    if LexborHTMLParser is None:
+        missing.add('selectolax')
+    return [name for name in LISTING_PARSERS if name not in missing]
+
+
+def get_listing_parser(name=None):
+    """
+    Returns the listing parser function `name` (default: the LISTING_PARSER
+    env var, else the fastest one installed). Parsers take the page HTML and
+    return a ListingPage; they are plain module functions, so they can be
+    sent to worker processes.
+    """
+    name = name or os.getenv('LISTING_PARSER')
+    available = available_listing_parsers()
+    if not name:
+        name = next(preferred for preferred in PREFERRED_PARSERS if preferred in available)
+    if name not in available:
+        raise ValueError(f"Unknown or unavailable listing parser '{name}'. Available: {', '.join(available)}")
+    return LISTING_PARSERS[name]
@@ -0,0 +1,248 @@
+# app/pipeline.py
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from app.metrics import PIPELINE_ITEMS, PIPELINE_BUSY_SECONDS, PIPELINE_QUEUE_HIGH_WATER
+
+# Marks the end of a queue's input; one is sent per consumer.
+DONE = object()
+
+STAGES = ('fetch', 'parse', 'write')
+
+
+class StageStats:
+    """
+    Counters for one stage. `busy` is summed over the stage's workers; the
+    write stage counts records rather than pages.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.errors = 0
+        self.busy = 0.0
+        self.first = None
+        self.last = None
+
+    def record(self, seconds, items=1):
+        now = time.perf_counter()
+        self.first = self.first if self.first is not None else now - seconds
+        self.last = now
+        self.items += items
+        self.busy += seconds
+        PIPELINE_ITEMS.inc(items, stage=self.name, outcome='ok')
+        PIPELINE_BUSY_SECONDS.inc(seconds, stage=self.name)
+
+    def error(self):
+        self.errors += 1
+        PIPELINE_ITEMS.inc(stage=self.name, outcome='error')
+
+    def rate(self):
+        """Items per second between the stage's first and last completed item."""
+        if self.first is None or self.last <= self.first:
+            return 0.0
+        return self.items / (self.last - self.first)
+
+
+class PipelineStats:
+    """Per-stage counters plus queue high-water marks, which show where backpressure kicked in."""
+
+    def __init__(self):
+        self.stages = {name: StageStats(name) for name in STAGES}
+        self.queue_high_water = {}
+        self.pages = 0
+        self.records = 0
+        self.added = 0
+        self.skipped = 0
+        self.elapsed = 0.0
+
+    def observe_queue(self, name, queue):
+        depth = queue.qsize()
+        if depth > self.queue_high_water.get(name, 0):
+            self.queue_high_water[name] = depth
+            PIPELINE_QUEUE_HIGH_WATER.set(depth, queue=name)
+
+    def summary(self):
+        lines = [f"{self.pages} pages, {self.records} records ({self.added} added, {self.skipped} skipped) "
+                 f"in {self.elapsed:.2f}s"]
+        for stage in self.stages.values():
+            lines.append(f"  {stage.name:<6} {stage.items:>7} items {stage.errors:>4} errors "
+                         f"{stage.rate():>9.1f} items/sec  busy {stage.busy:7.2f}s")
+        if self.queue_high_water:
+            lines.append("  queue high water: " + ", ".join(
+                f"{name} {depth}" for name, depth in sorted(self.queue_high_water.items())))
+        return '\n'.join(lines)
+
+
+def timed_parse(parse, html):
+    """Runs in a worker process: returns (ListingPage, seconds spent parsing)."""
+    started = time.perf_counter()
+    page = parse(html)
+    return page, time.perf_counter() - started
+
+
+def read_page(path):
+    with open(path, encoding='utf-8', errors='replace') as handle:
+        return handle.read()
+
+
+async def fetch_file(path):
+    """Fetch function for saved HTML files."""
+    return await asyncio.to_thread(read_page, path)
+
+
+def http_fetcher(crawler, prefetched=None):
+    """
+    Fetch function for live URLs through an AsyncCrawler. `prefetched` maps
+    URLs to HTML that was already downloaded (e.g. page 1, fetched to find
+    the page count), so they are not requested twice.
+    """
+    prefetched = dict(prefetched or {})
+
+    async def fetch(url):
+        if url in prefetched:
+            return prefetched.pop(url)
+        result = await crawler.fetch(url)
+        if not result.ok:
+            raise RuntimeError(f"Could not fetch {url}: {result.error}")
+        return result.text
+
+    return fetch
+
+
+class IngestPipeline:
+    """
+    Staged ingest: fetch -> parse -> write, connected by bounded queues.
+
+    - fetch: `fetch_concurrency` coroutines call `fetch(item) -> html` (I/O
+      bound: HTTP through the crawler, or file reads in threads),
+    - parse: listing pages are parsed by `parse` in a ProcessPoolExecutor
+      with `parse_workers` processes, so parsing uses every core,
+    - write: one writer task turns parsed pages into batches of about
+      `batch_size` records and commits each through the BulkIngester, in a
+      thread, one batch at a time (SQLite has a single writer anyway).
+
+    `source_of(item)`, if given, names the crawl source an item belongs to;
+    records are then batched per source and recorded under it.
+
+    A full queue blocks the stage feeding it, so a slow writer throttles
+    parsing and a slow parser throttles fetching instead of buffering pages
+    in memory. Pages that fail to fetch or parse are counted and skipped;
+    any other error (e.g. a failed write or a crashed worker process)
+    cancels every stage, shuts the process pool down and is re-raised.
+    """
+
+    def __init__(self, ingester, parse, parse_workers=None, fetch_concurrency=4, batch_size=500,
+                 queue_size=None, log=print, source_of=None):
+        self.ingester = ingester
+        self.parse = parse
+        self.parse_workers = parse_workers or os.cpu_count() or 1
+        self.fetch_concurrency = fetch_concurrency
+        self.batch_size = batch_size
+        self.queue_size = queue_size or 2 * self.parse_workers
+        self.log = log
+        self.source_of = source_of or (lambda item: None)
+        self.stats = None
+
+    def run(self, items, fetch):
+        """Synchronous entry point; returns PipelineStats."""
+        return asyncio.run(self.run_async(items, fetch))
+
+    async def run_async(self, items, fetch):
+        """Ingests every item (URL, path, ...) yielded by `items`; returns PipelineStats."""
+        self.stats = PipelineStats()
+        started = time.perf_counter()
+        parse_queue = asyncio.Queue(self.queue_size)
+        write_queue = asyncio.Queue(self.queue_size)
+        items = iter(items)
+        parse_tasks = 2 * self.parse_workers # keeps every process busy while results are handed on
+
+        pool = ProcessPoolExecutor(self.parse_workers)
+        fetchers = [asyncio.ensure_future(self._fetch_worker(items, fetch, parse_queue))
+                    for _ in range(self.fetch_concurrency)]
+        tasks = fetchers + [
+            asyncio.ensure_future(self._close_queue(fetchers, parse_queue, parse_tasks)),
+            asyncio.ensure_future(self._write_worker(write_queue, parse_tasks)),
+        ] + [asyncio.ensure_future(self._parse_worker(pool, parse_queue, write_queue)) for _ in range(parse_tasks)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+            self.stats.elapsed = time.perf_counter() - started
+        return self.stats
+
+    async def _fetch_worker(self, items, fetch, parse_queue):
+        stage = self.stats.stages['fetch']
+        for item in items: # the iterator is shared, so each item goes to one worker
+            started = time.perf_counter()
+            try:
+                html = await fetch(item)
+            except Exception as e:
+                stage.error()
+                self.log(f"Fetch failed for {item}: {e}")
+                continue
+            stage.record(time.perf_counter() - started)
+            await parse_queue.put((item, html))
+            self.stats.observe_queue('parse', parse_queue)
+
+    async def _close_queue(self, fetchers, parse_queue, consumers):
+        await asyncio.gather(*fetchers)
+        for _ in range(consumers):
+            await parse_queue.put(DONE)
+
+    async def _parse_worker(self, pool, parse_queue, write_queue):
+        loop = asyncio.get_running_loop()
+        stage = self.stats.stages['parse']
+        while True:
+            entry = await parse_queue.get()
+            if entry is DONE:
+                await write_queue.put(DONE)
+                return
+            item, html = entry
+            try:
+                page, seconds = await loop.run_in_executor(pool, timed_parse, self.parse, html)
+            except BrokenProcessPool:
+                raise
+            except Exception as e:
+                stage.error()
+                self.log(f"Parse failed for {item}: {e}")
+                continue
+            stage.record(seconds)
+            await write_queue.put((item, page))
+            self.stats.observe_queue('write', write_queue)
+
+    async def _write_worker(self, write_queue, producers):
+        batches = {} # source -> records waiting to be written
+        finished = 0
+        while finished < producers:
+            entry = await write_queue.get()
+            if entry is DONE:
+                finished += 1
+                continue
+            item, page = entry
+            self.stats.pages += 1
+            source = self.source_of(item)
+            batch = batches.setdefault(source, [])
+            batch.extend(page.records)
+            if len(batch) >= self.batch_size:
+                await self._write(batches.pop(source), source)
+        for source, batch in batches.items():
+            await self._write(batch, source)
+
+    async def _write(self, records, source=None):
+        if not records:
+            return
+        started = time.perf_counter()
+        added, skipped = await asyncio.to_thread(self.ingester.ingest, records, source)
+        self.stats.stages['write'].record(time.perf_counter() - started, len(records))
+        self.stats.records += len(records)
+        self.stats.added += added
+        self.stats.skipped += skipped
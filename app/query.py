@@ -0,0 +1,114 @@
+# app/query.py
+import re
+from collections import namedtuple
+
+# User input is never passed to MATCH as typed. parse_query() reads the
+# syntax people actually use (words, "quoted phrases", prefix*, OR, NOT or
+# -word, title:/abstract: filters) into a ParsedQuery, and render_match()
+# writes it back as FTS5 syntax with every term quoted, so stray quotes,
+# brackets, colons or operators can no longer make the query fail.
+
+# One term as typed. 'phrase' terms were quoted; 'prefix' terms ended in
+# '*'; 'column' restricts the term to 'title' or 'abstract'.
+QueryTerm = namedtuple('QueryTerm', ['text', 'phrase', 'prefix', 'column'], defaults=[False, False, None])
+
+# 'groups' must all match; each group is a tuple of alternatives that were
+# joined by OR. 'excluded' terms must not match.
+ParsedQuery = namedtuple('ParsedQuery', ['groups', 'excluded'])
+
+COLUMNS = ('title', 'abstract')
+OPERATORS = ('AND', 'OR', 'NOT')
+# Longer queries are cut off; every term adds work to the MATCH.
+MAX_TERMS = 32
+
+TERM_PATTERN = re.compile(r'''
+    (?P<negate>-)?
+    (?:(?P<column>title|abstract):)?
+    (?:"(?P<phrase>[^"]*)"?|(?P<word>[^\s"]+))
+''', re.VERBOSE | re.IGNORECASE)
+
+# Grouping is not supported; brackets only separate words.
+BRACKETS = str.maketrans('()', '  ')
+
+
+def _term(match):
+    column = match.group('column')
+    column = column.lower() if column else None
+    phrase = match.group('phrase')
+    if phrase is not None:
+        term = QueryTerm(' '.join(phrase.split()), phrase=True, column=column)
+    else:
+        word = match.group('word')
+        term = QueryTerm(word.replace('*', ''), prefix=word.endswith('*'), column=column)
+    # Terms without letters or digits would be empty once tokenized.
+    return term if any(char.isalnum() for char in term.text) else None
+
+
+def parse_query(query):
+    """
+    Reads a search box query into a ParsedQuery. Adjacent terms must all
+    match; 'a OR b' makes a and b alternatives; '-a' and 'NOT a' exclude a.
+    Operators are only recognised in capitals, as in FTS5.
+    """
+    groups, excluded = [], []
+    join_next = negate_next = False
+    for match in TERM_PATTERN.finditer((query or '').translate(BRACKETS)):
+        word = match.group('word')
+        if word in OPERATORS and not match.group('negate') and not match.group('column'):
+            if word == 'OR':
+                join_next = bool(groups)
+            elif word == 'NOT':
+                negate_next = True
+            continue
+        term = _term(match)
+        if term is None:
+            continue
+        if match.group('negate') or negate_next:
+            excluded.append(term)
+        elif join_next:
+            groups[-1] = groups[-1] + (term,)
+        else:
+            groups.append((term,))
+        join_next = negate_next = False
+        if len(excluded) + sum(len(group) for group in groups) >= MAX_TERMS:
+            break
+    return ParsedQuery(tuple(groups), tuple(excluded))
+
+
+def render_term(term):
+    """One term in FTS5 syntax: always a quoted string, so its text is never read as syntax."""
+    rendered = '"' + term.text.replace('"', '""') + '"' + ('*' if term.prefix else '')
+    return f"{term.column} : {rendered}" if term.column else rendered
+
+
+def render_match(parsed):
+    """
+    The FTS5 MATCH expression for a ParsedQuery, or None if nothing is left
+    to search for (FTS5 can't run a query that only excludes terms).
+    """
+    if not parsed.groups:
+        return None
+    expression = ' AND '.join(
+        render_term(group[0]) if len(group) == 1 else '(' + ' OR '.join(render_term(term) for term in group) + ')'
+        for group in parsed.groups
+    )
+    for term in parsed.excluded:
+        expression += ' NOT ' + render_term(term)
+    return expression
+
+
+def display_term(term):
+    text = f'"{term.text}"' if term.phrase else term.text + ('*' if term.prefix else '')
+    return f"{term.column}:{text}" if term.column else text
+
+
+def render_display(parsed):
+    """A ParsedQuery written back in search box syntax, e.g. for "did you mean" links."""
+    parts = [' OR '.join(display_term(term) for term in group) for group in parsed.groups]
+    parts += ['-' + display_term(term) for term in parsed.excluded]
+    return ' '.join(parts)
+
+
+def match_expression(query):
+    """Safe MATCH expression for a search box query, or None if it has no searchable terms."""
+    return render_match(parse_query(query))
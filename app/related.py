@@ -0,0 +1,329 @@
+# app/related.py
+import time
+from collections import namedtuple
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import bindparam, text
+
+from app.authors import fold
+
+# "Related publications": every publication's nearest neighbours by cosine
+# similarity of TF-IDF vectors over its title and abstract, computed
+# offline (scripts/build_related.py) and stored in related_publications, so
+# serving them is one primary-key range scan instead of an FTS query.
+#
+# The vocabulary and idf weights of the last full build are kept in
+# related_terms. Incremental updates vectorize new publications with them,
+# score the new rows against the whole collection with one sparse product
+# per chunk, and merge any better neighbours into the stored lists of older
+# publications. A full build is forced when the collection has grown by
+# REBUILD_GROWTH since the idf weights were computed.
+
+DEFAULT_K = 10
+# Title words count this many times an abstract word.
+TITLE_WEIGHT = 2.0
+MIN_TERM_LENGTH = 3
+# Terms in a single publication can't relate two; terms in more than this
+# share of them say nothing about any pair.
+MIN_DOCUMENT_FREQUENCY = 2
+MAX_DOCUMENT_RATIO = 0.5
+# Neighbours scoring below this are not stored, so unusual publications get
+# short lists instead of arbitrary ones.
+MIN_SCORE = 0.05
+REBUILD_GROWTH = 1.5
+# Dense score cells per chunk (float32): bounds memory at about 32 MB
+# whatever the collection size.
+CHUNK_CELLS = 8_000_000
+
+STOP_WORDS = frozenset("""
+about above after again against among and are based because been before being between both but can
+could does doing during each effect effects evidence for from further had has have having here how
+into its more most new not now off once only other our out over own paper results same should some
+study such than that the their them then there these they this those through too under until using
+very via was were what when where which while who whom why will with within would
+""".split())
+
+# Bookkeeping in index_meta: the highest publication id covered, the
+# collection size the idf weights were computed for, and the list length.
+LAST_ID_KEY = 'related_last_id'
+DOCUMENTS_KEY = 'related_documents'
+K_KEY = 'related_k'
+
+RelatedHit = namedtuple('RelatedHit', ['id', 'title', 'publication_link', 'publication_year', 'score'])
+
+# Neighbours of one publication in rank order; the primary key makes this
+# a range scan.
+RELATED_SQL = text("""
+SELECT p.id, p.title, p.publication_link, p.publication_year, r.score
+FROM related_publications r
+JOIN publications p ON p.id = r.related_id
+WHERE r.publication_id = :publication_id
+ORDER BY r.rank
+LIMIT :limit
+""")
+
+DOCUMENTS_SQL = text("SELECT id, title, abstract, coalesce(canonical_id, id) FROM publications ORDER BY id")
+
+LIST_FLOORS_SQL = text("SELECT publication_id, count(*), min(score) FROM related_publications GROUP BY publication_id")
+
+STORED_LISTS_SQL = text(
+    "SELECT publication_id, related_id, score FROM related_publications WHERE publication_id IN :ids"
+).bindparams(bindparam('ids', expanding=True))
+
+DELETE_LISTS_SQL = text(
+    "DELETE FROM related_publications WHERE publication_id IN :ids"
+).bindparams(bindparam('ids', expanding=True))
+
+INSERT_RELATED_SQL = text(
+    "INSERT INTO related_publications (publication_id, rank, related_id, score) "
+    "VALUES (:publication_id, :rank, :related_id, :score)"
+)
+
+SET_META_SQL = text(
+    "INSERT INTO index_meta (key, value) VALUES (:key, :value) "
+    "ON CONFLICT(key) DO UPDATE SET value = excluded.value"
+)
+
+# Keeps IN (...) lists comfortably below SQLite's bound-parameter limit.
+IN_CHUNK_SIZE = 500
+
+
+def related_publications(connection, publication_id, limit=DEFAULT_K):
+    """The stored neighbours of a publication, most similar first, as RelatedHits."""
+    rows = connection.execute(RELATED_SQL, {'publication_id': publication_id, 'limit': limit})
+    return [RelatedHit(*row) for row in rows]
+
+
+def publication_exists(connection, publication_id):
+    return connection.execute(text("SELECT 1 FROM publications WHERE id = :id"), {'id': publication_id}).first() is not None
+
+
+def tokenize(value):
+    """Folded words of a title or abstract, without stop words, short words and numbers."""
+    return [word for word in fold(value).split()
+            if len(word) >= MIN_TERM_LENGTH and word not in STOP_WORDS and not word.isdigit()]
+
+
+def term_matrix(documents, vocabulary, grow=False):
+    """
+    Weighted term counts as a CSR matrix, one row per (title, abstract)
+    pair. Words missing from `vocabulary` (term -> column) are skipped, or
+    added to it with `grow`.
+    """
+    rows, columns, weights = [], [], []
+    for row, (title, abstract) in enumerate(documents):
+        for words, weight in ((tokenize(title), TITLE_WEIGHT), (tokenize(abstract), 1.0)):
+            for word in words:
+                column = vocabulary.get(word)
+                if column is None:
+                    if not grow:
+                        continue
+                    column = vocabulary[word] = len(vocabulary)
+                rows.append(row)
+                columns.append(column)
+                weights.append(weight)
+    # Duplicate (row, column) entries are summed by the CSR conversion.
+    return sparse.csr_matrix(
+        (np.array(weights, dtype=np.float32), (np.array(rows, dtype=np.int64), np.array(columns, dtype=np.int64))),
+        shape=(len(documents), len(vocabulary)),
+    )
+
+
+def fit_idf(counts, vocabulary):
+    """
+    Drops terms that are too rare or too common from a fresh term matrix.
+    Returns (counts restricted to the kept terms, {term: column}, idf array).
+    """
+    documents = counts.shape[0]
+    frequency = np.bincount(counts.indices, minlength=counts.shape[1])
+    keep = (frequency >= MIN_DOCUMENT_FREQUENCY) & (frequency <= max(MIN_DOCUMENT_FREQUENCY, MAX_DOCUMENT_RATIO * documents))
+    kept_columns = np.flatnonzero(keep)
+    terms = sorted((term for term, column in vocabulary.items() if keep[column]), key=vocabulary.get)
+    idf = (np.log((1 + documents) / (1 + frequency[kept_columns])) + 1).astype(np.float32)
+    return counts[:, kept_columns], {term: column for column, term in enumerate(terms)}, idf
+
+
+def tfidf(counts, idf):
+    """Sublinear tf times idf, rows scaled to unit length (empty rows stay zero)."""
+    matrix = counts.astype(np.float32, copy=True)
+    matrix.data = (1 + np.log(matrix.data)) * idf[matrix.indices]
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.diags((1 / norms).astype(np.float32)) @ matrix
+
+
+def top_neighbours(scores, k):
+    """(columns, scores) of the k highest entries per row, best first."""
+    if scores.shape[1] > k:
+        columns = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        columns = np.broadcast_to(np.arange(scores.shape[1]), scores.shape).copy()
+    values = np.take_along_axis(scores, columns, axis=1)
+    order = np.argsort(-values, axis=1, kind='stable')
+    return np.take_along_axis(columns, order, axis=1), np.take_along_axis(values, order, axis=1)
+
+
+def get_meta(connection, key):
+    return connection.execute(text("SELECT value FROM index_meta WHERE key = :key"), {'key': key}).scalar()
+
+
+def load_terms(connection):
+    """(vocabulary, idf) of the last full build, or (None, None) if there was none."""
+    rows = connection.execute(text("SELECT term, idf FROM related_terms ORDER BY term")).fetchall()
+    if not rows:
+        return None, None
+    return {term: column for column, (term, _) in enumerate(rows)}, np.array([idf for _, idf in rows], dtype=np.float32)
+
+
+class RelatedBuilder:
+    """
+    Computes and stores the top-`k` neighbours of publications. Neighbours
+    are canonical publications only (see app/dedup.py), never the
+    publication's own near-duplicate cluster.
+    """
+
+    def __init__(self, engine, k=DEFAULT_K, min_score=MIN_SCORE, log=print):
+        self.engine = engine
+        self.k = k
+        self.min_score = min_score
+        self.log = log
+
+    def update(self, full=False):
+        """
+        Adds neighbours for publications ingested since the last run, or
+        recomputes every list with `full` (also forced when there is no
+        model yet, `k` changed or the collection outgrew its idf weights).
+        Returns the number of publications whose list was (re)written.
+        """
+        started = time.perf_counter()
+        with self.engine.connect() as connection:
+            ids, documents, roots = self._documents(connection)
+            last_id = get_meta(connection, LAST_ID_KEY)
+            modelled = get_meta(connection, DOCUMENTS_KEY)
+            vocabulary, idf = load_terms(connection)
+            floors = self._floors(connection, ids)
+            stored_k = get_meta(connection, K_KEY)
+        if not len(ids):
+            return 0
+
+        if (full or vocabulary is None or last_id is None or stored_k != self.k
+                or len(ids) > REBUILD_GROWTH * (modelled or 0)):
+            vocabulary = {}
+            counts, vocabulary, idf = fit_idf(term_matrix(documents, vocabulary, grow=True), vocabulary)
+            new_rows = np.arange(len(ids))
+            full = True
+        else:
+            counts = term_matrix(documents, vocabulary)
+            new_rows = np.flatnonzero(ids > last_id)
+        self.log(f"Vectorized {len(ids)} publications over {len(vocabulary)} terms "
+                 f"({time.perf_counter() - started:.1f}s); {len(new_rows)} to add.")
+        if not len(new_rows):
+            return 0
+
+        matrix = tfidf(counts, idf)
+        lists, improved = self._score(matrix, ids, roots, new_rows, None if full else floors)
+        if not full:
+            lists.update(self._merge(improved, ids))
+        self._write(lists, full, vocabulary, idf, int(ids.max()), len(ids))
+        self.log(f"Wrote related publications for {len(lists)} publications "
+                 f"({time.perf_counter() - started:.1f}s).")
+        return len(lists)
+
+    def _documents(self, connection):
+        rows = connection.execute(DOCUMENTS_SQL).fetchall()
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        roots = np.array([row[3] for row in rows], dtype=np.int64)
+        return ids, [(row[1], row[2]) for row in rows], roots
+
+    def _floors(self, connection, ids):
+        """Per row of `ids`, the score a new neighbour has to beat to enter its stored list."""
+        floors = np.full(len(ids), self.min_score, dtype=np.float32)
+        position = {publication_id: row for row, publication_id in enumerate(ids.tolist())}
+        for publication_id, count, lowest in connection.execute(LIST_FLOORS_SQL):
+            if count >= self.k and publication_id in position:
+                floors[position[publication_id]] = lowest
+        return floors
+
+    def _score(self, matrix, ids, roots, new_rows, floors):
+        """
+        Scores `new_rows` of `matrix` against every row, a chunk at a time.
+        Returns ({id: [(related_id, score), ...]} for the new rows, and for
+        older rows the new neighbours beating their floor as
+        {row: [(related_id, score), ...]}; only when `floors` is given).
+        """
+        canonical = ids == roots
+        # Column of each publication's cluster root, to exclude it below.
+        row_of = {publication_id: row for row, publication_id in enumerate(ids.tolist())}
+        root_rows = np.array([row_of.get(root, -1) for root in roots.tolist()], dtype=np.int64)
+        is_new = np.zeros(len(ids), dtype=bool)
+        is_new[new_rows] = True
+        transposed = matrix.T.tocsr()
+
+        lists, improved = {}, {}
+        chunk_size = max(1, CHUNK_CELLS // len(ids))
+        for start in range(0, len(new_rows), chunk_size):
+            chunk = new_rows[start:start + chunk_size]
+            scores = (matrix[chunk] @ transposed).toarray()
+
+            if floors is not None:
+                # Similarity is symmetric: column i of a new canonical
+                # publication's row is its score as a neighbour of older
+                # publication i, unless i is one of its duplicates.
+                beats = canonical[chunk][:, None] & ~is_new[None, :] & (scores > floors[None, :])
+                for chunk_row, row in zip(*np.nonzero(beats)):
+                    if root_rows[row] != chunk[chunk_row]:
+                        improved.setdefault(int(row), []).append(
+                            (int(ids[chunk[chunk_row]]), float(scores[chunk_row, row])))
+
+            scores[:, ~canonical] = 0
+            own = root_rows[chunk] >= 0
+            scores[np.flatnonzero(own), root_rows[chunk][own]] = 0
+            columns, values = top_neighbours(scores, self.k)
+            for row, related_rows, related_scores in zip(chunk.tolist(), columns, values):
+                keep = related_scores >= self.min_score
+                lists[int(ids[row])] = list(zip(ids[related_rows[keep]].tolist(), related_scores[keep].tolist()))
+        return lists, improved
+
+    def _merge(self, improved, ids):
+        """New neighbour lists for older publications that gained better neighbours."""
+        if not improved:
+            return {}
+        merged = {int(ids[row]): dict(candidates) for row, candidates in improved.items()}
+        publication_ids = list(merged)
+        with self.engine.connect() as connection:
+            for start in range(0, len(publication_ids), IN_CHUNK_SIZE):
+                rows = connection.execute(STORED_LISTS_SQL, {'ids': publication_ids[start:start + IN_CHUNK_SIZE]})
+                for publication_id, related_id, score in rows:
+                    merged[publication_id].setdefault(related_id, score)
+        return {
+            publication_id: sorted(candidates.items(), key=lambda item: (-item[1], item[0]))[:self.k]
+            for publication_id, candidates in merged.items()
+        }
+
+    def _write(self, lists, full, vocabulary, idf, last_id, documents):
+        """
+        Replaces the lists in one transaction, so readers see either the old
+        or the new neighbours, with the model bookkeeping.
+        """
+        rows = [
+            {'publication_id': publication_id, 'rank': rank, 'related_id': related_id, 'score': round(score, 4)}
+            for publication_id, neighbours in lists.items()
+            for rank, (related_id, score) in enumerate(neighbours)
+        ]
+        with self.engine.begin() as connection:
+            if full:
+                connection.execute(text("DELETE FROM related_publications"))
+                connection.execute(text("DELETE FROM related_terms"))
+                connection.execute(text("INSERT INTO related_terms (term, idf) VALUES (:term, :idf)"), [
+                    {'term': term, 'idf': float(idf[column])} for term, column in vocabulary.items()
+                ])
+                connection.execute(SET_META_SQL, {'key': DOCUMENTS_KEY, 'value': documents})
+                connection.execute(SET_META_SQL, {'key': K_KEY, 'value': self.k})
+            else:
+                publication_ids = list(lists)
+                for start in range(0, len(publication_ids), IN_CHUNK_SIZE):
+                    connection.execute(DELETE_LISTS_SQL, {'ids': publication_ids[start:start + IN_CHUNK_SIZE]})
+            if rows:
+                connection.execute(INSERT_RELATED_SQL, rows)
+            connection.execute(SET_META_SQL, {'key': LAST_ID_KEY, 'value': last_id})
@@ -1,53 +1,282 @@
-from flask import Blueprint, render_template, request, current_app
-from sqlalchemy import func
-from app.models import Publication, PublicationFTS, Author
-from app.database import get_db
+from functools import partial
+
+from flask import Blueprint, Response, render_template, request, current_app, jsonify, abort, g
+from sqlalchemy.exc import OperationalError
+from app.database import get_read_session
+from app.search import search_publications, browse_publications, mark_highlights, SearchFilters, SORT_MODES, DEFAULT_SORT
+from app.facets import facet_counts, author_names
+from app.authors import get_author, author_variants
+from app.spelling import suggest_queries, dump_suggestions, load_suggestions
+from app.related import related_publications, publication_exists, DEFAULT_K as RELATED_LIMIT
+from app.cache import ResultCache, get_index_generation, dump_facets, load_facets
+from app.snapshot import Snapshot
+from app.metrics import REGISTRY
 
 bp = Blueprint('main', __name__)
 
+# Renders highlight()/snippet() fragments with <mark> tags, escaping everything else.
+bp.add_app_template_filter(mark_highlights, 'highlight')
+
+# Upper bound on ?author= filters per request; each one adds a subquery.
+MAX_AUTHOR_FILTERS = 5
+
+# Upper bound on ?limit= for related publications (lists hold build_related.py --k entries).
+MAX_RELATED_LIMIT = 50
+
+def search_args(args):
+    """
+    Reads the shared search parameters (query, sort, page size, cursors,
+    year range and author filters) from a request's query string, falling
+    back to defaults for invalid values. Whether near-duplicates are
+    collapsed comes from the app config.
+    """
+    query = args.get('query', '').strip()
+    sort = args.get('sort', DEFAULT_SORT)
+    if sort not in SORT_MODES:
+        sort = DEFAULT_SORT
+    page_size = args.get('per_page', current_app.config['SEARCH_PAGE_SIZE'], type=int)
+    page_size = max(1, min(page_size, current_app.config['SEARCH_MAX_PAGE_SIZE']))
+    year_from = args.get('year_from', type=int)
+    year_to = args.get('year_to', type=int)
+    if year_from is not None and year_to is not None and year_from > year_to:
+        year_from, year_to = year_to, year_from
+    authors = tuple(sorted(set(args.getlist('author', type=int))))[:MAX_AUTHOR_FILTERS]
+    return {
+        'query': query,
+        'sort': sort,
+        'page_size': page_size,
+        'after': args.get('after') or None,
+        'before': args.get('before') or None,
+        'year_from': year_from,
+        'year_to': year_to,
+        'authors': authors,
+        'collapse': current_app.config['SEARCH_COLLAPSE_DUPLICATES'],
+    }
+
+def search_filters(params):
+    """SearchFilters for parsed search_args(), or None when nothing is filtered."""
+    if params['year_from'] is None and params['year_to'] is None and not params['authors']:
+        return None
+    return SearchFilters(params['year_from'], params['year_to'], params['authors'])
+
+def search_source():
+    """
+    What the search page reads from: the request's read session, or with
+    SEARCH_BACKEND=snapshot the published snapshot (see app/snapshot.py).
+    It is taken once per request, so a page is never built from two
+    snapshots when a newer one is swapped in.
+    """
+    store = current_app.extensions.get('snapshot_store')
+    if store is None:
+        return get_read_session()
+    if 'snapshot' not in g:
+        g.snapshot = store.current()
+    return g.snapshot
+
+def index_generation(db_session):
+    """Generation for cache keys: the snapshot's own, or the database's current one."""
+    if isinstance(db_session, Snapshot):
+        return db_session.generation
+    return get_index_generation(db_session)
+
+def run_search(db_session, params):
+    """
+    Returns the SearchPage for parsed search_args(): a ranked full-text
+    search when there is a query, otherwise the newest publications.
+    `db_session` may also be a Snapshot from search_source().
+    """
+    if isinstance(db_session, Snapshot):
+        search, browse = db_session.search_publications, db_session.browse_publications
+    else:
+        search, browse = partial(search_publications, db_session), partial(browse_publications, db_session)
+    if params['query']:
+        return search(
+            params['query'], sort=params['sort'], page_size=params['page_size'],
+            after=params['after'], before=params['before'],
+            title_weight=current_app.config['SEARCH_TITLE_WEIGHT'],
+            abstract_weight=current_app.config['SEARCH_ABSTRACT_WEIGHT'],
+            recency_boost=current_app.config['SEARCH_RECENCY_BOOST'],
+            filters=search_filters(params), collapse=params['collapse'],
+        )
+    return browse(page_size=params['page_size'], after=params['after'], before=params['before'],
+                  filters=search_filters(params), collapse=params['collapse'])
+
+def cached_search(db_session, params):
+    """
+    run_search() behind the result cache. The key includes the current index
+    generation, so anything cached before the last ingest commit is ignored.
+    """
+    cache = current_app.extensions.get('result_cache')
+    if cache is None:
+        return run_search(db_session, params)
+    generation = index_generation(db_session)
+    key = ResultCache.make_key(generation, params)
+    page = cache.get(key)
+    if page is None:
+        page = run_search(db_session, params)
+        cache.put(key, generation, page)
+    return page
+
+def cached_facets(db_session, params):
+    """Facet counts for parsed search_args(), cached like cached_search()."""
+    counts = db_session.facet_counts if isinstance(db_session, Snapshot) else partial(facet_counts, db_session)
+
+    def compute():
+        return counts(params['query'], search_filters(params), author_limit=current_app.config['FACET_AUTHOR_LIMIT'])
+
+    cache = current_app.extensions.get('result_cache')
+    if cache is None:
+        return compute()
+    generation = index_generation(db_session)
+    key = ResultCache.make_key(generation, params, kind='facets')
+    facets = cache.get(key, load=load_facets)
+    if facets is None:
+        facets = compute()
+        cache.put(key, generation, facets, dump=dump_facets)
+    return facets
+
+def cached_suggestions(db_session, params):
+    """
+    "Did you mean" suggestions for a search without results, within the
+    SEARCH_SPELLING_BUDGET_MS latency budget, cached like cached_facets().
+    Snapshots carry no spelling dictionary, so they get none.
+    """
+    budget = current_app.config['SEARCH_SPELLING_BUDGET_MS']
+    if not params['query'] or budget <= 0 or isinstance(db_session, Snapshot):
+        return []
+    cache = current_app.extensions.get('result_cache')
+    if cache is None:
+        return suggest_queries(db_session, params['query'], budget)
+    generation = index_generation(db_session)
+    key = ResultCache.make_key(generation, params, kind='suggestions')
+    suggestions = cache.get(key, load=load_suggestions)
+    if suggestions is None:
+        suggestions = suggest_queries(db_session, params['query'], budget)
+        cache.put(key, generation, suggestions, dump=dump_suggestions)
+    return suggestions
+
+def corrected_search(db_session, params, page):
+    """
+    Typo-tolerant fallback for the first page of a search without results:
+    returns (params, page, corrected query or None, suggestions). When the
+    best suggestion has results (with the current filters) they replace the
+    empty page; the other suggestions are offered as links.
+    """
+    if page.hits or not params['query'] or params['after'] or params['before']:
+        return params, page, None, []
+    suggestions = cached_suggestions(db_session, params)
+    if not suggestions:
+        return params, page, None, []
+    corrected = dict(params, query=suggestions[0].query)
+    corrected_page = cached_search(db_session, corrected)
+    if not corrected_page.hits:
+        return params, page, None, suggestions
+    return corrected, corrected_page, suggestions[0].query, suggestions[1:]
+
 @bp.route('/', methods=['GET'])
 def index():
     """
     Renders the homepage with a search bar and displays initial or search results.
     """
-    query = request.args.get('query', '').strip()
+    params = search_args(request.args)
+    query = params['query']
     publications = []
+    next_cursor = prev_cursor = None
+    facets = None
+    selected_authors = {}
+    corrected_query = None
+    suggestions = []
     error_message = None
 
-    db_session = None # Initialize db_session to ensure it's closed in finally block
-
     try:
-        db_session = next(get_db()) # Get a database session
-
-        if query:
-            # Perform FTS search
-            # The 'MATCH' operator in SQLite FTS5 requires the FTS table name followed by the query.
-            # SQLAlchemy's .matches() method simplifies this.
-            fts_results = db_session.query(PublicationFTS.rowid).filter(PublicationFTS.matches(query)).limit(50).all()
-
-            # Extract publication IDs from FTS results
-            publication_ids = [r.rowid for r in fts_results]
-
-            if publication_ids:
-                # Fetch full publication details from the main publications table
-                # Ensure publications are ordered for consistent display, e.g., by year and title
-                publications = db_session.query(Publication)\
-                                         .filter(Publication.id.in_(publication_ids))\
-                                         .order_by(Publication.publication_year.desc().nulls_last(), Publication.title.asc())\
-                                         .all()
-            else:
-                error_message = "No publications found matching your query."
+        db_session = search_source()
 
+        try:
+            page = cached_search(db_session, params)
+        except ValueError:
+            # A stale or tampered cursor: start again from the first page.
+            page = cached_search(db_session, dict(params, after=None, before=None))
+        params, page, corrected_query, suggestions = corrected_search(db_session, params, page)
+        publications, next_cursor, prev_cursor = page
+        facets = cached_facets(db_session, params)
+        if isinstance(db_session, Snapshot):
+            selected_authors = db_session.author_names(params['authors'])
         else:
-            # If no query, display some recent publications or a welcome message
-            publications = db_session.query(Publication)\
-                                     .order_by(Publication.publication_year.desc().nulls_last(), Publication.id.desc())\
-                                     .limit(10).all() # Show a few recent ones
+            selected_authors = author_names(db_session, params['authors'])
+
+        if query and not publications:
+            error_message = "No publications found matching your query."
+    except OperationalError as e:
+        # Queries are rewritten as safe FTS5 syntax (app/query.py), so this
+        # is not expected to be the user's fault, but say what failed.
+        current_app.logger.info(f"Rejected search query {query!r}: {e.orig}")
+        error_message = "Your search could not be run. Try fewer or simpler search terms."
     except Exception as e:
         current_app.logger.error(f"Database error in index route: {e}")
         error_message = "An error occurred while retrieving publications. Please try again later."
-    finally:
-        if db_session:
-            db_session.close()
 
-    return render_template('index.html', publications=publications, query=query, error_message=error_message)
+    # Current search as url_for() arguments, for links that change one part of it.
+    search_state = {
+        'query': params['query'] or None,
+        'sort': params['sort'],
+        'per_page': params['page_size'],
+        'year_from': params['year_from'],
+        'year_to': params['year_to'],
+        'author': list(params['authors']),
+    }
+    return render_template('index.html', publications=publications, query=query, sort=params['sort'],
+                           sort_modes=SORT_MODES, per_page=params['page_size'],
+                           next_cursor=next_cursor, prev_cursor=prev_cursor, error_message=error_message,
+                           facets=facets, selected_authors=selected_authors,
+                           corrected_query=corrected_query, suggestions=suggestions,
+                           year_from=params['year_from'], year_to=params['year_to'], search_state=search_state)
+
+@bp.route('/author/<int:author_id>', methods=['GET'])
+def author(author_id):
+    """
+    An author's publications, newest first, with the same keyset pagination
+    (and result cache) as the search page.
+    """
+    db_session = get_read_session()
+    profile = get_author(db_session, author_id)
+    if profile is None:
+        abort(404)
+
+    params = dict(search_args(request.args), query='', authors=(author_id,), year_from=None, year_to=None)
+    try:
+        page = cached_search(db_session, params)
+    except ValueError:
+        page = cached_search(db_session, dict(params, after=None, before=None))
+
+    return render_template('author.html', author=profile, variants=author_variants(db_session, profile),
+                           publications=page.hits, per_page=params['page_size'],
+                           next_cursor=page.next_cursor, prev_cursor=page.prev_cursor)
+
+@bp.route('/publication/<int:publication_id>/related', methods=['GET'])
+def related(publication_id):
+    """
+    The precomputed related publications of a publication (see
+    app/related.py), most similar first, one primary-key range scan.
+    """
+    limit = max(1, min(request.args.get('limit', RELATED_LIMIT, type=int), MAX_RELATED_LIMIT))
+    db_session = get_read_session()
+    hits = related_publications(db_session, publication_id, limit)
+    if not hits and not publication_exists(db_session, publication_id):
+        abort(404)
+    return jsonify({
+        'id': publication_id,
+        'related': [hit._asdict() for hit in hits],
+    })
+
+@bp.route('/stats/cache', methods=['GET'])
+def cache_stats():
+    """Hit/miss/eviction counters of the search result cache."""
+    cache = current_app.extensions.get('result_cache')
+    return jsonify(cache.stats() if cache is not None else {'enabled': False})
+
+@bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Request, SQL and crawler metrics in the Prometheus text format."""
+    if not current_app.config['METRICS_ENABLED']:
+        abort(404)
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,354 @@
+# app/search.py
+import base64
+import binascii
+import json
+from collections import namedtuple
+from datetime import date
+
+from markupsafe import Markup, escape
+from sqlalchemy import bindparam, text
+
+from app.query import match_expression
+
+# One search result row. 'title_highlight' and 'snippet' carry the raw
+# HIGHLIGHT_OPEN/HIGHLIGHT_CLOSE markers; render them with mark_highlights().
+# 'duplicates' is the number of near-duplicates (see app/dedup.py) folded
+# into this hit when results are collapsed.
+# 'authors' is a tuple of AuthorRefs, filled in by attach_authors().
+SearchHit = namedtuple('SearchHit', [
+    'id', 'title', 'publication_link', 'publication_year', 'abstract',
+    'rank', 'title_highlight', 'snippet', 'duplicates', 'authors',
+], defaults=[0, ()])
+
+AuthorRef = namedtuple('AuthorRef', ['name', 'author_link', 'id'], defaults=[None])
+
+# One page of results plus opaque cursors for the neighbouring pages
+# (None when there is nothing in that direction).
+SearchPage = namedtuple('SearchPage', ['hits', 'next_cursor', 'prev_cursor'])
+
+# Narrows a search or listing: an inclusive year range (either end may be
+# None) and author ids that must all appear on a publication.
+SearchFilters = namedtuple('SearchFilters', ['year_from', 'year_to', 'author_ids'], defaults=[None, None, ()])
+
+SORT_MODES = ('relevance', 'newest')
+DEFAULT_SORT = 'relevance'
+
+# Control characters can't appear in scraped text, so they make safe markers
+# that are swapped for <mark> only after the surrounding text is escaped.
+HIGHLIGHT_OPEN = '\x02'
+HIGHLIGHT_CLOSE = '\x03'
+SNIPPET_ELLIPSIS = '…'
+SNIPPET_TOKENS = 24
+
+HIT_COLUMNS = "id, title, publication_link, publication_year, abstract, rank, title_highlight, snippet, duplicates"
+
+HIGHLIGHT_COLUMNS = """highlight(publications_fts, 0, :open, :close) AS title_highlight,
+           snippet(publications_fts, 1, :open, :close, :ellipsis, :snippet_tokens) AS snippet"""
+# highlight() and snippet() re-tokenize every matched row, so callers that
+# don't show them (e.g. API clients that didn't ask) can skip the work.
+NO_HIGHLIGHT_COLUMNS = "NULL AS title_highlight, NULL AS snippet"
+
+# bm25() is negative and lower means better. The relevance score is scaled
+# up by (1 + boost / (1 + age in years)), so a boost of 0 leaves pure bm25 and
+# larger values favour recent publications.
+SEARCH_SQL = """
+SELECT """ + HIT_COLUMNS + """ FROM (
+    SELECT p.id, p.title, p.publication_link, p.publication_year, p.abstract,
+           bm25(publications_fts, :title_weight, :abstract_weight)
+               * (1.0 + :recency_boost / (1 + max(0, :current_year - coalesce(p.publication_year, 0)))) AS rank,
+           {highlights},
+           {duplicates} AS duplicates,
+           coalesce(p.publication_year, 0) AS year_key
+    FROM publications_fts
+    JOIN publications p ON p.id = publications_fts.rowid
+    WHERE publications_fts MATCH :query
+    {members}
+) AS hits
+{where}
+ORDER BY {order_by}
+LIMIT :limit
+"""
+
+# Each near-duplicate cluster among the results is shown once: as its
+# canonical publication if that is a result, else as its earliest member
+# that is. {canonical} and {earlier} hold the conditions for being a result
+# (matching the query, passing the filters) on those two rows, so a cluster
+# whose canonical publication is filtered out is still shown through a
+# duplicate that passes. Canonical rows (almost all of them) pass on the
+# first test, so the subqueries only run for duplicates; the match set is
+# built once.
+COLLAPSE_CONDITION = """(p.canonical_id IS NULL
+         OR (NOT EXISTS (SELECT 1 FROM publications c WHERE c.id = p.canonical_id{canonical})
+             AND NOT EXISTS (SELECT 1 FROM publications d
+                             WHERE d.canonical_id = p.canonical_id AND d.id < p.id{earlier})))"""
+
+MATCHED_CONDITION = "{alias}.id IN (SELECT rowid FROM publications_fts WHERE publications_fts MATCH :query)"
+
+# Other members of a hit's cluster, served by ix_publications_canonical_id.
+CLUSTER_DUPLICATES = "(SELECT count(*) FROM publications d WHERE d.canonical_id = coalesce(p.canonical_id, p.id))"
+
+# Listing without a query; served by ix_publications_year_id.
+BROWSE_SQL = """
+SELECT """ + HIT_COLUMNS + """ FROM (
+    SELECT p.id, p.title, p.publication_link, p.publication_year, p.abstract,
+           NULL AS rank, NULL AS title_highlight, NULL AS snippet,
+           {duplicates} AS duplicates,
+           coalesce(p.publication_year, 0) AS year_key
+    FROM publications p
+    {members}
+) AS hits
+{where}
+ORDER BY {order_by}
+LIMIT :limit
+"""
+
+
+def member_conditions(filters, collapse, matched):
+    """
+    Conditions on publications p for being in the result set: passing
+    SearchFilters and, with `collapse`, standing for its cluster. `matched`
+    adds the query's match set to the tests on the other cluster members.
+    """
+    conditions = filter_conditions(filters, 'p')[0]
+    if collapse:
+        def result(alias):
+            tests = [MATCHED_CONDITION.format(alias=alias)] if matched else []
+            return ''.join(f" AND {test}" for test in tests + filter_conditions(filters, alias)[0])
+        conditions.append(COLLAPSE_CONDITION.replace('{canonical}', result('c')).replace('{earlier}', result('d')))
+    return conditions
+
+
+def search_sql(with_highlights=True, collapse=True, filters=None):
+    """SEARCH_SQL with highlights, filters and collapsing filled in; {where} and {order_by} are left to the caller."""
+    members = ''.join(f"AND {condition}\n    " for condition in member_conditions(filters, collapse, True))
+    return (SEARCH_SQL.replace('{highlights}', HIGHLIGHT_COLUMNS if with_highlights else NO_HIGHLIGHT_COLUMNS)
+            .replace('{duplicates}', CLUSTER_DUPLICATES if collapse else '0')
+            .replace('{members}', members.rstrip()))
+
+
+def browse_sql(collapse=True, filters=None):
+    """BROWSE_SQL for collapsed (one publication per cluster) or full listings, with filters filled in."""
+    return (BROWSE_SQL.replace('{duplicates}', CLUSTER_DUPLICATES if collapse else '0')
+            .replace('{members}', _where(member_conditions(filters, collapse, False))))
+
+
+# Keyset definition per sort mode: the columns that make up the cursor and
+# whether the natural order is descending. NULL years sort as 0, i.e. last.
+KEYSETS = {
+    'relevance': (('rank', 'id'), False),
+    'newest': (('year_key', 'id'), True),
+}
+
+
+def encode_cursor(sort, key):
+    """Packs a sort mode and keyset values into an opaque URL-safe token."""
+    payload = json.dumps([sort, list(key)], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, sort):
+    """
+    Unpacks a token from encode_cursor(). Raises ValueError if it is malformed
+    or was issued for a different sort mode.
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        cursor_sort, key = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (binascii.Error, ValueError, TypeError, UnicodeError) as e:
+        raise ValueError(f"Malformed cursor: {e}")
+    if cursor_sort != sort or not isinstance(key, list) or len(key) != len(KEYSETS[sort][0]):
+        raise ValueError("Cursor does not belong to this sort mode")
+    return key
+
+
+def filter_conditions(filters, alias=None):
+    """
+    SQL conditions and bind parameters for SearchFilters, written against the
+    columns of a hits subquery or, given an `alias`, of that publications
+    row. The year range uses the year key so that it is served by
+    ix_publications_year_id; each author is a lookup in
+    ix_publication_authors_author_publication.
+    """
+    conditions, params = [], {}
+    if filters is None:
+        return conditions, params
+    year_key, id_column = (f"coalesce({alias}.publication_year, 0)", f"{alias}.id") if alias else ('year_key', 'id')
+    if filters.year_from is not None:
+        conditions.append(f"{year_key} >= :year_from")
+        params['year_from'] = filters.year_from
+    if filters.year_to is not None:
+        conditions.append(f"{year_key} <= :year_to")
+        params['year_to'] = filters.year_to
+    for i, author_id in enumerate(filters.author_ids):
+        conditions.append(f"{id_column} IN (SELECT publication_id FROM publication_authors_association "
+                          f"WHERE author_id = :author{i})")
+        params[f'author{i}'] = author_id
+    return conditions, params
+
+
+def _where(conditions):
+    return f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+
+def _keyset_clause(sort, backward):
+    """
+    Condition and ORDER BY for one direction of a keyset page. The extra bound
+    on the leading key column lets SQLite seek into an index instead of
+    scanning from the top.
+    """
+    columns, descending = KEYSETS[sort]
+    # Moving forward through a descending order means looking for smaller keys.
+    smaller = descending != backward
+    operator = '<' if smaller else '>'
+    condition = (f"{columns[0]} {operator}= :k0 "
+                 f"AND ({', '.join(columns)}) {operator} ({', '.join(f':k{i}' for i in range(len(columns)))})")
+    direction = 'DESC' if smaller else 'ASC'
+    order_by = ', '.join(f"{column} {direction}" for column in columns)
+    return condition, order_by
+
+
+def _page(session, sql_template, sort, params, page_size, after=None, before=None, filters=None):
+    """
+    Runs one keyset-paginated page. `after`/`before` are cursors from a
+    previous page; at most one is used. `filters` must be the ones
+    `sql_template` was built with; only their bind parameters are added
+    here. Fetches one extra row to learn whether another page exists in the
+    direction of travel.
+    """
+    columns, descending = KEYSETS[sort]
+    cursor, backward = (before, True) if before else (after, False)
+    conditions = []
+    params = dict(params, limit=page_size + 1, **filter_conditions(filters)[1])
+    if cursor:
+        key = decode_cursor(cursor, sort)
+        condition, order_by = _keyset_clause(sort, backward)
+        conditions.append(condition)
+        params.update({f'k{i}': value for i, value in enumerate(key)})
+    else:
+        order_by = _keyset_clause(sort, False)[1]
+
+    sql = sql_template.format(where=_where(conditions), order_by=order_by)
+    rows = session.execute(text(sql), params).fetchall()
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backward:
+        rows.reverse()
+    hits = [SearchHit(*row) for row in rows]
+    if not hits:
+        return SearchPage([], None, None)
+
+    def key_of(hit):
+        return [(hit.publication_year or 0) if column == 'year_key' else getattr(hit, column) for column in columns]
+
+    more_after = has_more if not backward else True
+    more_before = bool(cursor) if not backward else has_more
+    return SearchPage(
+        attach_authors(session, hits),
+        encode_cursor(sort, key_of(hits[-1])) if more_after else None,
+        encode_cursor(sort, key_of(hits[0])) if more_before else None,
+    )
+
+
+def _search_params(query, title_weight, abstract_weight, recency_boost):
+    return {
+        'query': query,
+        'title_weight': title_weight,
+        'abstract_weight': abstract_weight,
+        'recency_boost': recency_boost,
+        'current_year': date.today().year,
+        'open': HIGHLIGHT_OPEN,
+        'close': HIGHLIGHT_CLOSE,
+        'ellipsis': SNIPPET_ELLIPSIS,
+        'snippet_tokens': SNIPPET_TOKENS,
+    }
+
+
+def search_publications(session, query, sort=DEFAULT_SORT, page_size=20, after=None, before=None,
+                        title_weight=10.0, abstract_weight=1.0, recency_boost=0.0, filters=None, collapse=True):
+    """
+    Runs a full-text search (the query is parsed and rewritten as safe FTS5
+    syntax by app/query.py) as a single query over publications_fts joined to
+    publications, ordered by weighted bm25 (sort='relevance', keyset on
+    (rank, id)) or newest year first (sort='newest', keyset on (year, id)),
+    optionally narrowed by SearchFilters. With `collapse`, near-duplicates
+    are folded into one hit. Returns a SearchPage.
+    """
+    if sort not in KEYSETS:
+        raise ValueError(f"Unknown sort mode: {sort}")
+    match = match_expression(query)
+    if match is None:
+        return SearchPage([], None, None) # Nothing searchable, e.g. only punctuation
+    return _page(session, search_sql(collapse=collapse, filters=filters), sort,
+                 _search_params(match, title_weight, abstract_weight, recency_boost),
+                 page_size, after, before, filters)
+
+
+def browse_publications(session, page_size=20, after=None, before=None, filters=None, collapse=True):
+    """
+    Lists all publications (or those passing SearchFilters) newest first,
+    keyset-paginated on (year, id); one per near-duplicate cluster with
+    `collapse`. Returns a SearchPage.
+    """
+    return _page(session, browse_sql(collapse, filters), 'newest', {}, page_size, after, before, filters)
+
+
+def iter_publications(connection, query=None, sort=DEFAULT_SORT, batch_size=500, with_highlights=True,
+                      with_authors=True, title_weight=10.0, abstract_weight=1.0, recency_boost=0.0,
+                      filters=None, collapse=True):
+    """
+    Yields every SearchHit matching `query` (all publications when empty) and
+    `filters` in the same order as the paginated functions, without a LIMIT.
+    Rows are pulled from the cursor `batch_size` at a time and authors are
+    loaded per batch, so memory stays flat however large the result set is.
+    """
+    if not query:
+        sql, params, sort = browse_sql(collapse, filters), {}, 'newest'
+    elif sort not in KEYSETS:
+        raise ValueError(f"Unknown sort mode: {sort}")
+    else:
+        match = match_expression(query)
+        if match is None:
+            return
+        sql = search_sql(with_highlights, collapse, filters)
+        params = _search_params(match, title_weight, abstract_weight, recency_boost)
+    order_by = _keyset_clause(sort, False)[1]
+    params = dict(params, limit=-1, **filter_conditions(filters)[1]) # A negative LIMIT means no limit in SQLite
+
+    result = connection.execution_options(yield_per=batch_size).execute(
+        text(sql.format(where='', order_by=order_by)), params
+    )
+    for rows in result.partitions(batch_size):
+        hits = [SearchHit(*row) for row in rows]
+        if with_authors:
+            hits = attach_authors(connection, hits)
+        yield from hits
+
+
+AUTHORS_SQL = text("""
+SELECT x.publication_id, a.name, a.author_link, a.id
+FROM publication_authors_association x
+JOIN authors a ON a.id = x.author_id
+WHERE x.publication_id IN :ids
+ORDER BY x.rowid
+""").bindparams(bindparam('ids', expanding=True))
+
+
+def attach_authors(session, hits):
+    """Loads the authors of every hit with one IN query and returns the updated hits."""
+    if not hits:
+        return hits
+    authors = {}
+    for publication_id, name, author_link, author_id in session.execute(AUTHORS_SQL, {'ids': [hit.id for hit in hits]}):
+        authors.setdefault(publication_id, []).append(AuthorRef(name, author_link, author_id))
+    return [hit._replace(authors=tuple(authors.get(hit.id, ()))) for hit in hits]
+
+
+def mark_highlights(value):
+    """
+    Escapes a highlight()/snippet() fragment and turns its match markers into
+    <mark> tags. Used as the 'highlight' template filter.
+    """
+    if not value:
+        return ''
+    escaped = str(escape(value))
+    return Markup(escaped.replace(HIGHLIGHT_OPEN, '<mark>').replace(HIGHLIGHT_CLOSE, '</mark>'))
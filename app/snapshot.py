@@ -0,0 +1,949 @@
+# app/snapshot.py
+import json
+import math
+import mmap
+import os
+import re
+import shutil
+import threading
+import time
+from bisect import bisect_right
+from collections import namedtuple
+from datetime import date, datetime, timezone
+from functools import reduce
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from app.cache import GENERATION_KEY
+from app.facets import Facets, YearCount, AuthorCount
+from app.metrics import SEARCH_SNAPSHOT_GENERATION, SEARCH_SNAPSHOT_SWAPS
+from app.query import parse_query
+from app.search import (SearchHit, SearchPage, AuthorRef, KEYSETS, DEFAULT_SORT, HIGHLIGHT_OPEN, HIGHLIGHT_CLOSE,
+                        SNIPPET_ELLIPSIS, SNIPPET_TOKENS, decode_cursor, encode_cursor)
+from app.spelling import index_terms, tokenizer_option
+
+# Read-only search snapshots for web replicas. scripts/export_snapshot.py
+# compiles publications, authors and the publications_fts index into a
+# directory of flat files; web workers started with SEARCH_BACKEND=snapshot
+# serve the search page from it instead of the database:
+#
+#   <SNAPSHOT_DIR>/CURRENT          name of the snapshot to serve
+#   <SNAPSHOT_DIR>/<version>/       one immutable snapshot
+#       manifest.json               format, generation, counts, tokenizer
+#       *.npy                       numpy arrays, memory-mapped read-only
+#       *.bin                       UTF-8 strings, sliced by <name>_offsets.npy
+#
+# Rows of the doc_* arrays are publications in id order. The inverted index
+# holds the index's own terms (read through an fts5vocab 'instance' table,
+# so stemming is exactly the database's) sorted as bytes, which keeps the
+# terms of a prefix query contiguous. The postings of term t are
+# term_postings[t]:term_postings[t + 1]: a document row and per-column term
+# counts each, with their token positions at
+# position_offsets[p]:position_offsets[p + 1] in `positions` (the column in
+# the top bit). Opening a snapshot maps the files without reading them, so
+# every worker on a host shares one copy in the page cache.
+#
+# Exports are written to a hidden directory and renamed into place, then
+# CURRENT is replaced atomically. Workers look at CURRENT at most every
+# SNAPSHOT_CHECK_INTERVAL seconds and switch between requests; a request
+# keeps the snapshot it started with.
+
+FORMAT = 1
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', 'snapshots')
+CURRENT_FILE = 'CURRENT'
+MANIFEST_FILE = 'manifest.json'
+STAGING_PREFIX = '.'
+# Published snapshots kept on disk, the current one included, so a bad
+# export can be rolled back with `export_snapshot.py --publish`.
+KEEP_SNAPSHOTS = 3
+# Unfinished exports older than this are assumed to have crashed.
+STALE_STAGING_SECONDS = 24 * 3600
+VERSION_PATTERN = re.compile(r'^\d{8}T\d{6}\.\d{6}-g\d+$')
+
+# Instance rows fetched from the fts5vocab table at a time.
+EXPORT_BATCH_SIZE = 200_000
+
+# A position is (column << COLUMN_SHIFT) | token offset in the column.
+COLUMN_SHIFT = 31
+OFFSET_MASK = (1 << COLUMN_SHIFT) - 1
+TITLE_COLUMN, ABSTRACT_COLUMN = 0, 1
+MAX_TERM_COUNT = np.iinfo(np.uint16).max
+
+# FTS5's bm25() constants, so ranks match the database's.
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# How the tokenizer splits text, for turning token positions back into
+# character ranges in highlights and snippets ('unicode61' separates on
+# everything but letters and numbers).
+TOKEN_PATTERN = re.compile(r'[^\W_]+')
+
+INSTANCES_SQL = """SELECT term, doc, ((col = 'abstract') << 31) | "offset" FROM temp.snapshot_instances"""
+
+
+class SnapshotError(RuntimeError):
+    """A snapshot is missing, incomplete or doesn't match the database it is exported from."""
+
+
+# Matches of one query term: the rows containing it (sorted) and how often
+# it occurs in each column of them. 'tokens' are the term id ranges of its
+# tokens (a prefix term's last token covers every term with that prefix);
+# 'column' is the column it is restricted to, or None.
+PhraseMatch = namedtuple('PhraseMatch', ['rows', 'title', 'abstract', 'tokens', 'column'])
+
+
+# --- Files ---
+
+def _path(directory, name):
+    return os.path.join(directory, name)
+
+
+def _fsync(path):
+    descriptor = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+def _save(directory, name, array):
+    np.save(_path(directory, name + '.npy'), array)
+
+
+class StringWriter:
+    """Appends strings to <name>.bin and records where each one starts in <name>_offsets.npy."""
+
+    def __init__(self, directory, name):
+        self.directory = directory
+        self.name = name
+        self.file = open(_path(directory, name + '.bin'), 'wb')
+        self.offsets = [0]
+
+    def append(self, value):
+        data = (value or '').encode('utf-8')
+        self.file.write(data)
+        self.offsets.append(self.offsets[-1] + len(data))
+
+    def close(self):
+        self.file.close()
+        _save(self.directory, self.name + '_offsets', np.array(self.offsets, dtype=np.int64))
+
+
+class StringColumn:
+    """Read side of StringWriter: the i-th string, sliced straight out of the mapped file."""
+
+    def __init__(self, directory, name):
+        self.offsets = _load(directory, name + '_offsets')
+        with open(_path(directory, name + '.bin'), 'rb') as handle:
+            size = os.fstat(handle.fileno()).st_size
+            self.data = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def raw(self, i):
+        return self.data[self.offsets[i]:self.offsets[i + 1]]
+
+    def __getitem__(self, i):
+        return self.raw(i).decode('utf-8')
+
+    def bisect(self, key):
+        """First index whose bytes are >= `key`; the strings must be sorted."""
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self.raw(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+
+def _load(directory, name):
+    path = _path(directory, name + '.npy')
+    try:
+        return np.load(path, mmap_mode='r')
+    except ValueError:
+        return np.load(path) # Empty arrays can't be mapped
+
+
+# --- Export ---
+
+class SnapshotWriter:
+    """Writes the files of one snapshot from a database cursor inside a read transaction."""
+
+    def __init__(self, directory, cursor, log=print):
+        self.directory = directory
+        self.cursor = cursor
+        self.log = log
+
+    def write(self, version, generation, tokenizer):
+        started = time.perf_counter()
+        ids = self.documents()
+        authors = self.authors(ids)
+        terms, postings, instances = self.index(ids)
+        manifest = {
+            'format': FORMAT,
+            'version': version,
+            'generation': generation,
+            'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'tokenizer': tokenizer,
+            'documents': len(ids),
+            'authors': authors,
+            'terms': terms,
+            'postings': postings,
+            'positions': instances,
+            'average_length': instances / len(ids) if len(ids) else 0.0,
+            'files': {name: os.path.getsize(_path(self.directory, name))
+                      for name in sorted(os.listdir(self.directory))},
+        }
+        with open(_path(self.directory, MANIFEST_FILE), 'w') as handle:
+            json.dump(manifest, handle, indent=2)
+        for name in os.listdir(self.directory):
+            _fsync(_path(self.directory, name))
+        _fsync(self.directory)
+        self.log(f"Snapshot {version}: {len(ids)} publications, {terms} terms, {postings} postings "
+                 f"in {time.perf_counter() - started:.1f}s.")
+        return manifest
+
+    def documents(self):
+        """The doc_* arrays and stored fields; returns the publication ids in row order."""
+        rows = self.cursor.execute(
+            "SELECT id, title, publication_link, publication_year, abstract, canonical_id FROM publications ORDER BY id"
+        )
+        ids, years, canonical = [], [], []
+        strings = [StringWriter(self.directory, name) for name in ('titles', 'links', 'abstracts')]
+        for publication_id, title, link, year, abstract, canonical_id in rows:
+            ids.append(publication_id)
+            years.append(year or 0)
+            canonical.append(canonical_id or 0)
+            for writer, value in zip(strings, (title, link, abstract)):
+                writer.append(value)
+        for writer in strings:
+            writer.close()
+        ids = np.array(ids, dtype=np.int64)
+        canonical = np.array(canonical, dtype=np.int64)
+
+        # Cluster size as CLUSTER_DUPLICATES counts it in app/search.py: the
+        # members pointing at coalesce(canonical_id, id).
+        clusters, sizes = np.unique(canonical[canonical > 0], return_counts=True)
+        roots = np.where(canonical > 0, canonical, ids)
+        at = np.minimum(np.searchsorted(clusters, roots), max(len(clusters) - 1, 0))
+        duplicates = np.where(clusters[at] == roots, sizes[at], 0) if len(clusters) else np.zeros(len(ids))
+
+        _save(self.directory, 'doc_ids', ids)
+        _save(self.directory, 'doc_years', np.array(years, dtype=np.int32))
+        _save(self.directory, 'doc_canonical', canonical)
+        _save(self.directory, 'doc_duplicates', duplicates.astype(np.int32))
+        return ids
+
+    def authors(self, ids):
+        """Author names and both directions of publication_authors_association; returns the author count."""
+        authors = self.cursor.execute("SELECT id, name, author_link FROM authors ORDER BY id").fetchall()
+        names, links = StringWriter(self.directory, 'author_display_names'), StringWriter(self.directory, 'author_links')
+        for _, name, link in authors:
+            names.append(name)
+            links.append(link)
+        names.close()
+        links.close()
+        author_ids = np.array([row[0] for row in authors], dtype=np.int64)
+
+        # In the order attach_authors() lists them (association rowid).
+        pairs = np.array(self.cursor.execute(
+            "SELECT publication_id, author_id FROM publication_authors_association "
+            "WHERE publication_id IS NOT NULL AND author_id IS NOT NULL ORDER BY publication_id, rowid"
+        ).fetchall(), dtype=np.int64).reshape(-1, 2)
+        doc_rows, valid = _rows_of(ids, pairs[:, 0])
+        author_rows, known = _rows_of(author_ids, pairs[:, 1])
+        doc_rows, author_rows = doc_rows[valid & known], author_rows[valid & known]
+
+        by_author = np.argsort(author_rows, kind='stable')
+        _save(self.directory, 'author_ids', author_ids)
+        _save(self.directory, 'doc_author_offsets', _offsets(doc_rows, len(ids)))
+        _save(self.directory, 'doc_authors', author_rows.astype(np.int32))
+        _save(self.directory, 'author_doc_offsets', _offsets(author_rows, len(author_ids)))
+        _save(self.directory, 'author_docs', doc_rows[by_author].astype(np.int32))
+        return len(author_ids)
+
+    def index(self, ids):
+        """
+        Streams every token instance of publications_fts into the postings
+        files, which are sized up front from the 'row' vocabulary. Returns
+        (terms, postings, positions).
+        """
+        cursor = self.cursor
+        cursor.execute("CREATE VIRTUAL TABLE temp.snapshot_terms USING fts5vocab(main, publications_fts, 'row')")
+        cursor.execute("CREATE VIRTUAL TABLE temp.snapshot_instances USING fts5vocab(main, publications_fts, 'instance')")
+        term_total, posting_total, instance_total = cursor.execute(
+            "SELECT count(*), coalesce(sum(doc), 0), coalesce(sum(cnt), 0) FROM temp.snapshot_terms"
+        ).fetchone()
+
+        def create(name, dtype, length):
+            return open_memmap(_path(self.directory, name + '.npy'), mode='w+', dtype=dtype, shape=(length,))
+
+        term_postings = create('term_postings', np.int64, term_total + 1)
+        postings_docs = create('postings_docs', np.int32, posting_total)
+        postings_title = create('postings_title', np.uint16, posting_total)
+        postings_abstract = create('postings_abstract', np.uint16, posting_total)
+        position_offsets = create('position_offsets', np.int64, posting_total + 1)
+        positions = create('positions', np.uint32, instance_total)
+        words = StringWriter(self.directory, 'terms')
+        lengths = np.zeros(len(ids), dtype=np.int64)
+
+        terms = postings = instances = 0
+        last_term, last_key, last_doc = None, b'', -1
+        cursor.execute(INSTANCES_SQL)
+        while True:
+            rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+            if not rows:
+                break
+            if instances + len(rows) > instance_total:
+                raise SnapshotError("publications_fts changed during the export")
+            chunk_terms, docs, packed = zip(*rows)
+            docs = np.array(docs, dtype=np.int64)
+            packed = np.array(packed, dtype=np.int64)
+            doc_rows, known = _rows_of(ids, docs)
+            if not known.all():
+                raise SnapshotError("publications_fts has rows that are not in publications; "
+                                    "run `manage_fts.py rebuild` first")
+
+            new_term = np.empty(len(rows), dtype=bool)
+            new_term[0] = chunk_terms[0] != last_term
+            new_term[1:] = [term != previous for term, previous in zip(chunk_terms[1:], chunk_terms)]
+            new_posting = new_term.copy()
+            new_posting[0] |= docs[0] != last_doc
+            new_posting[1:] |= docs[1:] != docs[:-1]
+            # Postings must come in term then document order for the offsets to work.
+            previous_docs = np.concatenate(([last_doc], docs[:-1]))
+            if np.any(~new_term & (docs < previous_docs)):
+                raise SnapshotError("fts5vocab returned instances out of document order")
+
+            posting = postings + np.cumsum(new_posting) - 1 # Posting index of every instance
+            for i in np.flatnonzero(new_term):
+                key = chunk_terms[i].encode('utf-8')
+                if key <= last_key and last_term is not None:
+                    raise SnapshotError("fts5vocab returned terms out of order")
+                words.append(chunk_terms[i])
+                last_term, last_key = chunk_terms[i], key
+            starts = np.flatnonzero(new_term)
+            term_postings[terms:terms + len(starts)] = posting[starts]
+            terms += len(starts)
+
+            starts = np.flatnonzero(new_posting)
+            postings_docs[posting[starts]] = doc_rows[starts]
+            position_offsets[posting[starts]] = instances + starts
+            local = posting - posting[0]
+            in_title = (packed >> COLUMN_SHIFT) == TITLE_COLUMN
+            for column, counts in ((postings_title, np.bincount(local, weights=in_title)),
+                                   (postings_abstract, np.bincount(local, weights=~in_title))):
+                span = slice(posting[0], posting[0] + len(counts))
+                column[span] = np.minimum(column[span] + counts, MAX_TERM_COUNT)
+
+            positions[instances:instances + len(rows)] = packed
+            lengths += np.bincount(doc_rows, minlength=len(ids))
+            instances += len(rows)
+            postings = int(posting[-1]) + 1
+            last_doc = int(docs[-1])
+
+        if (terms, postings, instances) != (term_total, posting_total, instance_total):
+            raise SnapshotError("publications_fts changed during the export")
+        term_postings[terms] = postings
+        position_offsets[postings] = instances
+        words.close()
+        for array in (term_postings, postings_docs, postings_title, postings_abstract, position_offsets, positions):
+            array.flush()
+        del term_postings, postings_docs, postings_title, postings_abstract, position_offsets, positions
+        _save(self.directory, 'doc_lengths', lengths.astype(np.int32))
+        return terms, postings, instances
+
+
+def _rows_of(sorted_ids, ids):
+    """Rows of `ids` in `sorted_ids` and a mask of the ones found."""
+    if not len(sorted_ids):
+        return np.zeros(len(ids), dtype=np.int64), np.zeros(len(ids), dtype=bool)
+    rows = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+    return rows, sorted_ids[rows] == ids
+
+
+def _offsets(rows, count):
+    """CSR-style offsets for entries grouped by row (`rows` sorted or not)."""
+    return np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=count)))).astype(np.int64)
+
+
+def export_snapshot(engine, root=SNAPSHOT_DIR, keep=KEEP_SNAPSHOTS, publish=True, log=print):
+    """
+    Writes a snapshot of the database behind `engine` under `root` and, with
+    `publish`, makes it the current one and prunes all but the `keep` newest.
+    Everything is read in one transaction, so the snapshot matches a single
+    index generation while the scraper keeps writing. Returns its version.
+    """
+    os.makedirs(root, exist_ok=True)
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("BEGIN") # pysqlite doesn't start transactions for SELECTs
+        generation = cursor.execute(
+            "SELECT value FROM index_meta WHERE key = ?", (GENERATION_KEY,)
+        ).fetchone()
+        generation = generation[0] if generation else 0
+        tokenizer = tokenizer_option(cursor.execute(
+            "SELECT sql FROM sqlite_master WHERE type='table' AND name='publications_fts'"
+        ).fetchone()[0])
+        version = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S.%f}-g{generation}"
+        staging = _path(root, STAGING_PREFIX + version)
+        os.makedirs(staging)
+        try:
+            SnapshotWriter(staging, cursor, log).write(version, generation, tokenizer)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+    finally:
+        connection.rollback() # Nothing was written but the temp vocabulary tables
+        connection.close()
+    os.rename(staging, _path(root, version))
+    _fsync(root)
+    if publish:
+        publish_snapshot(root, version)
+        prune_snapshots(root, keep)
+    return version
+
+
+def list_snapshots(root=SNAPSHOT_DIR):
+    """Versions of the published snapshots under `root`, oldest first."""
+    if not os.path.isdir(root):
+        return []
+    return sorted(name for name in os.listdir(root)
+                  if VERSION_PATTERN.match(name) and os.path.isfile(_path(_path(root, name), MANIFEST_FILE)))
+
+
+def current_version(root=SNAPSHOT_DIR):
+    """The version named in CURRENT, or None if nothing was published yet."""
+    try:
+        with open(_path(root, CURRENT_FILE)) as handle:
+            version = handle.read().strip()
+    except FileNotFoundError:
+        return None
+    if not VERSION_PATTERN.match(version):
+        raise SnapshotError(f"{_path(root, CURRENT_FILE)} does not name a snapshot: {version!r}")
+    return version
+
+
+def publish_snapshot(root, version):
+    """Makes `version` the snapshot workers serve: CURRENT is replaced in one rename."""
+    if version not in list_snapshots(root):
+        raise SnapshotError(f"No snapshot {version!r} in {root}")
+    current = _path(root, CURRENT_FILE)
+    staged = f"{current}.{os.getpid()}.tmp"
+    with open(staged, 'w') as handle:
+        handle.write(version + '\n')
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(staged, current)
+    _fsync(root)
+
+
+def prune_snapshots(root, keep=KEEP_SNAPSHOTS):
+    """
+    Deletes all but the `keep` newest snapshots (never the current one) and
+    abandoned exports. Workers still serving a deleted snapshot are not
+    affected: mapped files stay readable until they are unmapped.
+    """
+    current = current_version(root)
+    removed = []
+    for version in list_snapshots(root)[:-keep or None]:
+        if version != current:
+            shutil.rmtree(_path(root, version), ignore_errors=True)
+            removed.append(version)
+    for name in os.listdir(root):
+        path = _path(root, name)
+        if (name.startswith(STAGING_PREFIX) and VERSION_PATTERN.match(name[len(STAGING_PREFIX):])
+                and time.time() - os.path.getmtime(path) > STALE_STAGING_SECONDS):
+            shutil.rmtree(path, ignore_errors=True)
+    return removed
+
+
+# --- Search ---
+
+def _first(primary, ids, count, descending):
+    """Indexes of the `count` first entries in (primary, id) order, without sorting all of them."""
+    if descending:
+        primary, ids = -primary, -ids
+    candidates = np.arange(len(primary))
+    if len(primary) > count:
+        threshold = np.partition(primary, count - 1)[count - 1]
+        candidates = np.flatnonzero(primary <= threshold)
+    order = np.lexsort((ids[candidates], primary[candidates]))[:count]
+    return candidates[order]
+
+
+def _merge_spans(spans):
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def _mark(value, tokens, spans, first, last):
+    """
+    Tokens first..last of `value` with the (start, end) token spans wrapped in
+    highlight markers, like FTS5's highlight(): from the start of the first
+    token, and to the end of the text when the range reaches the last token.
+    """
+    parts, position = [], tokens[first][0] if first else 0
+    for start, end in spans:
+        if end < first or start > last:
+            continue
+        start, end = max(start, first), min(end, last)
+        parts += [value[position:tokens[start][0]], HIGHLIGHT_OPEN,
+                  value[tokens[start][0]:tokens[end][1]], HIGHLIGHT_CLOSE]
+        position = tokens[end][1]
+    parts.append(value[position:] if last >= len(tokens) - 1 else value[position:tokens[last][1]])
+    return ''.join(parts)
+
+
+def _sentence_starts(value, tokens):
+    """Tokens that begin a sentence: the first, and those after '.' or ':' and whitespace."""
+    starts = [0]
+    for i, (start, _) in enumerate(tokens[1:], 1):
+        j = start - 1
+        while j >= 0 and value[j] in ' \t\n\r':
+            j -= 1
+        if j != start - 1 and j >= 0 and value[j] in '.:':
+            starts.append(i)
+    return starts
+
+
+def _snippet(value, instances):
+    """
+    FTS5's snippet() for one column. `instances` are (phrase, start, end)
+    tokens of the matches in it. Windows of SNIPPET_TOKENS tokens score 1000
+    per distinct phrase and 1 per repeat; each is tried centred on its
+    matches and, with a bonus, from the start of the sentence.
+    """
+    if not value:
+        return None
+    tokens = [match.span() for match in TOKEN_PATTERN.finditer(value)]
+    if not tokens:
+        return ''
+    size = len(tokens)
+    instances = sorted(instances, key=lambda instance: instance[1])
+    sentences = _sentence_starts(value, tokens) if size > SNIPPET_TOKENS else []
+
+    def score(position):
+        seen, total, first, last = set(), 0, None, 0
+        for phrase, start, end in instances:
+            if position <= start < position + SNIPPET_TOKENS:
+                total += 1 if phrase in seen else 1000
+                seen.add(phrase)
+                first = start if first is None else first
+                last = end + 1
+        return total, first, last
+
+    best_score, best_start = 0, 0
+    for _, position, _ in instances:
+        total, first, last = score(position)
+        if total > best_score:
+            centred = first - int((SNIPPET_TOKENS - (last - first)) / 2) # C division truncates
+            best_score, best_start = total, max(0, min(centred, size - SNIPPET_TOKENS))
+        sentence = sentences[bisect_right(sentences, position) - 1] if sentences else position
+        if sentence < position:
+            total = score(sentence)[0] + (120 if sentence == 0 else 100)
+            if total > best_score:
+                best_score, best_start = total, sentence
+    last = min(best_start + SNIPPET_TOKENS, size) - 1
+    spans = _merge_spans((start, end) for _, start, end in instances if end < size)
+    text = _mark(value, tokens, spans, best_start, last)
+    if best_start > 0:
+        text = SNIPPET_ELLIPSIS + text
+    if last < size - 1:
+        text += SNIPPET_ELLIPSIS
+    return text
+
+
+class Snapshot:
+    """
+    One published snapshot, opened read-only. Its search methods take the
+    arguments of their app/search.py and app/facets.py namesakes (less the
+    session) and return the same objects. Safe to share between threads.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(_path(path, MANIFEST_FILE)) as handle:
+                self.manifest = json.load(handle)
+        except (OSError, ValueError) as e:
+            raise SnapshotError(f"Cannot read the manifest of {path}: {e}")
+        if self.manifest.get('format') != FORMAT:
+            raise SnapshotError(f"{path} has format {self.manifest.get('format')}, expected {FORMAT}")
+        for name, size in self.manifest['files'].items():
+            if not os.path.isfile(_path(path, name)) or os.path.getsize(_path(path, name)) != size:
+                raise SnapshotError(f"{path} is incomplete: {name} is missing or has the wrong size")
+        self.version = self.manifest['version']
+        self.generation = self.manifest['generation']
+        self.tokenizer = self.manifest['tokenizer']
+        self.average_length = self.manifest['average_length']
+
+        for name in ('doc_ids', 'doc_years', 'doc_canonical', 'doc_duplicates', 'doc_lengths',
+                     'doc_author_offsets', 'doc_authors', 'author_ids', 'author_doc_offsets', 'author_docs',
+                     'term_postings', 'postings_docs', 'postings_title', 'postings_abstract',
+                     'position_offsets', 'positions'):
+            setattr(self, name, _load(path, name))
+        for name in ('titles', 'links', 'abstracts', 'author_display_names', 'author_links', 'terms'):
+            setattr(self, name, StringColumn(path, name))
+        self._totals = None
+
+    def __repr__(self):
+        return f"<Snapshot {self.version} ({len(self.doc_ids)} publications)>"
+
+    # Terms and postings
+
+    def term_range(self, term, prefix=False):
+        """Ids of the terms equal to (or, with `prefix`, starting with) `term`, as a range."""
+        key = term.encode('utf-8')
+        low = self.terms.bisect(key)
+        if prefix:
+            return low, self.terms.bisect(key + b'\xff') # 0xff never occurs in UTF-8
+        return low, low + (low < len(self.terms) and self.terms.raw(low) == key)
+
+    def _postings(self, terms):
+        return int(self.term_postings[terms[0]]), int(self.term_postings[terms[1]])
+
+    def _instances(self, terms, column):
+        """(row << 32) | position for every instance of a term range, sorted."""
+        start, end = self._postings(terms)
+        counts = np.diff(self.position_offsets[start:end + 1])
+        rows = np.repeat(self.postings_docs[start:end].astype(np.int64), counts)
+        positions = self.positions[self.position_offsets[start]:self.position_offsets[end]].astype(np.int64)
+        keys = (rows << 32) | positions
+        if column is not None:
+            keys = keys[(positions >> COLUMN_SHIFT) == column]
+        if terms[1] - terms[0] > 1:
+            keys.sort()
+        return keys
+
+    def phrase(self, term):
+        """
+        PhraseMatch for a QueryTerm. A term is a phrase of the tokens it is
+        indexed as ('e-commerce' is 'e' then 'commerc'), as in FTS5. Returns
+        None when it has no tokens at all.
+        """
+        words = index_terms(term.text, self.tokenizer)
+        if not words:
+            return None
+        tokens = [self.term_range(word, prefix=term.prefix and i == len(words) - 1) for i, word in enumerate(words)]
+        column = {'title': TITLE_COLUMN, 'abstract': ABSTRACT_COLUMN}.get(term.column)
+        if len(tokens) == 1:
+            start, end = self._postings(tokens[0])
+            rows = self.postings_docs[start:end]
+            title = self.postings_title[start:end].astype(np.float64)
+            abstract = self.postings_abstract[start:end].astype(np.float64)
+            if tokens[0][1] - tokens[0][0] > 1: # Several terms: add up per row
+                rows, inverse = np.unique(rows, return_inverse=True)
+                title, abstract = np.bincount(inverse, weights=title), np.bincount(inverse, weights=abstract)
+            if column is not None:
+                keep = (title if column == TITLE_COLUMN else abstract) > 0
+                rows, title, abstract = rows[keep], title[keep], abstract[keep]
+                (abstract if column == TITLE_COLUMN else title)[:] = 0
+            return PhraseMatch(rows.astype(np.int64), title, abstract, tokens, column)
+
+        starts = None
+        for i, terms in enumerate(tokens):
+            keys = self._instances(terms, column)
+            keys = keys[(keys & OFFSET_MASK) >= i] - i # Where the phrase would have started
+            starts = keys if starts is None else np.intersect1d(starts, keys, assume_unique=True)
+        rows, inverse = np.unique(starts >> 32, return_inverse=True)
+        in_title = ((starts >> COLUMN_SHIFT) & 1) == TITLE_COLUMN
+        return PhraseMatch(rows, np.bincount(inverse, weights=in_title, minlength=len(rows)),
+                           np.bincount(inverse, weights=~in_title, minlength=len(rows)), tokens, column)
+
+    def match(self, parsed):
+        """(matching rows, PhraseMatches of the positive terms) for a ParsedQuery; rows is None if nothing is searchable."""
+        rows, phrases = None, []
+        for group in parsed.groups:
+            alternatives = [match for match in map(self.phrase, group) if match is not None]
+            if not alternatives:
+                continue
+            phrases += alternatives
+            union = reduce(np.union1d, [match.rows for match in alternatives])
+            rows = union if rows is None else np.intersect1d(rows, union, assume_unique=True)
+        if rows is None:
+            return None, []
+        for term in parsed.excluded:
+            match = self.phrase(term)
+            if match is not None and len(rows):
+                rows = np.setdiff1d(rows, match.rows, assume_unique=True)
+        return rows, phrases
+
+    def _ranks(self, rows, phrases, title_weight, abstract_weight, recency_boost):
+        """bm25() over title/abstract as FTS5 computes it, times the recency boost of SEARCH_SQL."""
+        total = len(self.doc_ids)
+        lengths = self.doc_lengths[rows]
+        scores = np.zeros(len(rows))
+        for phrase in phrases:
+            hits = len(phrase.rows)
+            idf = math.log((total - hits + 0.5) / (hits + 0.5))
+            if idf <= 0.0:
+                idf = 1e-6
+            at = np.minimum(np.searchsorted(phrase.rows, rows), max(hits - 1, 0))
+            found = phrase.rows[at] == rows if hits else np.zeros(len(rows), dtype=bool)
+            frequency = np.where(found, title_weight * phrase.title[at] + abstract_weight * phrase.abstract[at], 0.0)
+            scores += idf * ((frequency * (BM25_K1 + 1.0))
+                             / (frequency + BM25_K1 * (1 - BM25_B + BM25_B * lengths / self.average_length)))
+        age = np.maximum(0, date.today().year - self.doc_years[rows].astype(np.int64))
+        return -1.0 * scores * (1.0 + recency_boost / (1 + age))
+
+    def _author_rows(self, author_id):
+        rows, found = _rows_of(self.author_ids, np.array([author_id], dtype=np.int64))
+        if not found[0]:
+            return np.zeros(0, dtype=np.int64)
+        return np.unique(self.author_docs[self.author_doc_offsets[rows[0]]:self.author_doc_offsets[rows[0] + 1]])
+
+    def _filtered(self, rows, filters):
+        """The rows (None: all) passing SearchFilters, as filter_conditions() in app/search.py."""
+        author_ids = filters.author_ids if filters is not None else ()
+        for author_id in author_ids:
+            by_author = self._author_rows(author_id)
+            rows = by_author if rows is None else np.intersect1d(rows, by_author, assume_unique=True)
+        if rows is None:
+            rows = np.arange(len(self.doc_ids))
+        if filters is not None and (filters.year_from is not None or filters.year_to is not None):
+            years = self.doc_years[rows]
+            keep = np.ones(len(rows), dtype=bool)
+            if filters.year_from is not None:
+                keep &= years >= filters.year_from
+            if filters.year_to is not None:
+                keep &= years <= filters.year_to
+            rows = rows[keep]
+        return rows
+
+    def _collapse(self, rows):
+        """COLLAPSE_CONDITION of app/search.py: each near-duplicate cluster in a result set once."""
+        canonical = self.doc_canonical[rows]
+        members = canonical > 0
+        if not members.any():
+            return rows
+        keep = ~members
+        # Members whose canonical publication isn't a result; the first of each cluster stands in.
+        candidates = np.flatnonzero(members & ~np.isin(canonical, self.doc_ids[rows]))
+        _, first = np.unique(canonical[candidates], return_index=True)
+        keep[candidates[first]] = True
+        return rows[keep]
+
+    def _page(self, rows, primary, ranks, sort, page_size, after, before, phrases, collapse):
+        """The keyset page of app/search.py's _page() over rows keyed by (primary, id)."""
+        columns, descending = KEYSETS[sort]
+        cursor, backward = (before, True) if before else (after, False)
+        ids = self.doc_ids[rows]
+        smaller = descending != backward
+        if cursor:
+            first, second = decode_cursor(cursor, sort)
+            if not all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in (first, second)):
+                raise ValueError("Malformed cursor")
+            if smaller:
+                keep = (primary < first) | ((primary == first) & (ids < second))
+            else:
+                keep = (primary > first) | ((primary == first) & (ids > second))
+            rows, primary, ids = rows[keep], primary[keep], ids[keep]
+            ranks = ranks[keep] if ranks is not None else None
+        order = _first(primary, ids, page_size + 1, smaller)
+        has_more = len(order) > page_size
+        order = order[:page_size]
+        if backward:
+            order = order[::-1]
+        if not len(order):
+            return SearchPage([], None, None)
+        hits = self._hits(rows[order], ranks[order] if ranks is not None else None, phrases, collapse)
+
+        def key_of(hit):
+            return [(hit.publication_year or 0) if column == 'year_key' else getattr(hit, column) for column in columns]
+
+        more_after = has_more if not backward else True
+        more_before = bool(cursor) if not backward else has_more
+        return SearchPage(
+            hits,
+            encode_cursor(sort, key_of(hits[-1])) if more_after else None,
+            encode_cursor(sort, key_of(hits[0])) if more_before else None,
+        )
+
+    def _page_positions(self, terms, rows):
+        """{row: positions} of a term range for a page's rows."""
+        start, end = self._postings(terms)
+        if terms[1] - terms[0] == 1:
+            page = np.asarray(rows, dtype=self.postings_docs.dtype)
+            found = start + np.searchsorted(self.postings_docs[start:end], page)
+            # Rows without the term land on the next posting, which may be on the page too.
+            present = found < end
+            present[present] = self.postings_docs[found[present]] == page[present]
+            found = found[present]
+        else:
+            found = start + np.flatnonzero(np.isin(self.postings_docs[start:end], rows))
+        positions = {}
+        for posting in found:
+            row = int(self.postings_docs[posting])
+            if row in rows:
+                positions.setdefault(row, []).append(
+                    self.positions[self.position_offsets[posting]:self.position_offsets[posting + 1]].astype(np.int64))
+        return {row: np.sort(np.concatenate(values)) for row, values in positions.items()}
+
+    def _phrase_instances(self, phrases, rows):
+        """{row: [(phrase, column, start token, end token)]} for a page's rows."""
+        instances = {row: [] for row in rows}
+        for number, phrase in enumerate(phrases):
+            by_token = [self._page_positions(terms, rows) for terms in phrase.tokens]
+            for row in rows:
+                starts = None
+                for i, positions in enumerate(by_token):
+                    found = positions.get(row, np.zeros(0, dtype=np.int64))
+                    if phrase.column is not None:
+                        found = found[(found >> COLUMN_SHIFT) == phrase.column]
+                    found = found[(found & OFFSET_MASK) >= i] - i
+                    starts = found if starts is None else np.intersect1d(starts, found)
+                for start in starts:
+                    offset = int(start & OFFSET_MASK)
+                    instances[row].append((number, int(start >> COLUMN_SHIFT), offset, offset + len(phrase.tokens) - 1))
+        return instances
+
+    def _hits(self, rows, ranks, phrases, collapse):
+        rows = [int(row) for row in rows]
+        instances = self._phrase_instances(phrases, rows) if phrases else {}
+        hits = []
+        for i, row in enumerate(rows):
+            title, abstract = self.titles[row], self.abstracts[row] or None
+            title_highlight = snippet = None
+            if phrases:
+                found = instances[row]
+                tokens = [match.span() for match in TOKEN_PATTERN.finditer(title)]
+                spans = _merge_spans((start, end) for _, column, start, end in found
+                                     if column == TITLE_COLUMN and end < len(tokens))
+                title_highlight = _mark(title, tokens, spans, 0, len(tokens) - 1) if tokens else title
+                snippet = _snippet(abstract, [(number, start, end) for number, column, start, end in found
+                                              if column == ABSTRACT_COLUMN])
+            start, end = self.doc_author_offsets[row], self.doc_author_offsets[row + 1]
+            authors = tuple(AuthorRef(self.author_display_names[author], self.author_links[author] or None,
+                                      int(self.author_ids[author]))
+                            for author in self.doc_authors[start:end])
+            hits.append(SearchHit(
+                int(self.doc_ids[row]), title, self.links[row] or None, int(self.doc_years[row]) or None, abstract,
+                float(ranks[i]) if ranks is not None else None, title_highlight, snippet,
+                int(self.doc_duplicates[row]) if collapse else 0, authors,
+            ))
+        return hits
+
+    def search_publications(self, query, sort=DEFAULT_SORT, page_size=20, after=None, before=None,
+                            title_weight=10.0, abstract_weight=1.0, recency_boost=0.0, filters=None, collapse=True):
+        """search_publications() of app/search.py, served from the snapshot."""
+        if sort not in KEYSETS:
+            raise ValueError(f"Unknown sort mode: {sort}")
+        rows, phrases = self.match(parse_query(query))
+        if rows is None:
+            return SearchPage([], None, None)
+        rows = self._filtered(rows, filters)
+        if collapse:
+            rows = self._collapse(rows)
+        ranks = self._ranks(rows, phrases, title_weight, abstract_weight, recency_boost)
+        primary = ranks if sort == 'relevance' else self.doc_years[rows].astype(np.int64)
+        return self._page(rows, primary, ranks, sort, page_size, after, before, phrases, collapse)
+
+    def browse_publications(self, page_size=20, after=None, before=None, filters=None, collapse=True):
+        """browse_publications() of app/search.py, served from the snapshot."""
+        rows = self._filtered(None, filters)
+        if collapse:
+            rows = self._collapse(rows)
+        return self._page(rows, self.doc_years[rows].astype(np.int64), None, 'newest', page_size, after, before,
+                          [], collapse)
+
+    # Facets
+
+    def _author_counts(self, rows, limit):
+        starts, ends = self.doc_author_offsets[rows], self.doc_author_offsets[rows + 1]
+        lengths = ends - starts
+        # Concatenation of every row's slice of doc_authors, without a Python loop.
+        index = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        authors, counts = np.unique(self.doc_authors[index], return_counts=True)
+        order = np.lexsort((-self.author_ids[authors], -counts))[:limit]
+        return [AuthorCount(int(self.author_ids[author]), self.author_display_names[author], int(count))
+                for author, count in zip(authors[order], counts[order])]
+
+    def _year_counts(self, rows):
+        years, counts = np.unique(self.doc_years[rows], return_counts=True)
+        return [YearCount(int(year), int(count)) for year, count in zip(years, counts) if year > 0]
+
+    def facet_counts(self, query=None, filters=None, author_limit=10):
+        """facet_counts() of app/facets.py, served from the snapshot."""
+        filtered = filters is not None and (filters.year_from is not None or filters.year_to is not None
+                                            or filters.author_ids)
+        if not query and not filtered:
+            # The whole collection's counts never change, so they are computed once.
+            if self._totals is None or len(self._totals.authors) < author_limit:
+                rows = np.arange(len(self.doc_ids))
+                self._totals = Facets(self._year_counts(rows), self._author_counts(rows, author_limit))
+            return Facets(self._totals.years, self._totals.authors[:author_limit])
+        rows = None
+        if query:
+            rows, _ = self.match(parse_query(query))
+            if rows is None:
+                return Facets([], [])
+        rows = self._filtered(rows, filters)
+        return Facets(self._year_counts(rows), self._author_counts(rows, author_limit))
+
+    def author_names(self, author_ids):
+        """author_names() of app/facets.py, served from the snapshot."""
+        rows, found = _rows_of(self.author_ids, np.array(list(author_ids), dtype=np.int64))
+        return {int(self.author_ids[row]): self.author_display_names[row] for row in rows[found]}
+
+
+class SnapshotStore:
+    """
+    The snapshot a web worker serves. current() re-reads CURRENT at most every
+    `check_interval` seconds and opens a newer snapshot when one was
+    published; the swap is a single reference assignment, so requests in
+    flight finish on the snapshot they started with. A snapshot that fails to
+    open is skipped and the old one kept.
+    """
+
+    def __init__(self, root=SNAPSHOT_DIR, check_interval=5.0, log=print):
+        self.root = root
+        self.check_interval = check_interval
+        self.log = log
+        self._snapshot = None
+        self._checked_at = None
+        self._failed_version = None
+        self._lock = threading.Lock()
+
+    def current(self):
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.check_interval:
+            with self._lock:
+                if self._checked_at is None or now - self._checked_at >= self.check_interval:
+                    self._checked_at = now
+                    self._refresh()
+        if self._snapshot is None:
+            raise SnapshotError(f"No search snapshot published in {self.root}; run scripts/export_snapshot.py")
+        return self._snapshot
+
+    def _refresh(self):
+        try:
+            version = current_version(self.root)
+        except (OSError, SnapshotError) as e:
+            self.log(f"Cannot read the current search snapshot: {e}")
+            return
+        if version is None or version == self._failed_version:
+            return
+        if self._snapshot is not None and version == self._snapshot.version:
+            return
+        try:
+            snapshot = Snapshot(_path(self.root, version))
+        except (OSError, ValueError, SnapshotError) as e:
+            self._failed_version = version
+            SEARCH_SNAPSHOT_SWAPS.inc(outcome='failed')
+            self.log(f"Cannot open search snapshot {version}, still serving "
+                     f"{self._snapshot.version if self._snapshot else 'nothing'}: {e}")
+            return
+        self._snapshot = snapshot
+        SEARCH_SNAPSHOT_SWAPS.inc(outcome='swapped')
+        SEARCH_SNAPSHOT_GENERATION.set(snapshot.generation)
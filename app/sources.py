@@ -0,0 +1,120 @@
+# app/sources.py
+import json
+import re
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+from sqlalchemy import text
+
+
+class CrawlSource(namedtuple('CrawlSource', ['name', 'url', 'max_pages'])):
+    """
+    One listing root to crawl, e.g. an organisational unit's publication
+    list. `name` is what publication_sources records; `max_pages` caps the
+    pages crawled (None: every page the pagination advertises).
+    """
+    __slots__ = ()
+
+
+SOURCE_NAME_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._-]*$')
+
+# PurePortal listing roots look like /en/organisations/<unit>/publications/.
+UNIT_PATH_PATTERN = re.compile(r'/organisations/([^/]+)/')
+
+
+def source_name_from_url(url):
+    """The unit slug of a PurePortal listing URL, else host and path joined by dashes."""
+    parts = urlsplit(url)
+    match = UNIT_PATH_PATTERN.search(parts.path)
+    if match:
+        return match.group(1)
+    return '-'.join(part for part in [parts.netloc] + parts.path.split('/') if part)
+
+
+def make_source(url, name=None, max_pages=None):
+    """Validated CrawlSource; raises ValueError for unusable entries."""
+    parts = urlsplit(url or '')
+    if parts.scheme not in ('http', 'https') or not parts.netloc:
+        raise ValueError(f"Source URL must be an http(s) URL: {url!r}")
+    name = name or source_name_from_url(url)
+    if not SOURCE_NAME_PATTERN.match(name):
+        raise ValueError(f"Invalid source name {name!r}: use letters, digits, '.', '_' and '-'")
+    if max_pages is not None and (not isinstance(max_pages, int) or max_pages < 1):
+        raise ValueError(f"max_pages for source {name!r} must be a positive integer")
+    return CrawlSource(name, url, max_pages)
+
+
+def parse_source_arg(value, max_pages=None):
+    """A --source value: 'name=url' or a bare URL (named after its unit)."""
+    name, separator, url = value.partition('=')
+    if not separator or '://' in name:
+        name, url = None, value
+    return make_source(url.strip(), name and name.strip(), max_pages)
+
+
+def load_sources(path, max_pages=None):
+    """
+    Reads a JSON source list, either a list of entries or
+
+        {"max_pages": 16,
+         "sources": [{"name": "economics", "url": "https://.../publications/", "max_pages": 20}, ...]}
+
+    Entries may also be bare URL strings. A top-level max_pages is the
+    default for entries without their own, falling back to `max_pages`.
+    """
+    with open(path, encoding='utf-8') as handle:
+        document = json.load(handle)
+    if isinstance(document, dict):
+        max_pages = document.get('max_pages', max_pages)
+        entries = document.get('sources', [])
+    else:
+        entries = document
+
+    sources = []
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {'url': entry}
+        if not isinstance(entry, dict):
+            raise ValueError(f"{path}: each source must be a URL or an object, got {entry!r}")
+        unknown = set(entry).difference({'name', 'url', 'max_pages'})
+        if unknown:
+            raise ValueError(f"{path}: unknown source keys {', '.join(sorted(unknown))}")
+        sources.append(make_source(entry.get('url'), entry.get('name'), entry.get('max_pages', max_pages)))
+    return check_unique(sources)
+
+
+def check_unique(sources):
+    """Rejects two sources sharing a name or a URL. Returns `sources`."""
+    names, urls = set(), set()
+    for source in sources:
+        if source.name in names:
+            raise ValueError(f"Duplicate source name {source.name!r}")
+        if source.url in urls:
+            raise ValueError(f"Duplicate source URL {source.url!r}")
+        names.add(source.name)
+        urls.add(source.url)
+    return sources
+
+
+def select_sources(sources, names):
+    """The sources named in `names` (all of them when `names` is empty)."""
+    if not names:
+        return sources
+    by_name = {source.name: source for source in sources}
+    unknown = [name for name in names if name not in by_name]
+    if unknown:
+        raise ValueError(f"Unknown sources: {', '.join(unknown)}. Configured: {', '.join(by_name)}")
+    return [by_name[name] for name in names]
+
+
+def source_counts(connection):
+    """(source, publications, only_here, last_seen) per source, largest first."""
+    return connection.execute(text("""
+        SELECT s.source, count(*) AS publications,
+               sum(NOT EXISTS (SELECT 1 FROM publication_sources o
+                               WHERE o.publication_id = s.publication_id AND o.source != s.source)) AS only_here,
+               max(s.last_seen) AS last_seen
+        FROM publication_sources s
+        GROUP BY s.source
+        ORDER BY publications DESC, s.source
+    """)).fetchall()
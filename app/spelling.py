@@ -0,0 +1,308 @@
+# app/spelling.py
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from sqlalchemy import bindparam, text
+
+from app.authors import fold
+from app.cache import bump_index_generation
+from app.fts import FTS_TOKENIZER, fts_table_sql
+from app.metrics import SEARCH_SPELLING
+from app.query import parse_query, render_match, render_display
+from app.search import HIGHLIGHT_OPEN, HIGHLIGHT_CLOSE
+
+# "Did you mean" suggestions for searches without results. The dictionary
+# is the index's own vocabulary (the publications_vocab fts5vocab table), so
+# its terms are stems when publications_fts uses the porter tokenizer:
+#
+# 1. each query word is tokenized the way the index tokenizes text, by an
+#    in-memory FTS5 table with the same tokenize= option,
+# 2. words whose term is not in the vocabulary are looked up in a
+#    symmetric-delete index (spelling_deletes): a term within edit distance
+#    d of the word shares at least one deletion of up to d characters with
+#    it, so candidates are one indexed IN query instead of a scan,
+# 3. candidate terms are turned back into words people type by searching
+#    for them and reading the matched word out of highlight(); the words
+#    closest to the typed one win,
+# 4. corrected queries are kept only if they have results.
+#
+# Every step checks a deadline, so a suggestion costs at most the budget
+# given (plus one query) and whatever was found by then is returned.
+
+MIN_WORD_LENGTH = 3
+MIN_DOCUMENTS = 2 # Terms in a single publication are too often typos themselves
+CANDIDATES_PER_WORD = 3
+# Candidate terms whose surface form is looked up per misspelled word.
+SURFACE_LOOKUPS = 6
+# Characters stemming may strip from a word ('education' -> 'educ').
+MAX_STEM_SUFFIX = 5
+MAX_SUGGESTIONS = 3
+DEFAULT_BUDGET_MS = 50
+# Highlighted rows read to find the word form closest to what was typed.
+SURFACE_ROWS = 5
+
+# One suggestion: the corrected query in search box syntax and the
+# (typed, suggested) word pairs that were replaced.
+Suggestion = namedtuple('Suggestion', ['query', 'corrections'])
+
+TOKENIZE_PATTERN = re.compile(r"tokenize\s*=\s*'((?:[^']|'')*)'", re.IGNORECASE)
+HIGHLIGHTED_WORD = re.compile(re.escape(HIGHLIGHT_OPEN) + '(.*?)' + re.escape(HIGHLIGHT_CLOSE), re.DOTALL)
+
+TERM_DOCUMENTS_SQL = text("SELECT doc FROM publications_vocab WHERE term = :term")
+
+CANDIDATES_SQL = text("""
+SELECT d.term, t.documents
+FROM spelling_deletes d
+JOIN spelling_terms t ON t.term = d.term
+WHERE d.variant IN :variants
+""").bindparams(bindparam('variants', expanding=True))
+
+SURFACE_SQL = text("""
+SELECT highlight(publications_fts, 0, :open, :close), highlight(publications_fts, 1, :open, :close)
+FROM publications_fts
+WHERE publications_fts MATCH :query
+LIMIT :limit
+""")
+
+# Keeps IN (...) lists comfortably below SQLite's bound-parameter limit.
+IN_CHUNK_SIZE = 500
+
+HAS_MATCHES_SQL = text("SELECT 1 FROM publications_fts WHERE publications_fts MATCH :query LIMIT 1")
+
+
+def max_distance(term):
+    """Edits allowed for a term: one for short terms, where two would match almost anything."""
+    return 1 if len(term) <= 5 else 2
+
+
+def deletes(word, distance):
+    """`word` and every string made by deleting up to `distance` characters from it."""
+    variants = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {variant[:i] + variant[i + 1:] for variant in frontier if len(variant) > 1
+                    for i in range(len(variant))}
+        variants |= frontier
+    return variants
+
+
+def edit_distance(a, b, limit):
+    """
+    Optimal string alignment distance (insertions, deletions, substitutions
+    and adjacent transpositions), or limit + 1 once it is known to exceed `limit`.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+
+def is_dictionary_term(term):
+    return len(term) >= MIN_WORD_LENGTH and term.isalpha()
+
+
+def refresh_spelling(connection):
+    """
+    Brings spelling_terms and spelling_deletes in line with the index
+    vocabulary: adds new terms, drops vanished ones (e.g. after a tokenizer
+    change) and updates document counts. Cheap when little changed, so
+    the scraper runs it after every crawl. Returns (added, removed).
+    """
+    current = {term: documents for term, documents in connection.execute(
+        text("SELECT term, doc FROM publications_vocab WHERE doc >= :min_documents"), {'min_documents': MIN_DOCUMENTS}
+    ) if is_dictionary_term(term)}
+    stored = dict(connection.execute(text("SELECT term, documents FROM spelling_terms")).fetchall())
+
+    added = [term for term in current if term not in stored]
+    removed = [term for term in stored if term not in current]
+    changed = [{'term': term, 'documents': current[term]}
+               for term in current if term in stored and stored[term] != current[term]]
+    if removed:
+        for start in range(0, len(removed), 500):
+            chunk = {'terms': removed[start:start + 500]}
+            connection.execute(text("DELETE FROM spelling_deletes WHERE term IN :terms").bindparams(
+                bindparam('terms', expanding=True)), chunk)
+            connection.execute(text("DELETE FROM spelling_terms WHERE term IN :terms").bindparams(
+                bindparam('terms', expanding=True)), chunk)
+    if added:
+        connection.execute(text("INSERT INTO spelling_terms (term, documents) VALUES (:term, :documents)"),
+                           [{'term': term, 'documents': current[term]} for term in added])
+        connection.execute(text("INSERT INTO spelling_deletes (variant, term) VALUES (:variant, :term)"), [
+            {'variant': variant, 'term': term} for term in added for variant in deletes(term, max_distance(term))
+        ])
+    if changed:
+        connection.execute(text("UPDATE spelling_terms SET documents = :documents WHERE term = :term"), changed)
+    if added or removed:
+        bump_index_generation(connection) # Cached suggestions were made with the old dictionary
+    return len(added), len(removed)
+
+
+_probes = threading.local()
+
+
+def index_terms(value, tokenizer):
+    """
+    The terms publications_fts would index for `value`, in order, using an
+    in-memory FTS5 table with the same tokenize= option (one per thread).
+    """
+    probes = _probes.__dict__.setdefault('connections', {})
+    probe = probes.get(tokenizer)
+    if probe is None:
+        probe = probes[tokenizer] = sqlite3.connect(':memory:')
+        quoted = tokenizer.replace("'", "''")
+        probe.execute(f"CREATE VIRTUAL TABLE probe USING fts5(body, tokenize='{quoted}')")
+        probe.execute("CREATE VIRTUAL TABLE probe_terms USING fts5vocab(probe, 'instance')")
+    probe.execute("DELETE FROM probe")
+    probe.execute("INSERT INTO probe (rowid, body) VALUES (1, ?)", (value,))
+    return [row[0] for row in probe.execute("SELECT term FROM probe_terms ORDER BY offset")]
+
+
+def tokenizer_option(create_sql):
+    """The tokenize= option of an FTS5 CREATE statement (FTS_TOKENIZER if it has none)."""
+    match = TOKENIZE_PATTERN.search(create_sql or '')
+    return match.group(1).replace("''", "'") if match else FTS_TOKENIZER
+
+
+def index_tokenizer(connection):
+    """The tokenize= option publications_fts was created with."""
+    return tokenizer_option(fts_table_sql(connection))
+
+
+class SpellingCorrector:
+    """Suggestions for one query within a time budget; see the module comment."""
+
+    def __init__(self, connection, budget_ms=DEFAULT_BUDGET_MS):
+        self.connection = connection
+        self.deadline = time.perf_counter() + budget_ms / 1000
+        self.tokenizer = index_tokenizer(connection)
+
+    def over_budget(self):
+        return time.perf_counter() > self.deadline
+
+    def candidates(self, term, typed):
+        """
+        Dictionary terms that `typed` (indexed as `term`) may have been
+        meant as, the closest and most specific first. A typo near the end
+        of a word changes its stem completely ('educatilon' stays whole
+        while 'education' is 'educ'), so the typed word's prefixes are
+        looked up as well as its own term.
+        """
+        keys = {term} | {typed[:length] for length in range(max(MIN_WORD_LENGTH, len(typed) - MAX_STEM_SUFFIX),
+                                                          len(typed) + 1)}
+        variants = sorted(set().union(*(deletes(key, max_distance(key)) for key in keys)))
+        found = {}
+        for start in range(0, len(variants), IN_CHUNK_SIZE):
+            for candidate, documents in self.connection.execute(
+                    CANDIDATES_SQL, {'variants': variants[start:start + IN_CHUNK_SIZE]}):
+                if candidate in found:
+                    continue
+                limit = max_distance(candidate)
+                distance = min((edit_distance(key, candidate, limit) for key in keys
+                                if abs(len(key) - len(candidate)) <= limit), default=limit + 1)
+                if distance <= limit:
+                    found[candidate] = (distance, -len(candidate), -documents, candidate)
+        return sorted(found, key=found.get)
+
+    def surface_form(self, term, typed):
+        """
+        A word as it appears in publications that indexes as `term`, the
+        one closest to what was typed, or None. Terms that don't tokenize
+        to themselves (some porter stems) can't be searched for directly.
+        """
+        if index_terms(term, self.tokenizer) != [term]:
+            return None
+        rows = self.connection.execute(SURFACE_SQL, {
+            'query': '"' + term + '"', 'open': HIGHLIGHT_OPEN, 'close': HIGHLIGHT_CLOSE, 'limit': SURFACE_ROWS,
+        })
+        words = {fold(word) for row in rows for value in row if value for word in HIGHLIGHTED_WORD.findall(value)}
+        if not words:
+            return None
+        return min(words, key=lambda word: (edit_distance(typed, word, len(typed) + len(word)), word))
+
+    def corrections(self, parsed):
+        """
+        {(group, position): [replacement words, best first]} for the
+        misspelled words of a ParsedQuery. Replacements are ranked by their
+        edit distance to the typed word, then by how common they are.
+        """
+        corrections = {}
+        for group_index, group in enumerate(parsed.groups):
+            for position, term in enumerate(group):
+                if term.phrase or term.prefix or len(term.text) < MIN_WORD_LENGTH or self.over_budget():
+                    continue
+                terms = index_terms(term.text, self.tokenizer)
+                if len(terms) != 1 or self.connection.execute(TERM_DOCUMENTS_SQL, {'term': terms[0]}).scalar():
+                    continue # Several words, or a known one
+                typed = fold(term.text)
+                limit = max_distance(typed)
+                ranked = {}
+                for rank, candidate in enumerate(self.candidates(terms[0], typed)[:SURFACE_LOOKUPS]):
+                    if self.over_budget():
+                        break
+                    word = self.surface_form(candidate, typed)
+                    distance = edit_distance(typed, word, limit) if word else limit + 1
+                    if distance <= limit and word not in ranked:
+                        ranked[word] = (distance, rank)
+                if ranked:
+                    corrections[(group_index, position)] = sorted(ranked, key=ranked.get)[:CANDIDATES_PER_WORD]
+        return corrections
+
+    def suggest(self, query, limit=MAX_SUGGESTIONS):
+        """Up to `limit` Suggestions that have results, the most likely first."""
+        parsed = parse_query(query)
+        corrections = self.corrections(parsed)
+        if not corrections:
+            return []
+        # The best replacement for every word, then the runners-up one word at a time.
+        best = {key: words[0] for key, words in corrections.items()}
+        variants = [best] + [{**best, key: word} for key, words in corrections.items() for word in words[1:]]
+
+        suggestions = []
+        for replacements in variants:
+            if len(suggestions) >= limit or self.over_budget():
+                break
+            groups = [list(group) for group in parsed.groups]
+            for (group_index, position), word in replacements.items():
+                groups[group_index][position] = groups[group_index][position]._replace(text=word)
+            corrected = parsed._replace(groups=tuple(tuple(group) for group in groups))
+            if self.connection.execute(HAS_MATCHES_SQL, {'query': render_match(corrected)}).first():
+                suggestions.append(Suggestion(render_display(corrected), tuple(
+                    (parsed.groups[group_index][position].text, word)
+                    for (group_index, position), word in replacements.items())))
+        return suggestions
+
+
+def suggest_queries(connection, query, budget_ms=DEFAULT_BUDGET_MS, limit=MAX_SUGGESTIONS):
+    """
+    "Did you mean" Suggestions for a query without results, computed within
+    about `budget_ms` milliseconds ([] if none was found in time).
+    """
+    corrector = SpellingCorrector(connection, budget_ms)
+    suggestions = corrector.suggest(query, limit)
+    SEARCH_SPELLING.inc(outcome='suggested' if suggestions else 'over_budget' if corrector.over_budget() else 'none')
+    return suggestions
+
+
+def dump_suggestions(suggestions):
+    """Serializes Suggestions for the result cache, like app.cache.dump_facets()."""
+    return json.dumps([[suggestion.query, [list(pair) for pair in suggestion.corrections]]
+                       for suggestion in suggestions], separators=(',', ':'))
+
+
+def load_suggestions(data):
+    """Inverse of dump_suggestions()."""
+    return [Suggestion(query, tuple(tuple(pair) for pair in corrections)) for query, corrections in json.loads(data)]
@@ -0,0 +1,116 @@
+# benchmarks/bench_concurrency.py
+"""
+Measures search latency while a bulk ingest is running, once with a plain
+engine on the default rollback journal and once with the tuned connection
+layer from app.database (WAL, pragmas, read-only reader pool).
+
+    python benchmarks/bench_concurrency.py --seed-records 50000 --ingest-records 50000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+# Add the project root to the Python path to import app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.database import init_db, create_engines
+from app.ingest import BulkIngester
+from app.search import search_publications
+from benchmarks.corpus import TOPICS, synthetic_records
+
+
+def default_engines(url):
+    """The pre-WAL setup: one engine with default settings for both sides."""
+    engine = create_engine(url, connect_args={'check_same_thread': False})
+    with engine.connect() as connection:
+        connection.execute(text("PRAGMA journal_mode = DELETE"))
+    return engine, engine
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run(label, writer, reader, batches, readers):
+    ReadSession = sessionmaker(bind=reader)
+    ingesting = threading.Event()
+    ingesting.set()
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def search_loop(seed):
+        rng = random.Random(seed)
+        while ingesting.is_set():
+            query = " ".join(rng.sample(TOPICS, 2))
+            session = ReadSession()
+            started = time.perf_counter()
+            try:
+                search_publications(session, query, page_size=20)
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+            except Exception as e:
+                with lock:
+                    errors.append(type(e).__name__)
+            finally:
+                session.close()
+
+    threads = [threading.Thread(target=search_loop, args=(n,)) for n in range(readers)]
+    for thread in threads:
+        thread.start()
+
+    ingester = BulkIngester(writer)
+    started = time.perf_counter()
+    rows = 0
+    for batch in batches:
+        ingester.ingest(batch)
+        rows += len(batch)
+    ingest_seconds = time.perf_counter() - started
+    ingesting.clear()
+    for thread in threads:
+        thread.join()
+
+    if latencies:
+        print(f"{label:<8} searches={len(latencies):>6} errors={len(errors):>4} "
+              f"p50={percentile(latencies, 0.50) * 1000:7.1f}ms p95={percentile(latencies, 0.95) * 1000:7.1f}ms "
+              f"p99={percentile(latencies, 0.99) * 1000:7.1f}ms max={max(latencies) * 1000:7.1f}ms "
+              f"mean={statistics.mean(latencies) * 1000:6.1f}ms  ingest={rows / ingest_seconds:8.0f} rows/sec")
+    else:
+        print(f"{label:<8} no successful searches, errors={len(errors)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seed-records', type=int, default=50000)
+    parser.add_argument('--ingest-records', type=int, default=50000)
+    parser.add_argument('--batch-size', type=int, default=2000)
+    parser.add_argument('--readers', type=int, default=4, help="Concurrent search threads.")
+    args = parser.parse_args(argv)
+
+    records = synthetic_records(args.seed_records + args.ingest_records)
+    seed, incoming = records[:args.seed_records], records[args.seed_records:]
+    batches = [incoming[start:start + args.batch_size] for start in range(0, len(incoming), args.batch_size)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        for label, factory in (('default', default_engines), ('tuned', create_engines)):
+            url = f"sqlite:///{os.path.join(directory, label + '.db')}"
+            writer, reader = factory(url)
+            init_db(writer)
+            BulkIngester(writer).ingest(seed)
+            run(label, writer, reader, batches, args.readers)
+            writer.dispose()
+            reader.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+# benchmarks/bench_dedup.py
+"""
+Near-duplicate detection (app/dedup.py) on the synthetic corpus with
+planted duplicates: each planted copy has a new link and a perturbed title
+(case, punctuation, a dropped or swapped word, a typo), the same year and
+a subset of the authors, like a paper listed by a second unit. Some copies
+instead keep the abstract under a reworded title, which only the abstract
+bands can find.
+
+    python benchmarks/bench_dedup.py --records 20000 --duplicate-rate 0.05 --json results/dedup.json
+
+Reports ingest throughput with and without the check, precision and
+recall of the canonical ids assigned at ingest and by the batch mode
+(scripts/dedupe_publications.py), and the batch mode's throughput. The
+late-abstract run ingests everything without abstracts and writes them
+afterwards through app/abstracts.py, as a crawl does. Then
+checks that collapsed results pick a cluster's stand-in from the
+publications passing the year and author filters, on the database and on a
+snapshot (app/snapshot.py).
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, text
+
+# Add the project root to the Python path to import app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.harness import use_scratch_database, write_results
+
+use_scratch_database()
+
+from app.abstracts import write_abstracts
+from app.database import init_db
+from app.dedup import TITLE_THRESHOLD, deduplicate_all, jaccard, title_shingles
+from app.ingest import BulkIngester
+from app.search import SearchFilters, search_publications, browse_publications
+from app.snapshot import Snapshot, export_snapshot
+from benchmarks.corpus import TOPICS, synthetic_records
+
+TYPO_LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+
+
+def perturb_title(title, rng):
+    """A retyped version of a title that a reader would still call the same."""
+    words = title.split()
+    edit = rng.randrange(5)
+    if edit == 0:
+        words = [word.upper() if rng.random() < 0.5 else word.lower() for word in words]
+    elif edit == 1:
+        words = [word.strip(':,?') for word in words]
+    elif edit == 2 and len(words) > 6:
+        words.pop(rng.randrange(1, len(words) - 2)) # Never the trailing '(n)'
+    elif edit == 3 and len(words) > 4:
+        i = rng.randrange(len(words) - 2)
+        words[i], words[i + 1] = words[i + 1], words[i]
+    else:
+        i = rng.randrange(len(words) - 1)
+        word = words[i]
+        if len(word) > 3:
+            j = rng.randrange(1, len(word) - 1)
+            words[i] = word[:j] + rng.choice(TYPO_LETTERS) + word[j + 1:]
+    return ' '.join(words)
+
+
+def reword_title(title, rng):
+    """A title rewritten beyond TITLE_THRESHOLD, keeping its numbers (e.g. the trailing '(n)')."""
+    words = title.split()
+    while True:
+        reworded = [word if any(c.isdigit() for c in word) or rng.random() < 0.3 else rng.choice(TOPICS)
+                    for word in words]
+        reworded = ' '.join(reworded)
+        if jaccard(title_shingles(title), title_shingles(reworded)) < TITLE_THRESHOLD:
+            return reworded
+
+
+def plant_duplicates(records, rate, seed, reworded_share=0.25):
+    """
+    Returns (records with copies inserted later in the stream, {copy link:
+    original link}, links of the reworded copies). Copies drop some
+    authors and, half the time, the abstract; `reworded_share` of the
+    copies of records with an abstract keep it under a reworded title.
+    """
+    rng = random.Random(seed)
+    copies, reworded = {}, set()
+    output = list(records)
+    for record in rng.sample(records, int(len(records) * rate)):
+        authors = record.authors
+        if len(authors) > 1:
+            authors = tuple(sorted(rng.sample(authors, rng.randint(1, len(authors)))))
+        link = record.publication_link + '-copy'
+        if record.abstract and rng.random() < reworded_share:
+            copy = record._replace(title=reword_title(record.title, rng), publication_link=link, authors=authors)
+            reworded.add(link)
+        else:
+            copy = record._replace(
+                title=perturb_title(record.title, rng), publication_link=link, authors=authors,
+                abstract=record.abstract if rng.random() < 0.5 else None,
+            )
+        copies[link] = record.publication_link
+        output.insert(rng.randrange(output.index(record) + 1, len(output) + 1), copy)
+    return output, copies, reworded
+
+
+def score(engine, copies, reworded):
+    """Precision and recall of canonical_id against the planted pairs, and recall of the reworded ones."""
+    with engine.connect() as connection:
+        rows = connection.execute(text(
+            "SELECT p.publication_link, c.publication_link FROM publications p "
+            "JOIN publications c ON c.id = p.canonical_id"
+        )).fetchall()
+    marked = dict(rows)
+    correct = sum(1 for link, canonical in marked.items() if copies.get(link) == canonical)
+    reworded_found = sum(1 for link in reworded if marked.get(link) == copies[link])
+    return {
+        'marked': len(marked),
+        'planted': len(copies),
+        'precision': round(correct / len(marked), 4) if marked else 1.0,
+        'recall': round(correct / len(copies), 4) if copies else 1.0,
+        'reworded_recall': round(reworded_found / len(reworded), 4) if reworded else 1.0,
+    }
+
+
+def filtered_collapse(engine, directory):
+    """
+    Moves a canonical publication out of its duplicate's year and drops one
+    of the duplicate's authors from it, then runs year, author and combined
+    filters through collapsed searches and listings. Returns the number of
+    (backend, filter, listing) checks and the ones where the duplicate
+    didn't stand in for its filtered-out canonical publication.
+    """
+    with engine.begin() as connection:
+        duplicate, canonical, year, title, canonical_title = connection.execute(text(
+            "SELECT p.id, p.canonical_id, p.publication_year, p.title, c.title FROM publications p "
+            "JOIN publications c ON c.id = p.canonical_id "
+            "JOIN publication_authors_association x ON x.publication_id = p.id "
+            "WHERE p.canonical_id IS NOT NULL AND p.publication_year IS NOT NULL ORDER BY p.id LIMIT 1"
+        )).one()
+        author_id = connection.execute(text(
+            "SELECT author_id FROM publication_authors_association WHERE publication_id = :id ORDER BY rowid LIMIT 1"
+        ), {'id': duplicate}).scalar()
+        connection.execute(text("UPDATE publications SET publication_year = 1900 WHERE id = :id"), {'id': canonical})
+        connection.execute(text(
+            "DELETE FROM publication_authors_association WHERE publication_id = :id AND author_id = :author_id"
+        ), {'id': canonical, 'author_id': author_id})
+
+    # Words of both titles, so that the canonical publication matches too.
+    shared = set(re.findall(r'\w+', canonical_title.lower()))
+    query = ' '.join(word for word in re.findall(r'\w+', title.lower()) if word in shared)
+    filters = {'year': SearchFilters(year, year), 'author': SearchFilters(author_ids=(author_id,)),
+               'year_and_author': SearchFilters(year, year, (author_id,))}
+    snapshot = Snapshot(os.path.join(directory, export_snapshot(engine, directory, log=lambda message: None)))
+    checks, failures = 0, []
+    with engine.connect() as connection:
+        backends = {
+            'sqlite': (lambda **options: search_publications(connection, query, **options),
+                       lambda **options: browse_publications(connection, **options)),
+            'snapshot': (lambda **options: snapshot.search_publications(query, **options),
+                         snapshot.browse_publications),
+        }
+        for backend, listings in backends.items():
+            for name, narrowed in filters.items():
+                for listing, run in zip(('search', 'browse'), listings):
+                    ids = {hit.id for hit in run(page_size=1_000_000, filters=narrowed, collapse=True).hits}
+                    checks += 1
+                    if duplicate not in ids or canonical in ids:
+                        failures.append(f"{backend}/{name}/{listing}")
+    return checks, failures
+
+
+def late_abstracts(engine, records, batch_size):
+    """
+    Ingests `records` without abstracts, then writes the abstracts in
+    batches like the abstract stage; returns the write rate in rows/sec.
+    """
+    ingest(engine, [record._replace(abstract=None) for record in records], batch_size, dedup=True)
+    abstracts = {record.publication_link: record.abstract for record in records if record.abstract}
+    with engine.connect() as connection:
+        rows = [{'id': publication_id, 'abstract': abstracts[link]} for publication_id, link in connection.execute(
+            text("SELECT id, publication_link FROM publications ORDER BY id")) if link in abstracts]
+    started = time.perf_counter()
+    for start in range(0, len(rows), 100):
+        write_abstracts(engine, rows[start:start + 100])
+    return len(rows) / (time.perf_counter() - started)
+
+
+def ingest(engine, records, batch_size, dedup):
+    ingester = BulkIngester(engine, dedup=dedup)
+    started = time.perf_counter()
+    for start in range(0, len(records), batch_size):
+        ingester.ingest(records[start:start + batch_size])
+    return len(records) / (time.perf_counter() - started)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--duplicate-rate', type=float, default=0.05, help="Share of records copied as near-duplicates.")
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help="Write the results to this JSON file.")
+    args = parser.parse_args(argv)
+
+    records, copies, reworded = plant_duplicates(synthetic_records(args.records, args.seed), args.duplicate_rate,
+                                                 args.seed)
+    print(f"{len(records)} records, {len(copies)} planted near-duplicates ({len(reworded)} with a reworded title)")
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        engines = {}
+        for dedup in (False, True):
+            engine = engines[dedup] = create_engine(f"sqlite:///{os.path.join(directory, f'dedup-{dedup}.db')}")
+            init_db(engine)
+            rate = ingest(engine, records, args.batch_size, dedup)
+            results['ingest_with_dedup' if dedup else 'ingest_without_dedup'] = {'rows_per_sec': round(rate, 1)}
+            print(f"ingest {'with' if dedup else 'without'} dedup: {rate:10.0f} rows/sec")
+        results['ingest_with_dedup'].update(score(engines[True], copies, reworded))
+
+        started = time.perf_counter()
+        deduplicate_all(engines[False], batch_size=2000, log=lambda message: None)
+        elapsed = time.perf_counter() - started
+        results['batch'] = dict(score(engines[False], copies, reworded), rows_per_sec=round(len(records) / elapsed, 1))
+
+        late = create_engine(f"sqlite:///{os.path.join(directory, 'dedup-late.db')}")
+        init_db(late)
+        rate = late_abstracts(late, records, args.batch_size)
+        results['late_abstracts'] = dict(score(late, copies, reworded), rows_per_sec=round(rate, 1))
+        late.dispose()
+        checks, failures = filtered_collapse(engines[True], os.path.join(directory, 'snapshots'))
+        results['filtered_collapse'] = {'checks': checks, 'failures': failures}
+        for engine in engines.values():
+            engine.dispose()
+
+    for name in ('ingest_with_dedup', 'batch', 'late_abstracts'):
+        result = results[name]
+        print(f"{name:<18} marked {result['marked']:>6} of {result['planted']} planted: "
+              f"precision {result['precision']:.4f}, recall {result['recall']:.4f}, "
+              f"reworded titles {result['reworded_recall']:.4f}")
+    print(f"batch mode: {results['batch']['rows_per_sec']:.0f} rows/sec, "
+          f"abstract writes with the re-check: {results['late_abstracts']['rows_per_sec']:.0f} rows/sec")
+    failures = results['filtered_collapse']['failures']
+    print(f"filtered collapse: {results['filtered_collapse']['checks'] - len(failures)} of "
+          f"{results['filtered_collapse']['checks']} checks passed" + (f" (failed: {', '.join(failures)})" if failures else ''))
+
+    if args.json:
+        write_results(args.json, 'dedup', vars(args), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+# benchmarks/bench_ingest.py
+"""
+Compares ingest throughput of the row-by-row ORM path with BulkIngester on
+the synthetic corpus, each run against a fresh scratch SQLite database.
+
+    python benchmarks/bench_ingest.py --records 100000 --before-records 10000 --json results/ingest.json
+
+Five paths are measured:
+
+    row-by-row        ingest_records_row_by_row() on parsed records
+    bulk              BulkIngester on parsed records
+    pages-row-by-row  process_page_documents() on listing HTML (parse + ORM insert)
+    pages-bulk        a listing parser from app/parsing.py (--parser) + BulkIngester per page
+    pages-pipeline    the staged IngestPipeline (parser processes, one batched writer)
+
+The row-by-row paths take minutes at 100k records, so --before-records lets
+them run on a prefix; every path reports rows/sec.
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+from bs4 import BeautifulSoup
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# Add the project root to the Python path to import app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.harness import use_scratch_database, load_scraper, timed, write_results
+
+use_scratch_database()
+
+from app.database import init_db
+from app.ingest import BulkIngester, ingest_records_row_by_row
+from app.parsing import get_listing_parser, available_listing_parsers
+from app.pipeline import IngestPipeline
+from benchmarks.corpus import RESULTS_PER_PAGE, synthetic_records, listing_pages
+
+PATHS = ('row-by-row', 'bulk', 'pages-row-by-row', 'pages-bulk', 'pages-pipeline')
+
+
+def scratch_engine(directory, name):
+    path = os.path.join(directory, name)
+    engine = create_engine(f"sqlite:///{path}")
+    init_db(engine)
+    return engine
+
+
+def run_row_by_row(engine, records, commit_every):
+    session = sessionmaker(bind=engine, autoflush=False)()
+    try:
+        for start in range(0, len(records), commit_every):
+            ingest_records_row_by_row(session, records[start:start + commit_every])
+            session.commit()
+    finally:
+        session.close()
+
+
+def run_bulk(engine, records, batch_size):
+    ingester = BulkIngester(engine)
+    for start in range(0, len(records), batch_size):
+        ingester.ingest(records[start:start + batch_size])
+
+
+def run_pages_row_by_row(engine, pages):
+    """The original scraper path: one BeautifulSoup parse and one commit per page."""
+    scraper = load_scraper()
+    session = sessionmaker(bind=engine, autoflush=False)()
+    try:
+        for html in pages:
+            scraper.process_page_documents(BeautifulSoup(html, "html.parser"), session)
+            session.commit()
+    finally:
+        session.close()
+
+
+def run_pages_bulk(engine, pages, parse):
+    ingester = BulkIngester(engine)
+    for html in pages:
+        ingester.ingest(parse(html).records)
+
+
+def run_pages_pipeline(engine, pages, parse, parse_workers, batch_size):
+    async def fetch(index):
+        return pages[index]
+
+    pipeline = IngestPipeline(BulkIngester(engine), parse, parse_workers, batch_size=batch_size)
+    print(pipeline.run(range(len(pages)), fetch).summary())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--records', type=int, default=100000)
+    parser.add_argument('--batch-size', type=int, default=None, help="Records per bulk batch (default: one batch).")
+    parser.add_argument('--before-records', type=int, default=None,
+                        help="Cap for the slow row-by-row runs (default: same as --records).")
+    parser.add_argument('--commit-every', type=int, default=RESULTS_PER_PAGE,
+                        help="Row-by-row commit interval (one listing page).")
+    parser.add_argument('--paths', default=','.join(PATHS), help=f"Comma-separated subset of: {', '.join(PATHS)}.")
+    parser.add_argument('--parser', choices=available_listing_parsers(),
+                        help="Listing parser for pages-bulk (default: the fastest installed).")
+    parser.add_argument('--parse-workers', type=int, default=None,
+                        help="Parser processes for pages-pipeline (default: one per CPU).")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help="Write the results to this JSON file.")
+    args = parser.parse_args(argv)
+
+    paths = [path.strip() for path in args.paths.split(',') if path.strip()]
+    unknown = set(paths).difference(PATHS)
+    if unknown:
+        parser.error(f"unknown paths: {', '.join(sorted(unknown))}")
+
+    parse = get_listing_parser(args.parser)
+    records = synthetic_records(args.records, args.seed)
+    before_records = records[:args.before_records or args.records]
+    batch_size = args.batch_size or len(records)
+    pages = {}
+    if 'pages-row-by-row' in paths:
+        pages['before'] = list(listing_pages(before_records, seed=args.seed))
+    if 'pages-bulk' in paths or 'pages-pipeline' in paths:
+        pages['all'] = list(listing_pages(records, seed=args.seed))
+
+    runs = {
+        'row-by-row': (lambda engine: run_row_by_row(engine, before_records, args.commit_every), len(before_records)),
+        'bulk': (lambda engine: run_bulk(engine, records, batch_size), len(records)),
+        'pages-row-by-row': (lambda engine: run_pages_row_by_row(engine, pages['before']), len(before_records)),
+        'pages-bulk': (lambda engine: run_pages_bulk(engine, pages['all'], parse), len(records)),
+        'pages-pipeline': (lambda engine: run_pages_pipeline(engine, pages['all'], parse, args.parse_workers,
+                                                             args.batch_size or 500), len(records)),
+    }
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for path in paths:
+            run, rows = runs[path]
+            engine = scratch_engine(directory, f"{path}.db")
+            results[path] = {'rows': rows, 'rows_per_sec': round(timed(path, lambda: run(engine), rows), 1)}
+            engine.dispose()
+
+    if 'row-by-row' in results and 'bulk' in results:
+        print(f"speed-up: {results['bulk']['rows_per_sec'] / results['row-by-row']['rows_per_sec']:.1f}x")
+    if args.json:
+        write_results(args.json, 'ingest', vars(args), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# benchmarks/bench_parse.py
+"""
+Listing-page parse throughput for every installed parser in app/parsing.py,
+with a golden check before timing: each parser must return exactly what
+the reference (the original full html.parser tree) returns, records and
+page count alike, and for generated pages the records they were generated
+from.
+
+    python benchmarks/bench_parse.py --pages 200 --json results/parse.json
+    python benchmarks/bench_parse.py --pages-dir saved_pages/
+
+--pages-dir runs over saved listing pages (*.html), e.g. pages downloaded
+from the portal or written by `python benchmarks/corpus.py --html-dir`.
+The hand-written edge cases in benchmarks/fixtures/ (odd whitespace,
+entities, comments, missing links and spans) are always checked as well.
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+# Add the project root to the Python path to import app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.harness import PROJECT_ROOT, use_scratch_database, write_results
+
+use_scratch_database()
+
+from app.parsing import LISTING_PARSERS, available_listing_parsers, parse_listing_reference
+from benchmarks.corpus import RESULTS_PER_PAGE, synthetic_records, listing_pages
+
+FIXTURES_DIR = os.path.join(PROJECT_ROOT, 'benchmarks', 'fixtures')
+
+
+def load_pages(directory):
+    paths = sorted(glob.glob(os.path.join(directory, '*.html')))
+    pages = []
+    for path in paths:
+        with open(path, encoding='utf-8', errors='replace') as handle:
+            pages.append(handle.read())
+    return pages
+
+
+def golden_mismatch(parse, pages, golden, expected_records=None):
+    """Describes the first page where `parse` disagrees with the golden output, or returns None."""
+    for index, (html, reference) in enumerate(zip(pages, golden)):
+        page = parse(html)
+        if page != reference:
+            differing = next((i for i, (a, b) in enumerate(zip(page.records, reference.records)) if a != b), None)
+            return (f"page {index}: {len(page.records)} records / {page.total_pages} pages, "
+                    f"reference {len(reference.records)} / {reference.total_pages}"
+                    + (f"; first difference at record {differing}: {page.records[differing]!r} "
+                       f"!= {reference.records[differing]!r}" if differing is not None else ""))
+    if expected_records is not None:
+        parsed = [record for reference in golden for record in reference.records]
+        if parsed != expected_records:
+            return "reference output differs from the generated records"
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=200, help="Generated pages (ignored with --pages-dir).")
+    parser.add_argument('--per-page', type=int, default=RESULTS_PER_PAGE)
+    parser.add_argument('--pages-dir', help="Benchmark saved listing pages (*.html) instead of generated ones.")
+    parser.add_argument('--parsers', default=','.join(LISTING_PARSERS),
+                        help="Comma-separated subset of the listing parsers.")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed passes per parser; the best one counts.")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help="Write the results to this JSON file.")
+    args = parser.parse_args(argv)
+
+    expected_records = None
+    if args.pages_dir:
+        pages = load_pages(args.pages_dir)
+        if not pages:
+            parser.error(f"no .html files in {args.pages_dir}")
+    else:
+        records = synthetic_records(args.pages * args.per_page, args.seed)
+        pages = list(listing_pages(records, args.per_page, args.seed))
+        # Listing pages don't carry abstracts (app/abstracts.py fetches them later).
+        expected_records = [record._replace(abstract=None) for record in records]
+    golden = [parse_listing_reference(html) for html in pages]
+    fixtures = load_pages(FIXTURES_DIR)
+    fixture_golden = [parse_listing_reference(html) for html in fixtures]
+    record_count = sum(len(page.records) for page in golden)
+    total_bytes = sum(len(html.encode('utf-8')) for html in pages)
+    print(f"{len(pages)} pages, {record_count} records, {total_bytes / 1e6:.1f} MB of HTML")
+
+    available = available_listing_parsers()
+    results = {}
+    for name in [name.strip() for name in args.parsers.split(',') if name.strip()]:
+        if name not in available:
+            print(f"{name:<12} not installed; skipped")
+            continue
+        parse = LISTING_PARSERS[name]
+        mismatch = (golden_mismatch(parse, fixtures, fixture_golden)
+                    or golden_mismatch(parse, pages, golden, expected_records))
+        if mismatch:
+            print(f"{name:<12} output differs from the reference ({mismatch}); skipped")
+            results[name] = {'matches': False}
+            continue
+
+        best = None
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            for html in pages:
+                parse(html)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = {
+            'matches': True,
+            'pages_per_sec': round(len(pages) / best, 1),
+            'records_per_sec': round(record_count / best, 1),
+            'mb_per_sec': round(total_bytes / 1e6 / best, 2),
+            'per_page_ms': round(best / len(pages) * 1000, 3),
+        }
+
+    baseline = results.get('reference', {}).get('pages_per_sec')
+    for name, result in results.items():
+        if result['matches']:
+            speedup = f"{result['pages_per_sec'] / baseline:6.1f}x" if baseline else ''
+            print(f"{name:<12} {result['pages_per_sec']:>8} pages/sec {result['records_per_sec']:>10} records/sec "
+                  f"{result['mb_per_sec']:>6} MB/sec {speedup}")
+
+    if args.json:
+        write_results(args.json, 'parse', vars(args), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# benchmarks/bench_related.py
+"""
+Related publications (app/related.py) on the synthetic corpus: time of a
+full build, of an incremental update after a further crawl, and lookup
+latency of the stored lists against an ad-hoc FTS query per publication
+(its title words OR-ed together, top 10 by bm25).
+
+    python benchmarks/bench_related.py --records 20000 --new 1000 --json results/related.json
+
+The incremental lists are also compared with a full rescoring using the
+same vocabulary and idf weights; 'agreement' is the share of neighbours
+they have in common (ties at the cut-off can make it slightly below 1).
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+from sqlalchemy import create_engine, text
+
+# Add the project root to the Python path to import app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.harness import use_scratch_database, latency_summary, write_results
+
+use_scratch_database()
+
+from app.database import init_db
+from app.ingest import BulkIngester
+from app.related import RelatedBuilder, load_terms, related_publications, term_matrix, tfidf, tokenize
+from benchmarks.corpus import synthetic_records
+
+FTS_BASELINE_SQL = text(
+    "SELECT rowid FROM publications_fts WHERE publications_fts MATCH :query ORDER BY rank LIMIT :limit"
+)
+
+
+def timed_update(builder, full):
+    started = time.perf_counter()
+    written = builder.update(full=full)
+    return written, time.perf_counter() - started
+
+
+def stored_lists(engine):
+    lists = {}
+    with engine.connect() as connection:
+        for publication_id, related_id in connection.execute(
+                text("SELECT publication_id, related_id FROM related_publications ORDER BY publication_id, rank")):
+            lists.setdefault(publication_id, []).append(related_id)
+    return lists
+
+
+def rescored_lists(engine, builder):
+    """Every list recomputed from scratch with the stored vocabulary and idf weights."""
+    with engine.connect() as connection:
+        ids, documents, roots = builder._documents(connection)
+        vocabulary, idf = load_terms(connection)
+    matrix = tfidf(term_matrix(documents, vocabulary), idf)
+    lists, _ = builder._score(matrix, ids, roots, np.arange(len(ids)), None)
+    return {publication_id: [related_id for related_id, _ in neighbours]
+            for publication_id, neighbours in lists.items() if neighbours}
+
+
+def agreement(engine, builder):
+    stored, rescored = stored_lists(engine), rescored_lists(engine, builder)
+    shared = sum(len(set(stored.get(publication_id, ())) & set(expected))
+                 for publication_id, expected in rescored.items())
+    return round(shared / max(1, sum(len(expected) for expected in rescored.values())), 4)
+
+
+def lookup_latencies(engine, ids, titles, limit):
+    related, fts = [], []
+    with engine.connect() as connection:
+        for publication_id in ids:
+            started = time.perf_counter()
+            related_publications(connection, publication_id, limit)
+            related.append(time.perf_counter() - started)
+
+            words = tokenize(titles[publication_id])
+            if not words:
+                continue
+            started = time.perf_counter()
+            connection.execute(FTS_BASELINE_SQL, {'query': ' OR '.join(words), 'limit': limit}).fetchall()
+            fts.append(time.perf_counter() - started)
+    return latency_summary(related), latency_summary(fts)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--records', type=int, default=20000, help="Publications in the initial build.")
+    parser.add_argument('--new', type=int, default=1000, help="Publications added before the incremental update.")
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--lookups', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help="Write the results to this JSON file.")
+    args = parser.parse_args(argv)
+
+    records = synthetic_records(args.records + args.new, args.seed)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'related.db')}")
+        init_db(engine)
+        ingester = BulkIngester(engine, dedup=False)
+        for start in range(0, args.records, 5000):
+            ingester.ingest(records[start:min(start + 5000, args.records)])
+        builder = RelatedBuilder(engine, args.k, log=lambda message: None)
+
+        written, elapsed = timed_update(builder, full=True)
+        results['full_build'] = {'publications': written, 'rows_per_sec': round(written / elapsed, 1)}
+        print(f"full build:         {written:>7} publications in {elapsed:6.2f}s")
+
+        ingester.ingest(records[args.records:])
+        written, elapsed = timed_update(builder, full=False)
+        results['incremental'] = {'new': args.new, 'lists_written': written, 'elapsed_ms': round(elapsed * 1000, 1),
+                                  'agreement': agreement(engine, builder)}
+        print(f"incremental update: {args.new:>7} new publications, {written} lists written in {elapsed:6.2f}s, "
+              f"agreement with a full rescoring {results['incremental']['agreement']:.4f}")
+
+        with engine.connect() as connection:
+            titles = dict(connection.execute(text("SELECT id, title FROM publications")).fetchall())
+        ids = random.Random(args.seed).sample(sorted(titles), min(args.lookups, len(titles)))
+        results['lookup'], results['fts_baseline'] = lookup_latencies(engine, ids, titles, args.k)
+        for name in ('lookup', 'fts_baseline'):
+            summary = results[name]
+            print(f"{name:<18}  p50 {summary['p50_ms']:8.3f} ms  p95 {summary['p95_ms']:8.3f} ms  "
+                  f"p99 {summary['p99_ms']:8.3f} ms")
+        engine.dispose()
+
+    if args.json:
+        write_results(args.json, 'related', vars(args), results)
+
+
+if __name__ == "__main__":
+    main()
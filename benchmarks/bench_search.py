@@ -0,0 +1,172 @@
+# benchmarks/bench_search.py
+"""
+Search latency percentiles through the Flask test client, for a mixed
+workload of full-text queries, sorts, filters, paging, the JSON API and
+author autocomplete, on a generated corpus.
+
+    python benchmarks/bench_search.py --scale 100k --requests 2000 --json results/search.json
+
+The corpus database is built once per scale and seed under --data-dir and
+reused afterwards. The result cache is off unless --cache is given, so the
+numbers measure the queries rather than cache hits.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+# Add the project root to the Python path to import app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.harness import SCALES, parse_scale, latency_summary, write_results
+
+# Share of each request type in the workload.
+WORKLOAD = {
+    'term': 25,
+    'two_terms': 20,
+    'phrase': 8,
+    'prefix': 8,
+    'newest': 8,
+    'year_filter': 8,
+    'year_browse': 4,
+    'author_filter': 5,
+    'browse': 5,
+    'next_page': 5,
+    'api_search': 5,
+    'suggest': 3,
+}
+
+
+class Workload:
+    """Deterministic stream of requests built from the corpus vocabulary (`topics`)."""
+
+    def __init__(self, client, seed, topics, author_ids, author_prefixes):
+        self.client = client
+        self.rng = random.Random(seed)
+        self.topics = topics
+        self.author_ids = author_ids
+        self.author_prefixes = author_prefixes
+        self.kinds = list(WORKLOAD)
+        self.weights = [WORKLOAD[kind] for kind in self.kinds]
+
+    def _words(self, count):
+        return " ".join(self.rng.sample(self.topics, count))
+
+    def next_request(self):
+        kind = self.rng.choices(self.kinds, weights=self.weights)[0]
+        if kind == 'term':
+            return kind, {'query': self._words(1)}
+        if kind == 'two_terms':
+            return kind, {'query': self._words(2)}
+        if kind == 'phrase':
+            return kind, {'query': f'"{self._words(2)}"'}
+        if kind == 'prefix':
+            return kind, {'query': self.rng.choice(self.topics)[:4] + '*'}
+        if kind == 'newest':
+            return kind, {'query': self._words(1), 'sort': 'newest'}
+        if kind == 'year_filter':
+            start = self.rng.randint(1995, 2020)
+            return kind, {'query': self._words(1), 'year_from': start, 'year_to': start + 5}
+        if kind == 'year_browse':
+            start = self.rng.randint(1995, 2020)
+            return kind, {'year_from': start, 'year_to': start + self.rng.choice([0, 5, 20])}
+        if kind == 'author_filter':
+            return kind, {'author': self.rng.choice(self.author_ids)}
+        if kind == 'browse':
+            return kind, {}
+        if kind == 'next_page':
+            return kind, {'query': self._words(1)}
+        if kind == 'api_search':
+            return kind, {'query': self._words(2), 'fields': 'id,title,publication_year,authors'}
+        return kind, {'q': self.rng.choice(self.author_prefixes)}
+
+    def run_one(self):
+        """Issues one request and returns (kind, seconds) for the measured part."""
+        kind, params = self.next_request()
+        if kind == 'next_page':
+            # Measure the second page, reached through the API's cursor.
+            first = self.client.get('/api/search', query_string=dict(params, fields='id'))
+            cursor = first.get_json().get('next_cursor')
+            if cursor:
+                params = dict(params, after=cursor)
+            path = '/'
+        elif kind == 'api_search':
+            path = '/api/search'
+        elif kind == 'suggest':
+            path = '/api/authors/suggest'
+        else:
+            path = '/'
+        started = time.perf_counter()
+        response = self.client.get(path, query_string=params)
+        elapsed = time.perf_counter() - started
+        if response.status_code != 200:
+            raise RuntimeError(f"{kind} {params} -> HTTP {response.status_code}")
+        return kind, elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scale', default='10k', help=f"One of {', '.join(SCALES)} or a record count.")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--warmup', type=int, default=100, help="Requests issued before measuring.")
+    parser.add_argument('--cache', action='store_true', help="Leave the result cache enabled.")
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'vertical_search_bench'),
+                        help="Where corpus databases are built and kept between runs.")
+    parser.add_argument('--json', help="Write the results to this JSON file.")
+    args = parser.parse_args(argv)
+
+    count = parse_scale(args.scale)
+    os.makedirs(args.data_dir, exist_ok=True)
+    path = os.path.join(args.data_dir, f"corpus-{count}-{args.seed}.db")
+
+    # app.database opens DATABASE_URL when it is first imported, so nothing
+    # from app (or benchmarks.corpus, which uses it) is imported before this.
+    os.environ['DATABASE_URL'] = f"sqlite:///{path}"
+    os.environ['RESULT_CACHE_SIZE'] = os.environ.get('RESULT_CACHE_SIZE', '1024') if args.cache else '0'
+    from sqlalchemy import text
+    from app import create_app
+    from app.database import engine
+    from benchmarks import corpus
+    corpus.build_database(path, count, args.seed)
+
+    app = create_app()
+    client = app.test_client()
+    with engine.connect() as connection:
+        author_ids = [row[0] for row in connection.execute(text(
+            "SELECT author_id FROM facet_author_counts ORDER BY count DESC LIMIT 200"
+        ))]
+        author_prefixes = [row[0][:n] for row in connection.execute(text(
+            "SELECT normalized_name FROM authors ORDER BY random() LIMIT 200"
+        )) for n in (2, 4, 6)]
+
+    workload = Workload(client, args.seed, corpus.TOPICS, author_ids, author_prefixes)
+    for _ in range(args.warmup):
+        workload.run_one()
+
+    samples = {kind: [] for kind in WORKLOAD}
+    started = time.perf_counter()
+    for _ in range(args.requests):
+        kind, elapsed = workload.run_one()
+        samples[kind].append(elapsed)
+    wall = time.perf_counter() - started
+
+    results = {'overall': latency_summary([value for values in samples.values() for value in values])}
+    results['overall']['requests_per_sec'] = round(args.requests / wall, 1)
+    for kind, values in samples.items():
+        results[kind] = latency_summary(values)
+
+    print(f"{'kind':<14} {'count':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    for kind, summary in results.items():
+        if summary['count']:
+            print(f"{kind:<14} {summary['count']:>6} {summary['p50_ms']:>7.2f}ms {summary['p95_ms']:>7.2f}ms "
+                  f"{summary['p99_ms']:>7.2f}ms {summary['max_ms']:>7.2f}ms")
+    print(f"throughput: {results['overall']['requests_per_sec']} requests/sec (single client)")
+    if args.json:
+        write_results(args.json, 'search', dict(vars(args), records=count), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+# benchmarks/bench_snapshot.py
+"""
+Memory-mapped search snapshots (app/snapshot.py) against the database on a
+generated corpus:
+
+- export: time to write a snapshot and its size next to the database file,
+- agreement: a mixed workload of searches (words, phrases, prefixes, OR,
+  NOT, column filters, year and author filters, both sorts, second pages)
+  and listings run on both backends; 'identical' is the share of pages
+  whose hits (ids, ranks, highlights, snippets, authors) and cursors are
+  exactly the same, plus the same check for facet counts,
+- latency percentiles of each backend for the same workload,
+- hot swap: a newer snapshot is published while a store is serving; the
+  store must switch to it, and the old snapshot must keep answering after
+  its files are pruned.
+
+    python benchmarks/bench_snapshot.py --scale 100k --queries 1000 --json results/snapshot.json
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+# Add the project root to the Python path to import app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.harness import SCALES, parse_scale, latency_summary, write_results
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def workload(rng, topics, author_ids, count):
+    """(search arguments, facet arguments) pairs; cursors are filled in while running."""
+    from app.search import SearchFilters
+    requests = []
+    for _ in range(count):
+        words = rng.sample(topics, 3)
+        query = rng.choice([
+            words[0], f"{words[0]} {words[1]}", f'"{words[0]} {words[1]}"', words[0][:4] + '*',
+            f"{words[0]} OR {words[1]}", f"{words[0]} -{words[1]}", f"title:{words[0]}",
+            f'abstract:"{words[0]}" {words[2]}', '',
+        ])
+        filters = None
+        if rng.random() < 0.2:
+            start = rng.randint(1995, 2020)
+            filters = SearchFilters(start, start + 5)
+        elif rng.random() < 0.1:
+            filters = SearchFilters(author_ids=(rng.choice(author_ids),))
+        arguments = {'sort': rng.choice(['relevance', 'relevance', 'newest']), 'page_size': 20,
+                     'filters': filters, 'collapse': rng.random() < 0.8, 'second_page': rng.random() < 0.2}
+        requests.append((query, arguments))
+    return requests
+
+
+def run_page(backend, query, arguments, after=None):
+    options = dict(page_size=arguments['page_size'], after=after, filters=arguments['filters'],
+                   collapse=arguments['collapse'])
+    if query:
+        return backend['search'](query, sort=arguments['sort'], **options)
+    return backend['browse'](**options)
+
+
+def compare(backends, requests, repeats):
+    """Runs every request on both backends; returns (identical pages, identical facets, latencies)."""
+    identical_pages = identical_facets = 0
+    latencies = {name: [] for name in backends}
+    for query, arguments in requests:
+        pages, facets = {}, {}
+        for name, backend in backends.items():
+            page = run_page(backend, query, arguments)
+            if arguments['second_page'] and page.next_cursor:
+                page = run_page(backend, query, arguments, page.next_cursor)
+            started = time.perf_counter()
+            for _ in range(repeats):
+                run_page(backend, query, arguments)
+            latencies[name].append((time.perf_counter() - started) / repeats)
+            pages[name] = page
+            facets[name] = backend['facets'](query, arguments['filters'])
+        sqlite_page, snapshot_page = pages['sqlite'], pages['snapshot']
+        identical_pages += sqlite_page == snapshot_page
+        identical_facets += facets['sqlite'] == facets['snapshot']
+    return identical_pages, identical_facets, latencies
+
+
+def hot_swap(engine, root):
+    """Publishes two snapshots through a serving store; returns what the store saw."""
+    from app.snapshot import SnapshotStore, export_snapshot
+    store = SnapshotStore(root, check_interval=0, log=lambda message: None)
+    first = store.current()
+    version = export_snapshot(engine, root, keep=1, log=lambda message: None)
+    second = store.current()
+    # keep=1 deleted the first snapshot's files while it is still mapped.
+    still_served = len(first.search_publications('market', page_size=5).hits) > 0
+    return {'swapped': second.version == version and first.version != version,
+            'old_snapshot_served_after_prune': still_served}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scale', default='10k', help=f"One of {', '.join(SCALES)} or a record count.")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--repeats', type=int, default=3, help="Timed runs of each request per backend.")
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'vertical_search_bench'),
+                        help="Where corpus databases are built and kept between runs.")
+    parser.add_argument('--json', help="Write the results to this JSON file.")
+    args = parser.parse_args(argv)
+
+    count = parse_scale(args.scale)
+    os.makedirs(args.data_dir, exist_ok=True)
+    path = os.path.join(args.data_dir, f"corpus-{count}-{args.seed}.db")
+    # app.database opens DATABASE_URL when it is first imported.
+    os.environ['DATABASE_URL'] = f"sqlite:///{path}"
+    from functools import partial
+    from sqlalchemy import text
+    from app.database import engine, reader_engine
+    from app.facets import facet_counts
+    from app.search import search_publications, browse_publications
+    from app.snapshot import Snapshot, export_snapshot
+    from benchmarks import corpus
+    corpus.build_database(path, count, args.seed)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as root:
+        started = time.perf_counter()
+        version = export_snapshot(engine, root, log=lambda message: None)
+        elapsed = time.perf_counter() - started
+        snapshot = Snapshot(os.path.join(root, version))
+        results['export'] = {'publications': count, 'rows_per_sec': round(count / elapsed, 1),
+                             'snapshot_mb': round(directory_size(os.path.join(root, version)) / 2 ** 20, 1),
+                             'database_mb': round(os.path.getsize(path) / 2 ** 20, 1)}
+        print(f"export: {count} publications in {elapsed:.2f}s, snapshot {results['export']['snapshot_mb']} MB "
+              f"(database {results['export']['database_mb']} MB)")
+
+        with reader_engine.connect() as connection:
+            author_ids = [row[0] for row in connection.execute(text(
+                "SELECT author_id FROM facet_author_counts ORDER BY count DESC LIMIT 200"))]
+            backends = {
+                'sqlite': {'search': partial(search_publications, connection),
+                           'browse': partial(browse_publications, connection),
+                           'facets': partial(facet_counts, connection)},
+                'snapshot': {'search': snapshot.search_publications, 'browse': snapshot.browse_publications,
+                             'facets': snapshot.facet_counts},
+            }
+            requests = workload(random.Random(args.seed), corpus.TOPICS, author_ids, args.queries)
+            identical_pages, identical_facets, latencies = compare(backends, requests, args.repeats)
+
+        results['agreement'] = {'requests': len(requests), 'identical_pages': round(identical_pages / len(requests), 4),
+                                'identical_facets': round(identical_facets / len(requests), 4)}
+        print(f"agreement: {len(requests)} requests, identical pages {results['agreement']['identical_pages']:.1%}, "
+              f"identical facets {results['agreement']['identical_facets']:.1%}")
+        for name, values in latencies.items():
+            results[name] = latency_summary(values)
+            summary = results[name]
+            print(f"{name:<9} p50 {summary['p50_ms']:8.3f} ms  p95 {summary['p95_ms']:8.3f} ms  "
+                  f"p99 {summary['p99_ms']:8.3f} ms  max {summary['max_ms']:8.3f} ms")
+
+        results['hot_swap'] = hot_swap(engine, root)
+        print(f"hot swap: switched to the new snapshot {results['hot_swap']['swapped']}, old snapshot still "
+              f"served after pruning {results['hot_swap']['old_snapshot_served_after_prune']}")
+
+    if args.json:
+        write_results(args.json, 'snapshot', dict(vars(args), records=count), results)
+
+
+if __name__ == "__main__":
+    main()
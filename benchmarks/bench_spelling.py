@@ -0,0 +1,154 @@
+# benchmarks/bench_spelling.py
+"""
+Query sanitizing (app/query.py) and "did you mean" suggestions
+(app/spelling.py) on the synthetic corpus:
+
+- fuzz: random search box input with quotes, brackets, operators and
+  column filters, run as typed (the old behaviour) and through the
+  sanitizer; counts the queries that raise a MATCH error,
+- spelling: corpus words with one random edit (deletion, insertion,
+  substitution or transposition), alone or next to a correct word;
+  accuracy is the share whose first suggestion restores the word (same
+  index term), with suggestion latency percentiles,
+- the time to build the spelling dictionary from the index vocabulary.
+
+    python benchmarks/bench_spelling.py --records 20000 --queries 500 --json results/spelling.json
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+# Add the project root to the Python path to import app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.harness import use_scratch_database, latency_summary, write_results
+
+use_scratch_database()
+
+from app.database import init_db
+from app.ingest import BulkIngester
+from app.search import search_publications
+from app.spelling import DEFAULT_BUDGET_MS, index_terms, index_tokenizer, refresh_spelling, suggest_queries
+from benchmarks.corpus import TOPICS, synthetic_records
+
+FUZZ_PIECES = ['"', '(', ')', '*', ':', '-', '^', '+', 'OR', 'AND', 'NOT', 'NEAR', 'title:', 'abstract:',
+               'author:', '{', '}', ',', "'", '&']
+
+
+def fuzz_query(rng):
+    pieces = []
+    for _ in range(rng.randint(1, 6)):
+        if rng.random() < 0.5:
+            pieces.append(rng.choice(TOPICS))
+        else:
+            pieces.append(rng.choice(FUZZ_PIECES))
+    return (' ' if rng.random() < 0.6 else '').join(pieces)
+
+
+def misspell(word, rng):
+    """`word` with one random edit that doesn't give it back unchanged."""
+    while True:
+        i = rng.randrange(len(word))
+        edit = rng.randrange(4)
+        if edit == 0:
+            typo = word[:i] + word[i + 1:]
+        elif edit == 1:
+            typo = word[:i] + rng.choice(string.ascii_lowercase) + word[i:]
+        elif edit == 2:
+            typo = word[:i] + rng.choice(string.ascii_lowercase) + word[i + 1:]
+        else:
+            i = min(i, len(word) - 2)
+            typo = word[:i] + word[i + 1] + word[i] + word[i + 2:]
+        if typo != word:
+            return typo
+
+
+def run_fuzz(engine, count, seed):
+    rng = random.Random(seed)
+    raw_errors = sanitized_errors = 0
+    with engine.connect() as connection:
+        for _ in range(count):
+            query = fuzz_query(rng)
+            try:
+                connection.execute(text("SELECT count(*) FROM publications_fts WHERE publications_fts MATCH :query"),
+                                   {'query': query}).scalar()
+            except OperationalError:
+                raw_errors += 1
+            try:
+                search_publications(connection, query, page_size=10)
+            except OperationalError:
+                sanitized_errors += 1
+    return {'queries': count, 'raw_match_errors': raw_errors, 'sanitized_errors': sanitized_errors}
+
+
+def run_spelling(engine, count, seed, budget_ms):
+    rng = random.Random(seed)
+    words = [word for word in TOPICS if len(word) >= 5]
+    correct = suggested = 0
+    latencies = []
+    with engine.connect() as connection:
+        tokenizer = index_tokenizer(connection)
+        for _ in range(count):
+            word = rng.choice(words)
+            typo = misspell(word, rng)
+            if index_terms(typo, tokenizer) == index_terms(word, tokenizer):
+                typo = misspell(word, rng) # e.g. a dropped trailing 's' that stemming ignores anyway
+            query = typo if rng.random() < 0.5 else f"{rng.choice(words)} {typo}"
+            started = time.perf_counter()
+            suggestions = suggest_queries(connection, query, budget_ms)
+            latencies.append(time.perf_counter() - started)
+            if suggestions:
+                suggested += 1
+                replaced = dict(suggestions[0].corrections).get(typo)
+                if replaced and index_terms(replaced, tokenizer) == index_terms(word, tokenizer):
+                    correct += 1
+    return dict(latency_summary(latencies), queries=count, suggested=round(suggested / count, 4),
+                accuracy=round(correct / count, 4))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--queries', type=int, default=500, help="Misspelled queries (and twice as many fuzz queries).")
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help="Write the results to this JSON file.")
+    args = parser.parse_args(argv)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'spelling.db')}")
+        init_db(engine)
+        BulkIngester(engine, dedup=False).ingest(synthetic_records(args.records, args.seed))
+
+        started = time.perf_counter()
+        with engine.begin() as connection:
+            added, _ = refresh_spelling(connection)
+        results['dictionary'] = {'terms': added, 'build_ms': round((time.perf_counter() - started) * 1000, 1)}
+        print(f"dictionary: {added} terms in {results['dictionary']['build_ms']:.0f} ms")
+
+        results['fuzz'] = run_fuzz(engine, 2 * args.queries, args.seed)
+        print(f"fuzz: {results['fuzz']['queries']} queries, {results['fuzz']['raw_match_errors']} MATCH errors as typed, "
+              f"{results['fuzz']['sanitized_errors']} after sanitizing")
+
+        results['spelling'] = run_spelling(engine, args.queries, args.seed, args.budget_ms)
+        spelling = results['spelling']
+        print(f"spelling: {spelling['queries']} misspelled queries, suggestion for {spelling['suggested']:.1%}, "
+              f"first suggestion right for {spelling['accuracy']:.1%}")
+        print(f"  latency p50 {spelling['p50_ms']:.2f} ms  p95 {spelling['p95_ms']:.2f} ms  "
+              f"p99 {spelling['p99_ms']:.2f} ms  max {spelling['max_ms']:.2f} ms (budget {args.budget_ms:.0f} ms)")
+        engine.dispose()
+
+    if args.json:
+        write_results(args.json, 'spelling', vars(args), results)
+
+
+if __name__ == "__main__":
+    main()
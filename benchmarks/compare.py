@@ -0,0 +1,79 @@
+# benchmarks/compare.py
+"""
+Compares two benchmark result files written with --json (e.g. from the
+parent commit and from a branch) and flags metrics that got worse.
+
+    python benchmarks/compare.py results/main/search.json results/branch/search.json --threshold 10
+
+Metrics ending in '_per_sec' are better when higher, metrics ending in '_ms'
+when lower; everything else is ignored. Exits with status 1 if any metric
+regressed by more than --threshold percent.
+"""
+import argparse
+import json
+import os
+import sys
+
+# Add the project root to the Python path to import app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+def flatten(results, prefix=''):
+    """{'search': {'p50_ms': 1}} -> {'search.p50_ms': 1}, numeric leaves only."""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(before, after, threshold):
+    """Returns [(metric, before, after, change %, regressed)] for comparable metrics."""
+    rows = []
+    old, new = flatten(before['results']), flatten(after['results'])
+    for metric in sorted(set(old) & set(new)):
+        if metric.endswith('_per_sec'):
+            higher_is_better = True
+        elif metric.endswith('_ms'):
+            higher_is_better = False
+        else:
+            continue
+        if not old[metric]:
+            continue
+        change = (new[metric] - old[metric]) / old[metric] * 100
+        worse = -change if higher_is_better else change
+        rows.append((metric, old[metric], new[metric], change, worse > threshold))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=10.0, help="Allowed regression in percent.")
+    args = parser.parse_args(argv)
+
+    with open(args.before) as handle:
+        before = json.load(handle)
+    with open(args.after) as handle:
+        after = json.load(handle)
+    if before['benchmark'] != after['benchmark']:
+        parser.error(f"different benchmarks: {before['benchmark']} vs {after['benchmark']}")
+    if before['params'] != after['params']:
+        print("Warning: the runs used different parameters; differences may not be meaningful.")
+
+    print(f"{before['benchmark']}: {before.get('commit')} -> {after.get('commit')}")
+    rows = compare(before, after, args.threshold)
+    for metric, old, new, change, regressed in rows:
+        flag = '  REGRESSION' if regressed else ''
+        print(f"{metric:<40} {old:>12.3f} {new:>12.3f} {change:>+8.1f}%{flag}")
+    regressions = sum(1 for row in rows if row[-1])
+    print(f"{regressions} regression(s) beyond {args.threshold:.0f}%")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,338 @@
+# benchmarks/corpus.py
+"""
+Deterministic synthetic corpus: publications with realistic titles,
+abstracts, years and a skewed author distribution, plus PurePortal-style
+listing pages for the parse and ingest benchmarks.
+
+    python benchmarks/corpus.py --scale 100k --db /tmp/corpus-100k.db
+    python benchmarks/corpus.py --scale 10k --html-dir /tmp/listing-pages
+
+The same scale and seed always produce the same records, so results from
+different commits are comparable.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from itertools import accumulate, islice
+
+from markupsafe import escape
+
+# Add the project root to the Python path to import app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.ingest import PublicationRecord
+from benchmarks.harness import SCALES, parse_scale
+
+BASE_URL = 'https://pureportal.coventry.ac.uk'
+LISTING_PATH = '/en/organisations/school-of-economics-finance-and-accounting/publications/'
+RESULTS_PER_PAGE = 50
+
+TOPICS = (
+    "market finance economic growth policy bank risk capital labour trade inflation monetary "
+    "fiscal credit asset pricing volatility firm innovation tax evidence panel regional household "
+    "investment governance accounting audit disclosure emerging sustainable liquidity earnings "
+    "productivity entrepreneurship remittances microfinance sovereign debt exchange currency "
+    "commodity energy carbon climate pension insurance fintech blockchain cryptocurrency crowdfunding "
+    "dividend merger acquisition ownership board compensation tourism migration poverty inequality "
+    "education health housing mortgage securitisation derivatives hedging arbitrage sentiment"
+).split()
+
+# Frequent words dominate real titles, so topic words are drawn with Zipf weights.
+TOPIC_WEIGHTS = list(accumulate(1.0 / (rank + 1) for rank in range(len(TOPICS))))
+
+REGIONS = ("the UK", "Nigeria", "China", "the Eurozone", "India", "Brazil", "Sub-Saharan Africa",
+           "the GCC", "Vietnam", "Turkey", "OECD countries", "emerging markets", "Ghana", "Poland")
+
+METHODS = ("a panel data approach", "a DSGE model", "machine learning", "a difference-in-differences design",
+           "quantile regression", "a GARCH framework", "an event study", "a systematic review",
+           "survey evidence", "a structural VAR")
+
+TITLE_TEMPLATES = (
+    "The effect of {a} on {b}: evidence from {region}",
+    "{A} and {b} in {region}",
+    "{A}, {b} and {c}: {method}",
+    "Does {a} affect {b}? Evidence from {region}",
+    "Revisiting the {a}-{b} nexus using {method}",
+    "{A} {b} and firm {c}",
+    "Measuring {a} {b} with {method}",
+    "{A} {b}: a review",
+)
+
+ABSTRACT_SENTENCES = (
+    "This paper examines the relationship between {a} and {b} in {region}.",
+    "Using {method}, we analyse {a} over the period {start}-{end}.",
+    "We find that {a} has a significant {direction} effect on {b}.",
+    "The results are robust to alternative measures of {c} and {a}.",
+    "Our findings have implications for {b} policy and {c} regulation.",
+    "We contribute to the literature on {a} by documenting the role of {c}.",
+    "The evidence suggests that {b} responds asymmetrically to {a} shocks.",
+    "Data are drawn from {n} firms listed in {region}.",
+    "Policy makers should consider {a} when designing {b} interventions.",
+    "These effects are stronger for firms with high {c}.",
+)
+
+SURNAMES = ("Smith", "Jones", "Patel", "Okafor", "Adeyemi", "Müller", "Šimić", "García", "Nguyễn",
+            "Øyen", "Kowalski", "Zhang", "Wang", "Khan", "Ahmed", "Brown", "Taylor", "Wilson", "Ibrahim",
+            "Dubois", "Rossi", "Novák", "Fernández", "O'Neill", "Mensah", "Chukwu", "Sato", "Kim",
+            "Özdemir", "Łukasik", "Björk", "Popescu", "Hernández", "Silva", "Costa", "Ali", "Hughes")
+
+# Invented surnames (prefix + suffix) keep a 250k-author pool mostly free of
+# accidental namesakes; the real surnames above supply the diacritics.
+SURNAME_PREFIXES = ("Ade", "Oka", "Ber", "Kowa", "Naka", "Hal", "Mor", "Fitz", "Van", "Ols", "Pet", "Lind",
+                    "Gut", "Ros", "Bal", "Chi", "Dra", "Eke", "Fer", "Gal", "Har", "Ish", "Jov", "Kar",
+                    "Lom", "Mba", "Nor", "Oye", "Pra", "Quin", "Rad", "Sol", "Tor", "Ug", "Vel", "Wes")
+SURNAME_SUFFIXES = ("yemi", "for", "ger", "lski", "mura", "ley", "gan", "gerald", "dyke", "son", "rov",
+                    "qvist", "iérrez", "ová", "kovic", "ini", "ezie", "wood", "berg", "ham", "ton", "ić",
+                    "etti", "ou", "ani", "sen", "ström", "ski", "ado", "ola")
+
+GIVEN_NAMES = ("James", "Mary", "Oluwaseun", "Chinedu", "Amina", "Wei", "Priya", "José", "Zoë",
+               "Ana-Marija", "Jürgen", "Fatima", "Kwame", "Siobhán", "Thu", "Lars", "Agnieszka",
+               "Mehmet", "Élodie", "Giulia", "Tomás", "Hiroshi", "Min-jun", "Rahul", "Grace", "David")
+
+MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+FIRST_YEAR, LAST_YEAR = 1990, 2025
+# Output grows over time: later years get proportionally more publications.
+YEAR_WEIGHTS = list(accumulate(1 + (year - FIRST_YEAR) for year in range(FIRST_YEAR, LAST_YEAR + 1)))
+
+
+def _author_name(rng):
+    if rng.random() < 0.3:
+        surname = rng.choice(SURNAMES)
+    else:
+        surname = rng.choice(SURNAME_PREFIXES) + rng.choice(SURNAME_SUFFIXES)
+    if rng.random() < 0.15:
+        surname = f"{surname}-{rng.choice(SURNAMES)}"
+    given = rng.choice(GIVEN_NAMES)
+    middle = "".join(f" {chr(65 + rng.randrange(26))}." for _ in range(rng.choice((0, 1, 1, 2, 2))))
+    return surname, given, f"{surname}, {given[0]}.{middle}"
+
+
+def author_pool(size, seed=42):
+    """
+    (name, link, variant) for `size` authors. Names are 'Surname, I.' like on
+    PurePortal and unique, as the authors table requires; about 2% of authors
+    also appear under a spelled-out variant ('Surname, Given') with the same
+    profile link.
+    """
+    rng = random.Random(seed)
+    authors = []
+    seen = set()
+    for n in range(size):
+        for _ in range(20):
+            surname, given, name = _author_name(rng)
+            if name not in seen:
+                break
+        else:
+            name = f"{name} ({n})" # Only once the combinations run out
+        seen.add(name)
+        link = f"{BASE_URL}/en/persons/{surname.lower()}-{n}"
+        variant = f"{surname}, {given}"
+        if rng.random() < 0.02 and variant not in seen:
+            seen.add(variant)
+        else:
+            variant = None
+        authors.append((name, link, variant))
+    return authors
+
+
+def _topic(rng):
+    return rng.choices(TOPICS, cum_weights=TOPIC_WEIGHTS)[0]
+
+
+def _fill(rng, template):
+    a, b, c = _topic(rng), _topic(rng), _topic(rng)
+    start = rng.randint(FIRST_YEAR - 20, LAST_YEAR - 10)
+    return template.format(
+        a=a, b=b, c=c, A=a.capitalize(), region=rng.choice(REGIONS), method=rng.choice(METHODS),
+        start=start, end=start + rng.randint(5, 20), n=rng.randint(50, 5000),
+        direction=rng.choice(("positive", "negative", "non-linear")),
+    )
+
+
+def generate_records(count, seed=42, authors=None):
+    """
+    Yields `count` PublicationRecords. Author productivity follows a Zipf
+    curve (a few prolific authors, a long tail), 3% of records have no year
+    and about 15% have no abstract.
+    """
+    rng = random.Random(seed)
+    authors = authors or author_pool(max(count // 4, 50), seed)
+    author_weights = list(accumulate(1.0 / (rank + 1) ** 0.8 for rank in range(len(authors))))
+    for n in range(count):
+        title = _fill(rng, rng.choice(TITLE_TEMPLATES))
+        if rng.random() < 0.15:
+            abstract = None
+        else:
+            abstract = " ".join(_fill(rng, sentence) for sentence in rng.sample(ABSTRACT_SENTENCES, rng.randint(4, 8)))
+        year = None if rng.random() < 0.03 else rng.choices(range(FIRST_YEAR, LAST_YEAR + 1), cum_weights=YEAR_WEIGHTS)[0]
+
+        record_authors = []
+        for index in sorted(set(rng.choices(range(len(authors)), cum_weights=author_weights, k=rng.randint(1, 6)))):
+            name, link, variant = authors[index]
+            record_authors.append((variant if variant and rng.random() < 0.5 else name, link))
+        slug = "-".join(title.lower().replace(":", "").replace("?", "").replace(",", "").split()[:8])
+        yield PublicationRecord(
+            f"{title} ({n})",
+            f"{BASE_URL}/en/publications/{slug}-{n}",
+            year,
+            abstract,
+            tuple(record_authors),
+        )
+
+
+def synthetic_records(count, seed=42, authors=None):
+    """generate_records() as a list."""
+    return list(generate_records(count, seed, authors))
+
+
+def _result_item_html(index, record, rng):
+    persons = ", ".join(
+        f'<a rel="Person" href="{escape(link)}" class="link person"><span>{escape(name)}</span></a>'
+        for name, link in record.authors
+    )
+    if record.publication_year:
+        date = f'<span class="date">{rng.randint(1, 28)} {rng.choice(MONTHS)} {record.publication_year}</span>'
+    else:
+        date = ''
+    return (
+        f'<li class="list-result-item list-result-item-{index}">'
+        f'<div class="result-container"><div class="rendering rendering_researchoutput '
+        f'rendering_researchoutput_portal-short rendering_contributiontojournal">'
+        f'<h3 class="title"><a rel="ContributionToJournal" href="{escape(record.publication_link)}" class="link">'
+        f'<span>{escape(record.title)}</span></a></h3>'
+        f'<div class="relations persons">{persons}</div>'
+        f'{date}'
+        f'<span class="journal"><a rel="Journal" href="{BASE_URL}/en/journals/j-{index}" class="link">'
+        f'<span>Journal of {escape(rng.choice(TOPICS).capitalize())} Studies</span></a></span>, '
+        f'<span class="volume">{rng.randint(1, 80)}</span>, '
+        f'<span class="numberofpages">{rng.randint(8, 40)} p.</span>'
+        f'<p class="type"><span class="type_family">Research output</span>'
+        f'<span class="type_family_sep">: </span><span class="type_classification_parent">'
+        f'Contribution to journal</span><span class="type_parent_sep"> › </span>'
+        f'<span class="type_classification">Article</span></p>'
+        f'</div></div></li>'
+    )
+
+
+def listing_page_html(records, page_index, total_pages, seed=42):
+    """
+    One listing page (`?page=page_index`, 0-based) in PurePortal's markup:
+    the result list parse_page_documents() reads, wrapped in the page chrome
+    and pagination that the real portal serves.
+    """
+    rng = random.Random(seed * 100003 + page_index)
+    items = "".join(_result_item_html(i, record, rng) for i, record in enumerate(records))
+    steps = sorted({0, 1, 2, page_index - 1, page_index + 1, total_pages - 1} - {page_index})
+    pagination = "".join(
+        f'<li><a class="step" href="{LISTING_PATH}?page={step}">{step + 1}</a></li>'
+        for step in steps if 0 <= step < total_pages
+    )
+    navigation = "".join(
+        f'<li><a href="{BASE_URL}/en/{section}/" class="link">{section.capitalize()}</a></li>'
+        for section in ("persons", "organisations", "publications", "projects", "activities", "prizes")
+    )
+    return (
+        '<!DOCTYPE html><html lang="en"><head><meta charset="utf-8">'
+        '<title>Publications - Coventry University</title>'
+        f'<link rel="stylesheet" href="{BASE_URL}/portal-style.css">'
+        f'<script src="{BASE_URL}/portal-scripts.js"></script></head><body>'
+        f'<header id="header"><nav><ul class="main-navigation">{navigation}</ul></nav>'
+        '<form class="search-form" action="/en/searchAll/index/"><input type="text" name="search"></form></header>'
+        '<main id="main-content"><div class="page-content">'
+        '<h1 class="page-title">School of Economics, Finance and Accounting</h1>'
+        '<div class="search-pager"><span class="search-result-info">'
+        f'{total_pages * RESULTS_PER_PAGE} results</span></div>'
+        f'<ul class="list-results">{items}</ul>'
+        f'<nav class="pages"><ul>{pagination}'
+        f'<li><span class="currentStep">{page_index + 1}</span></li></ul></nav>'
+        '</div></main><footer id="footer"><p>Powered by Pure</p></footer></body></html>'
+    )
+
+
+def listing_pages(records, per_page=RESULTS_PER_PAGE, seed=42):
+    """Yields the listing HTML for consecutive pages of `per_page` records."""
+    records = list(records)
+    total_pages = max(1, -(-len(records) // per_page))
+    for page_index in range(total_pages):
+        yield listing_page_html(records[page_index * per_page:(page_index + 1) * per_page], page_index, total_pages, seed)
+
+
+def write_listing_pages(records, directory, per_page=RESULTS_PER_PAGE, seed=42):
+    """Saves listing_pages() as page-00000.html, ... Returns the written paths."""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for page_index, html in enumerate(listing_pages(records, per_page, seed)):
+        path = os.path.join(directory, f"page-{page_index:05d}.html")
+        with open(path, 'w', encoding='utf-8') as handle:
+            handle.write(html)
+        paths.append(path)
+    return paths
+
+
+def build_database(path, count, seed=42, batch_size=5000):
+    """
+    Creates (or reuses) a SQLite database holding `count` generated records.
+    A sidecar JSON file records what was generated, so an existing file for
+    the same count and seed is reused instead of rebuilt.
+    """
+    from sqlalchemy import create_engine
+    from app.database import init_db
+    from app.ingest import BulkIngester
+
+    manifest_path = path + '.json'
+    manifest = {'count': count, 'seed': seed}
+    if os.path.exists(path) and os.path.exists(manifest_path):
+        with open(manifest_path) as handle:
+            if json.load(handle) == manifest:
+                print(f"Reusing corpus database {path}")
+                return path
+    for stale in (path, path + '-wal', path + '-shm', manifest_path):
+        if os.path.exists(stale):
+            os.remove(stale)
+
+    engine = create_engine(f"sqlite:///{path}")
+    init_db(engine)
+    ingester = BulkIngester(engine)
+    started = time.perf_counter()
+    records = generate_records(count, seed)
+    written = 0
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            break
+        ingester.ingest(batch)
+        written += len(batch)
+        if written % (batch_size * 20) == 0:
+            print(f"  {written} records...")
+    engine.dispose()
+    print(f"Built {path} with {written} records in {time.perf_counter() - started:.1f}s")
+    with open(manifest_path, 'w') as handle:
+        json.dump(manifest, handle)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scale', default='10k', help=f"One of {', '.join(SCALES)} or a record count.")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--db', help="Build a SQLite database with the corpus at this path.")
+    parser.add_argument('--html-dir', help="Write listing pages for the corpus into this directory.")
+    parser.add_argument('--per-page', type=int, default=RESULTS_PER_PAGE)
+    args = parser.parse_args(argv)
+
+    count = parse_scale(args.scale)
+    if not args.db and not args.html_dir:
+        parser.error("nothing to do: pass --db and/or --html-dir")
+    if args.db:
+        build_database(args.db, count, args.seed)
+    if args.html_dir:
+        paths = write_listing_pages(generate_records(count, args.seed), args.html_dir, args.per_page, args.seed)
+        print(f"Wrote {len(paths)} listing pages to {args.html_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# benchmarks/fixture_server.py
+"""
+Local stand-in for the PurePortal listing: serves the synthetic listing
+pages from benchmarks/corpus.py at the real listing path, with `?page=N`
+(0-based, like the portal) and strong ETags, answering If-None-Match with
+304 Not Modified. Lets the crawler be exercised without the network:
+
+    python benchmarks/fixture_server.py --pages 10 --port 8000
+    python scripts/scrape_publications.py --no-browser --rate 50 \\
+        --base-url http://127.0.0.1:8000/en/organisations/school-of-economics-finance-and-accounting/publications/
+
+benchmarks/smoke_crawl.py drives both ends and checks the result.
+"""
+import argparse
+import hashlib
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# Add the project root to the Python path to import app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.corpus import LISTING_PATH, RESULTS_PER_PAGE, listing_pages, synthetic_records
+
+
+class ListingHandler(BaseHTTPRequestHandler):
+    """GET handler for the listing path; every request is logged on the server as (page, status)."""
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        page_index, status = None, 404
+        if url.path == LISTING_PATH:
+            try:
+                page_index = int(parse_qs(url.query).get('page', ['0'])[0])
+            except ValueError:
+                page_index = None
+            pages = self.server.pages
+            if page_index is not None and 0 <= page_index < len(pages):
+                body, etag = pages[page_index]
+                status = 304 if self.headers.get('If-None-Match') == etag else 200
+        self.server.record(page_index, status)
+
+        self.send_response(status)
+        if status == 404:
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_header('ETag', etag)
+        if status == 304:
+            self.end_headers()
+            return
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # The request log on the server replaces the per-request stderr lines.
+
+
+class FixtureServer(ThreadingHTTPServer):
+    """
+    Serves `pages` (listing HTML, page 0 first) on `host`:`port` (0 picks a
+    free port) from a background thread; use as a context manager. Pages can
+    be swapped with set_pages() between crawls, e.g. to simulate new
+    publications arriving at the top of the listing. `requests` lists the
+    (page_index, status) of every request since the last reset_requests().
+    """
+    daemon_threads = True
+
+    def __init__(self, pages, host='127.0.0.1', port=0):
+        super().__init__((host, port), ListingHandler)
+        self.pages = []
+        self.requests = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self.set_pages(pages)
+
+    @property
+    def url(self):
+        """The listing root to pass to the scraper's --base-url."""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{LISTING_PATH}"
+
+    def set_pages(self, pages):
+        encoded = [html.encode('utf-8') for html in pages]
+        self.pages = [(body, f'"{hashlib.sha256(body).hexdigest()[:32]}"') for body in encoded]
+
+    def record(self, page_index, status):
+        with self._lock:
+            self.requests.append((page_index, status))
+
+    def reset_requests(self):
+        with self._lock:
+            requests, self.requests = self.requests, []
+        return requests
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=10, help="Listing pages to serve.")
+    parser.add_argument('--per-page', type=int, default=RESULTS_PER_PAGE)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args(argv)
+
+    records = synthetic_records(args.pages * args.per_page, args.seed)
+    with FixtureServer(listing_pages(records, args.per_page, args.seed), args.host, args.port) as server:
+        print(f"Serving {len(server.pages)} listing pages at {server.url} (Ctrl-C to stop)")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# benchmarks/harness.py
+"""
+Shared helpers for the benchmark scripts: timing, percentiles and the JSON
+result files that compare.py diffs between commits.
+"""
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+# Named corpus sizes accepted by --scale.
+SCALES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Importing the scraper (or app.database) opens DATABASE_URL, and the scraper
+# runs init_db() on it at import time. Benchmarks that don't choose a database
+# themselves get a throwaway one instead of the real vertical_search.db.
+SCRATCH_DATABASE_URL = f"sqlite:///{os.path.join(tempfile.gettempdir(), 'vertical_search_bench.db')}"
+
+
+def use_scratch_database():
+    """Call before importing app modules when the benchmark builds its own engines."""
+    os.environ.setdefault('DATABASE_URL', SCRATCH_DATABASE_URL)
+
+
+def load_scraper():
+    """Imports scripts/scrape_publications.py as a module (for parse_page_documents etc.)."""
+    use_scratch_database()
+    scripts_dir = os.path.join(PROJECT_ROOT, 'scripts')
+    if scripts_dir not in sys.path:
+        sys.path.append(scripts_dir)
+    import scrape_publications
+    return scrape_publications
+
+
+def parse_scale(value):
+    """'10k' / '100k' / '1m' or a plain number of records."""
+    return SCALES.get(value.lower()) or int(value)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def latency_summary(seconds):
+    """p50/p95/p99/max/mean in milliseconds for a list of durations in seconds."""
+    if not seconds:
+        return {'count': 0}
+    return {
+        'count': len(seconds),
+        'p50_ms': round(percentile(seconds, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(seconds, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(seconds, 0.99) * 1000, 3),
+        'max_ms': round(max(seconds) * 1000, 3),
+        'mean_ms': round(sum(seconds) / len(seconds) * 1000, 3),
+    }
+
+
+def timed(label, fn, rows):
+    """Runs fn() once and prints and returns its throughput in rows/sec."""
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<18} {rows:>8} rows in {elapsed:8.2f}s  ->  {rows / elapsed:10.0f} rows/sec")
+    return rows / elapsed
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(path, benchmark, params, results):
+    """
+    Writes one benchmark run as JSON. Metric names end in '_per_sec' (higher
+    is better) or '_ms' (lower is better) so compare.py knows which way a
+    change is a regression.
+    """
+    document = {
+        'benchmark': benchmark,
+        'commit': git_revision(),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'params': params,
+        'results': results,
+    }
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as handle:
+        json.dump(document, handle, indent=2, sort_keys=True)
+    print(f"Results written to {path}")
+    return document
@@ -0,0 +1,113 @@
+# benchmarks/smoke_crawl.py
+"""
+Smoke test of scripts/scrape_publications.py against the local fixture
+server (benchmarks/fixture_server.py), on a throwaway database:
+
+    python benchmarks/smoke_crawl.py --pages 10
+
+1. A first crawl fetches every page once and stores every publication.
+2. An incremental re-run gets 304 Not Modified for page 1 and stops there.
+3. After a page's worth of new publications appears at the top of the
+   listing, an incremental run stores them and stops at the next page,
+   which now holds only publications it has already seen.
+
+Exits non-zero if any check fails; --verbose shows the scraper's output.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+from sqlalchemy import create_engine, text
+
+# Add the project root to the Python path to import app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.corpus import RESULTS_PER_PAGE, listing_pages, synthetic_records
+from benchmarks.fixture_server import FixtureServer
+from benchmarks.harness import PROJECT_ROOT
+
+SCRAPER = os.path.join(PROJECT_ROOT, 'scripts', 'scrape_publications.py')
+
+
+def crawl(server, database_url, args):
+    """Runs the scraper against the fixture server; returns the (page_index, status) it requested."""
+    server.reset_requests()
+    command = [sys.executable, SCRAPER, '--base-url', server.url, '--no-browser', '--rate', str(args.rate),
+               '--max-in-flight', str(args.max_in_flight), '--max-pages', str(args.pages * 2)]
+    completed = subprocess.run(command, env=dict(os.environ, DATABASE_URL=database_url),
+                               capture_output=True, text=True)
+    if args.verbose or completed.returncode:
+        print(completed.stdout + completed.stderr)
+    if completed.returncode:
+        raise SystemExit(f"scrape_publications.py exited with {completed.returncode}")
+    return server.reset_requests()
+
+
+def stored_links(engine):
+    with engine.connect() as connection:
+        return set(connection.execute(text("SELECT publication_link FROM publications")).scalars())
+
+
+def crawl_completed(engine, root_url):
+    with engine.connect() as connection:
+        return bool(connection.execute(
+            text("SELECT completed FROM crawl_checkpoints WHERE root_url = :url"), {'url': root_url}).scalar())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=10, help="Listing pages served on the first crawl.")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--rate', type=float, default=200.0, help="Requests per second passed to the scraper.")
+    parser.add_argument('--max-in-flight', type=int, default=4)
+    parser.add_argument('--verbose', action='store_true', help="Print the scraper's output for every run.")
+    args = parser.parse_args(argv)
+
+    # The first page's worth of records only shows up for the third crawl.
+    records = synthetic_records((args.pages + 1) * RESULTS_PER_PAGE, args.seed)
+    fresh, initial = records[:RESULTS_PER_PAGE], records[RESULTS_PER_PAGE:]
+    failures = []
+
+    def check(name, passed, detail=''):
+        print(f"{'ok  ' if passed else 'FAIL'} {name}" + (f" ({detail})" if detail and not passed else ''))
+        if not passed:
+            failures.append(name)
+
+    with tempfile.TemporaryDirectory() as directory, \
+            FixtureServer(listing_pages(initial, seed=args.seed)) as server:
+        database_url = f"sqlite:///{os.path.join(directory, 'smoke.db')}"
+        engine = create_engine(database_url)
+
+        requests = crawl(server, database_url, args)
+        fetched = sorted(page for page, status in requests if status == 200)
+        check(f"first crawl fetches each of the {args.pages} pages once", fetched == list(range(args.pages)),
+              f"requests: {requests}")
+        links = stored_links(engine)
+        check(f"first crawl stores all {len(initial)} publications",
+              links == {record.publication_link for record in initial}, f"stored {len(links)}")
+        check("first crawl is checkpointed as completed", crawl_completed(engine, server.url))
+
+        requests = crawl(server, database_url, args)
+        check("unchanged re-run stops after a 304 for page 1", requests == [(0, 304)], f"requests: {requests}")
+
+        server.set_pages(listing_pages(fresh + initial, seed=args.seed))
+        requests = crawl(server, database_url, args)
+        pages = sorted(page for page, _ in requests)
+        # Pages after the stop may already be in flight, but no more than the read-ahead window.
+        check("re-run after new publications stops at page 2",
+              pages[:2] == [0, 1] and len(pages) <= 1 + args.max_in_flight, f"requests: {requests}")
+        links = stored_links(engine)
+        check(f"re-run stores the {len(fresh)} new publications",
+              links == {record.publication_link for record in records}, f"stored {len(links)}")
+        check("re-run is checkpointed as completed", crawl_completed(engine, server.url))
+        engine.dispose()
+
+    if failures:
+        raise SystemExit(f"{len(failures)} check(s) failed: {', '.join(failures)}")
+    print("All checks passed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+# scripts/build_related.py
+import argparse
+import os
+import sys
+
+# Add the project root to the Python path to import app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.database import engine, init_db
+from app.related import DEFAULT_K, MIN_SCORE, RelatedBuilder
+
+# Ensure database tables are created (and FTS table is handled)
+init_db()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Precompute the related publications served on /publication/<id>/related. "
+                    "Run it after each crawl: by default only publications added since the last run are "
+                    "scored (and merged into the older lists).")
+    parser.add_argument('--full', action='store_true',
+                        help="Recompute the vocabulary, idf weights and every list, e.g. after "
+                             "dedupe_publications.py or fetch_abstracts.py changed many publications.")
+    parser.add_argument('--k', type=int, default=DEFAULT_K, help="Related publications kept per publication.")
+    parser.add_argument('--min-score', type=float, default=MIN_SCORE,
+                        help="Minimum cosine similarity (0-1) of a stored related publication.")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    RelatedBuilder(engine, args.k, args.min_score).update(full=args.full)
@@ -0,0 +1,60 @@
+# scripts/dedupe_publications.py
+import argparse
+import os
+import sys
+import time
+
+# Add the project root to the Python path to import app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import bindparam, text
+
+from app.database import engine, init_db
+from app.dedup import TITLE_THRESHOLD, deduplicate_all
+
+# Ensure database tables are created (and FTS table is handled)
+init_db()
+
+BATCH_SIZE = 2000 # Publications checked per transaction.
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Find near-duplicate publications in the whole database and collapse them "
+                    "(new publications are checked at ingest; see app/dedup.py).")
+    parser.add_argument('--threshold', type=float, default=TITLE_THRESHOLD,
+                        help="Minimum title shingle similarity (0-1) for a near-duplicate.")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--dry-run', action='store_true', help="Report the clusters without changing the database.")
+    parser.add_argument('--show', type=int, default=10, help="Print this many clusters as examples.")
+    return parser.parse_args(argv)
+
+
+def print_clusters(duplicates, limit):
+    clusters = {}
+    for duplicate_id, canonical_id in duplicates.items():
+        clusters.setdefault(canonical_id, []).append(duplicate_id)
+    shown = sorted(clusters.items(), key=lambda cluster: (-len(cluster[1]), cluster[0]))[:limit]
+    ids = [publication_id for canonical_id, members in shown for publication_id in [canonical_id] + members]
+    if not ids:
+        return
+    lookup = text("SELECT id, title, publication_year FROM publications WHERE id IN :ids").bindparams(
+        bindparam('ids', expanding=True))
+    with engine.connect() as connection:
+        titles = {row[0]: row[1:] for row in connection.execute(lookup, {'ids': ids})}
+    for canonical_id, members in shown:
+        title, year = titles[canonical_id]
+        print(f"[{canonical_id}] {title} ({year})")
+        for member in members:
+            title, year = titles[member]
+            print(f"    = [{member}] {title} ({year})")
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    started = time.perf_counter()
+    duplicates = deduplicate_all(engine, args.threshold, args.batch_size, args.dry_run)
+    clusters = len(set(duplicates.values()))
+    print(f"{'Would mark' if args.dry_run else 'Marked'} {len(duplicates)} publications as near-duplicates "
+          f"in {clusters} clusters ({time.perf_counter() - started:.1f}s).")
+    print_clusters(duplicates, args.show)
@@ -0,0 +1,57 @@
+# scripts/export_snapshot.py
+import argparse
+import os
+import sys
+import time
+
+# Add the project root to the Python path to import app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.database import engine, init_db
+from app.snapshot import (SNAPSHOT_DIR, KEEP_SNAPSHOTS, SnapshotError, export_snapshot, list_snapshots,
+                          current_version, publish_snapshot)
+
+# Ensure database tables are created (and FTS table is handled)
+init_db()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Export the publications and their search index into a read-only snapshot for web workers "
+                    "running with SEARCH_BACKEND=snapshot, and publish it. Run it after each crawl; workers "
+                    "switch to the new snapshot within SNAPSHOT_CHECK_INTERVAL seconds.")
+    parser.add_argument('--dir', default=SNAPSHOT_DIR, help=f"Snapshot directory (default: {SNAPSHOT_DIR}).")
+    parser.add_argument('--keep', type=int, default=KEEP_SNAPSHOTS,
+                        help="Snapshots kept on disk after publishing, the current one included.")
+    parser.add_argument('--no-publish', action='store_true',
+                        help="Write the snapshot without making it current (publish it later with --publish).")
+    parser.add_argument('--list', action='store_true', help="List the snapshots on disk and exit.")
+    parser.add_argument('--publish', metavar='VERSION',
+                        help="Make an existing snapshot current (e.g. to roll back) and exit.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        if args.list:
+            current = current_version(args.dir)
+            for version in list_snapshots(args.dir):
+                print(f"{'*' if version == current else ' '} {version}")
+            return 0
+        if args.publish:
+            publish_snapshot(args.dir, args.publish)
+            print(f"Published snapshot {args.publish}.")
+            return 0
+        started = time.perf_counter()
+        version = export_snapshot(engine, args.dir, args.keep, publish=not args.no_publish)
+    except SnapshotError as e:
+        print(f"Snapshot export FAILED: {e}")
+        return 1
+    print(f"{'Exported' if args.no_publish else 'Published'} snapshot {version} in {args.dir} "
+          f"in {time.perf_counter() - started:.1f}s.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
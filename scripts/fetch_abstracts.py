@@ -0,0 +1,38 @@
+# scripts/fetch_abstracts.py
+import argparse
+import os
+import sys
+
+# Add the project root to the Python path to import app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.database import engine, init_db
+from app.abstracts import fetch_missing_abstracts
+
+# Ensure database tables are created (and FTS table is handled)
+init_db()
+
+WORKERS = 8 # Detail pages fetched concurrently.
+REQUESTS_PER_SECOND = 2.0 # Per-host politeness budget for detail pages.
+BATCH_SIZE = 100 # Abstracts written per transaction.
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Fetch abstracts for publications that do not have one yet.")
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--rate', type=float, default=REQUESTS_PER_SECOND, help="Requests per second per host.")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--limit', type=int, default=None, help="Only process this many publications.")
+    parser.add_argument('--no-dedup', action='store_true',
+                        help="Don't re-check publications for near-duplicates once their abstract is in.")
+    parser.add_argument('--retry-failed', action='store_true',
+                        help="Also retry detail pages that failed permanently (e.g. 404) before their cool-off is over.")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    fetcher = fetch_missing_abstracts(engine, args.workers, args.rate, args.batch_size, args.limit,
+                                      not args.no_dedup, args.retry_failed)
+    print(f"Abstract fetch finished. Pages fetched: {fetcher.fetched}, abstracts found: {fetcher.found}, "
+          f"failed: {fetcher.failed} ({fetcher.failed_permanently} permanently).")
@@ -0,0 +1,61 @@
+# scripts/manage_fts.py
+import argparse
+import os
+import sys
+import time
+
+# Add the project root to the Python path to import app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy.exc import DatabaseError
+
+from app.database import engine, init_db
+from app.fts import (FTS_TOKENIZER, FTS_PREFIX, rebuild_fts, optimize_fts, integrity_check_fts,
+                     migrate_fts, fts_table_sql)
+from app.spelling import refresh_spelling
+
+# Ensure database tables are created (and FTS table is handled)
+init_db()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Maintenance commands for the publications_fts index.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('rebuild', help="Re-index every publication from the publications table.")
+    commands.add_parser('optimize', help="Merge index segments into one (run after large ingests).")
+    commands.add_parser('integrity-check', help="Verify the index against the publications table.")
+    migrate = commands.add_parser('migrate', help="Recreate the index as external content with the given settings.")
+    migrate.add_argument('--tokenizer', default=FTS_TOKENIZER, help=f"FTS5 tokenize= option (default: '{FTS_TOKENIZER}').")
+    migrate.add_argument('--prefix', default=FTS_PREFIX, help=f"FTS5 prefix= lengths (default: '{FTS_PREFIX}').")
+    commands.add_parser('spelling', help="Update the spelling suggestion dictionary from the index vocabulary.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    started = time.perf_counter()
+    with engine.begin() as connection:
+        if args.command == 'rebuild':
+            rebuild_fts(connection)
+            print("Spelling dictionary: {} terms added, {} removed.".format(*refresh_spelling(connection)))
+        elif args.command == 'optimize':
+            optimize_fts(connection)
+        elif args.command == 'integrity-check':
+            try:
+                integrity_check_fts(connection)
+            except DatabaseError as e:
+                print(f"Integrity check FAILED: {e.orig}. Run 'rebuild' to repair the index.")
+                return 1
+        elif args.command == 'migrate':
+            migrate_fts(connection, args.tokenizer, args.prefix)
+            print(f"Index is now: {' '.join(fts_table_sql(connection).split())}")
+            # A new tokenizer means new terms (e.g. stems instead of words).
+            print("Spelling dictionary: {} terms added, {} removed.".format(*refresh_spelling(connection)))
+        elif args.command == 'spelling':
+            print("Spelling dictionary: {} terms added, {} removed.".format(*refresh_spelling(connection)))
+    print(f"{args.command} finished in {time.perf_counter() - started:.2f}s.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
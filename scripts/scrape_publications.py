@@ -1,14 +1,13 @@
 # scripts/scrape_publications.py
-import json
-import requests
-from time import sleep
-from random import randint
-from bs4 import BeautifulSoup
+import argparse
+import asyncio
+from contextlib import aclosing
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+import glob
 import os
 import sys
-import re
+import time
 
 # Selenium imports
 from selenium import webdriver
@@ -23,14 +22,30 @@ from webdriver_manager.chrome import ChromeDriverManager
 # Add the project root to the Python path to import app modules
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from app.models import Publication, Author, PublicationFTS, Base
-from app.database import engine, SessionLocal, init_db
+from app.database import engine, init_db
+from app.ingest import BulkIngester, ingest_records_row_by_row
+from app.crawler import AsyncCrawler
+from app.crawl_state import CrawlStateStore, results_fingerprint
+from app.abstracts import fetch_missing_abstracts
+from app.parsing import parse_page_documents, get_listing_parser, available_listing_parsers
+from app.pipeline import IngestPipeline, http_fetcher, fetch_file
+from app.spelling import refresh_spelling
+from app.sources import make_source, parse_source_arg, load_sources, select_sources, check_unique, source_counts
+from app import metrics
 
 # Ensure database tables are created (and FTS table is handled)
 init_db()
 
+# Count and time the scraper's SQL like the web app's (see app/metrics.py).
+metrics.instrument_engine(engine, 'writer')
+
 BASE_URL = 'https://pureportal.coventry.ac.uk/en/organisations/school-of-economics-finance-and-accounting/publications/'
 MAX_PAGES = 16 # Adjust based on how many pages you want to scrape, dynamic detection will cap this.
+REQUESTS_PER_SECOND = 1.0 # Per-host politeness budget shared by all in-flight requests.
+MAX_IN_FLIGHT = 4 # Upper bound on concurrent requests.
+PIPELINE_BATCH_SIZE = 500 # Records per write transaction in pipeline mode.
+MAX_SOURCES_IN_FLIGHT = 4 # Sources crawled at the same time; they share the per-host budget.
+MAX_PAGES_UNBOUNDED = 10 ** 6 # Page cap for sources configured without max_pages.
 
 # --- Selenium Setup ---
 def setup_driver():
@@ -47,209 +62,406 @@ def setup_driver():
     driver = webdriver.Chrome(service=service, options=chrome_options)
     return driver
 
+class SeleniumFallback:
+    """
+    Renders a page in headless Chrome. Only used for pages the plain HTTP
+    client could not get a usable listing from, and the browser is only
+    launched the first time that happens.
+    """
+
+    def __init__(self):
+        self.driver = None
+
+    def __call__(self, url):
+        if self.driver is None:
+            self.driver = setup_driver()
+        self.driver.get(url)
+        WebDriverWait(self.driver, 20).until(EC.presence_of_element_located((By.CSS_SELECTOR, "ul.list-results")))
+        return self.driver.page_source
+
+    def close(self):
+        if self.driver:
+            self.driver.quit() # Ensure the browser is closed
+            self.driver = None
+
 # --- End Selenium Setup ---
 
 
-def get_total_pages(soup):
+def listing_needs_browser(result):
+    """A listing fetched over plain HTTP is unusable if the result list never made it into the HTML."""
+    if result.status == 304:
+        return False
+    return result.status != 200 or 'list-results' not in result.text
+
+
+def scrape_publications(base_url=BASE_URL, max_pages=MAX_PAGES, rate=REQUESTS_PER_SECOND,
+                        max_in_flight=MAX_IN_FLIGHT, use_browser=True, incremental=True, restart=False,
+                        parser=None, sources=None, max_sources=MAX_SOURCES_IN_FLIGHT):
+    """
+    Scrapes publication data from PurePortal and stores it in the database.
+    Listing pages are fetched concurrently over HTTP; Selenium is only used
+    as a fallback for pages that need a real browser. `parser` names the
+    listing parser (see app/parsing.py; default: the fastest installed).
+
+    `sources` is a list of CrawlSources (default: `base_url` alone); up to
+    `max_sources` of them are crawled at the same time.
     """
-    Attempts to find the total number of pages from the pagination links,
-    considering the ?page=X typically means actual_page_number = X + 1.
+    sources = sources or [make_source(base_url, max_pages=max_pages)]
+    parse = get_listing_parser(parser)
+    asyncio.run(crawl_sources(sources, rate, max_in_flight, use_browser, incremental, restart, parse, max_sources))
+
+def page_url(base_url, page_num_actual):
+    """?page=X is actual page X + 1; page 1 is the bare base URL."""
+    return base_url if page_num_actual == 1 else f"{base_url}?page={page_num_actual - 1}"
+
+def process_listing_page(result, ingester, state, incremental, parse, source, page=None):
     """
-    pagination_elements = soup.find_all(['a', 'span'], class_=['step', 'currentStep'])
-    
-    max_actual_page_num_found = 1 
-
-    for element in pagination_elements:
-        try:
-            if element.name == 'a' and 'step' in element.get('class', []):
-                href = element.get('href')
-                if href:
-                    match = re.search(r'\?page=(\d+)$', href)
-                    if match:
-                        actual_page_from_href = int(match.group(1)) + 1
-                        if actual_page_from_href > max_actual_page_num_found:
-                            max_actual_page_num_found = actual_page_from_href
-                        
-            elif element.name == 'span' and 'currentStep' in element.get('class', []):
-                current_page_text = int(element.get_text(strip=True))
-                if current_page_text > max_actual_page_num_found:
-                    max_actual_page_num_found = current_page_text
-            
-            text_content = element.get_text(strip=True)
-            if text_content.isdigit():
-                page_num_from_text = int(text_content)
-                if page_num_from_text > max_actual_page_num_found:
-                    max_actual_page_num_found = page_num_from_text
-
-        except (ValueError, TypeError):
-            continue 
-            
-    return max_actual_page_num_found
-
-def scrape_publications():
-    """
-    Scrapes publication data from PurePortal and stores it in the database using Selenium.
-    """
-    driver = None # Initialize driver to None
-    db_session = SessionLocal()
+    Ingests one fetched listing page of `source` unless it is known to be
+    unchanged. `parse` is a listing parser from app/parsing.py; `page` is its
+    output if the caller already parsed the HTML. Returns (added_count,
+    skipped_count, all_known); all_known means every publication on the page
+    was already recorded for this source. (Being in the database is not
+    enough: another unit may have added it earlier in the same run.)
+
+    A page that parses to no records is never all_known, and its state is not
+    saved: it usually means the markup changed or the page came back broken,
+    so it must neither stop an incremental crawl nor be skipped next time.
+    """
+    if result.status == 304:
+        state.touch(result.url)
+        metrics.SCRAPER_PAGES.inc(source=source.name, outcome='not_modified')
+        return 0, 0, True
+
+    fingerprint = results_fingerprint(result.text)
+    if incremental and state.is_unchanged(result.url, fingerprint):
+        state.save(result.url, result.headers, fingerprint)
+        metrics.SCRAPER_PAGES.inc(source=source.name, outcome='unchanged')
+        return 0, 0, True
+
+    if page is None:
+        started = time.perf_counter()
+        page = parse(result.text)
+        metrics.SCRAPER_PARSE_SECONDS.observe(time.perf_counter() - started)
+    if not page.records:
+        metrics.SCRAPER_PAGES.inc(source=source.name, outcome='empty')
+        print(f"[{source.name}] No publications found on {result.url}; the listing markup may have changed.")
+        return 0, 0, False
+
+    parsed = time.perf_counter()
+    links = {record.publication_link for record in page.records}
+    known = ingester.known_to_source(links, source.name)
+    added_count, skipped_count = ingester.ingest(page.records, source.name)
+    metrics.SCRAPER_INGEST_SECONDS.observe(time.perf_counter() - parsed)
+    metrics.SCRAPER_PAGES.inc(source=source.name, outcome='ingested')
+    metrics.SCRAPER_PUBLICATIONS.inc(added_count, source=source.name, outcome='added')
+    metrics.SCRAPER_PUBLICATIONS.inc(skipped_count, source=source.name, outcome='skipped')
+    state.save(result.url, result.headers, fingerprint)
+    return added_count, skipped_count, bool(links) and len(known) == len(links)
+
+def scrape_summary(elapsed):
+    """One-line summary of the run's metrics; also sets the pages/sec gauge."""
+    pages = metrics.SCRAPER_PAGES.total()
+    pages_per_second = pages / elapsed if elapsed > 0 else 0.0
+    metrics.SCRAPER_PAGES_PER_SECOND.set(round(pages_per_second, 3))
+    parsed, parse_seconds = metrics.SCRAPER_PARSE_SECONDS.value()
+    _, ingest_seconds = metrics.SCRAPER_INGEST_SECONDS.value()
+    _, waited = metrics.CRAWLER_RATE_LIMIT_WAIT_SECONDS.totals()
+    return (f"{pages} pages in {elapsed:.1f}s ({pages_per_second:.2f} pages/sec); "
+            f"parse {parse_seconds:.2f}s and write {ingest_seconds:.2f}s over {parsed} pages; "
+            f"{waited:.1f}s waiting on rate limits.")
+
+async def crawl_sources(sources, rate, max_in_flight, use_browser, incremental=True, restart=False, parse=None,
+                        max_sources=MAX_SOURCES_IN_FLIGHT):
+    """
+    Crawls several listing roots at once through one AsyncCrawler, so the
+    per-host rate limit and the in-flight cap are shared by every source
+    on the same portal. Publications listed by more than one source are
+    stored once (by publication_link) and recorded under each source.
+    A failing source is reported and does not stop the others.
+    """
+    parse = parse or get_listing_parser()
+    fallback = SeleniumFallback() if use_browser else None
+    started = time.perf_counter()
+    ingester = BulkIngester(engine)
+    state = CrawlStateStore(engine)
+    slots = asyncio.Semaphore(max_sources)
+    totals = {}
+
+    async def crawl_one(source):
+        async with slots:
+            totals[source.name] = await crawl_source(crawler, source, ingester, state, parse, incremental, restart)
+
+    try:
+        async with AsyncCrawler(rate=rate, max_in_flight=max_in_flight,
+                                browser_fallback=fallback, needs_browser=listing_needs_browser) as crawler:
+            await asyncio.gather(*(crawl_one(source) for source in sources))
+    finally:
+        if fallback:
+            fallback.close()
+        if len(sources) > 1:
+            for name, (added, skipped) in totals.items():
+                print(f"[{name}] added {added}, skipped {skipped}.")
+        print(f"Scraping finished. Total new publications added in this run: {sum(added for added, _ in totals.values())}.")
+        print(f"Total publications skipped (already in DB): {sum(skipped for _, skipped in totals.values())}.")
+        print(scrape_summary(time.perf_counter() - started))
+
+async def crawl_source(crawler, source, ingester, state, parse, incremental=True, restart=False):
+    """
+    Fetches page 1 of `source` to discover the page count, then walks the
+    remaining pages in order with up to the crawler's in-flight limit of
+    fetches running ahead. Returns (added_count, skipped_count).
+
+    In incremental mode, requests are conditional (ETag/Last-Modified),
+    pages whose result list is unchanged are not parsed, and paging stops at
+    the first page that holds only publications already recorded for the
+    source. Progress is checkpointed per page, so an interrupted crawl
+    resumes after the last page it finished unless `restart` is set.
+    """
+    base_url = source.url
+    max_pages = source.max_pages or MAX_PAGES_UNBOUNDED
+    headers_for = state.conditional_headers if incremental else None
     publications_added_count = 0
     publications_skipped_count = 0
 
+    def log(message):
+        print(f"[{source.name}] {message}")
+
     try:
-        driver = setup_driver()
-        wait = WebDriverWait(driver, 20) # Wait up to 20 seconds for elements to appear
-
-        # Fetch the BASE_URL directly for the first page (page 1)
-        print("Fetching initial page (page 1) to determine total pages and scrape first batch...")
-        driver.get(BASE_URL)
-        
-        # Wait for the main content to load. Adjust locator if needed.
-        # Assuming 'list-results' is the UL containing publication items
-        wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "ul.list-results")))
-        
-        initial_soup = BeautifulSoup(driver.page_source, "html.parser")
-        total_pages = get_total_pages(initial_soup)
-        print(f"Total pages detected: {total_pages}. Scraping up to {min(total_pages, MAX_PAGES)} pages.")
-        
-        # Process the first page (page 1), which we just fetched using BASE_URL
-        print(f"Processing page 1/{min(total_pages, MAX_PAGES)}: {BASE_URL}")
-        processed_count_on_page, skipped_count_on_page = process_page_documents(initial_soup, db_session)
-        publications_added_count += processed_count_on_page
-        publications_skipped_count += skipped_count_on_page
-        db_session.commit() 
-        print(f"Page 1 processed. New publications added this run: {publications_added_count}. Skipped (existing): {publications_skipped_count}")
-
-        # Loop for subsequent pages starting from page 2
-        for page_num_actual in range(2, min(total_pages, MAX_PAGES) + 1): 
-            url_page_param = page_num_actual - 1 
-            url = f"{BASE_URL}?page={url_page_param}"
-            print(f"Scraping page {page_num_actual}/{min(total_pages, MAX_PAGES)}: {url}")
-            try:
-                driver.get(url)
-                # Wait for the main content to load on subsequent pages
-                wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "ul.list-results")))
-            except Exception as e:
-                print(f"Error fetching {url} with Selenium: {e}")
-                continue 
-
-            sleep(randint(5, 10)) # Shorter sleep as Selenium is slower, but still polite
-
-            soup = BeautifulSoup(driver.page_source, "html.parser")
-            processed_count_on_page, skipped_count_on_page = process_page_documents(soup, db_session)
+        checkpoint = None if restart else state.checkpoint(base_url)
+
+        if checkpoint is not None and not checkpoint.completed and checkpoint.last_page > 0:
+            total_pages = min(checkpoint.total_pages, max_pages)
+            first_page = checkpoint.last_page + 1
+            log(f"Resuming interrupted crawl of {base_url} at page {first_page}/{total_pages}.")
+        else:
+            # Fetch the base URL directly for the first page (page 1)
+            log("Fetching initial page (page 1) to determine total pages and scrape first batch...")
+            state.load([base_url])
+            first = await crawler.fetch(base_url, headers_for(base_url) if headers_for else None)
+            if not first.ok:
+                raise RuntimeError(f"Could not fetch {base_url}: {first.error}")
+
+            if first.status == 304:
+                process_listing_page(first, ingester, state, incremental, parse, source)
+                log("Page 1 not modified since the last crawl; nothing new to fetch.")
+                return 0, 0
+
+            parse_started = time.perf_counter()
+            initial_page = parse(first.text)
+            metrics.SCRAPER_PARSE_SECONDS.observe(time.perf_counter() - parse_started)
+            detected_pages = initial_page.total_pages
+            total_pages = min(detected_pages, max_pages)
+            log(f"Total pages detected: {detected_pages}. Scraping up to {total_pages} pages.")
+
+            # Process the first page (page 1), which we just fetched using the base URL
+            log(f"Processing page 1/{total_pages}: {base_url} (via {first.source})")
+            processed_count_on_page, skipped_count_on_page, all_known = process_listing_page(
+                first, ingester, state, incremental, parse, source, initial_page)
             publications_added_count += processed_count_on_page
             publications_skipped_count += skipped_count_on_page
-
-            db_session.commit() 
-            print(f"Page {page_num_actual} processed. New publications added this run: {publications_added_count}. Skipped (existing): {publications_skipped_count}")
+            log(f"Page 1 processed. New publications added this run: {publications_added_count}. Skipped (existing): {publications_skipped_count}")
+
+            if incremental and all_known:
+                state.save_checkpoint(base_url, 1, total_pages, completed=True)
+                log("Page 1 holds no new publications; stopping early.")
+                return publications_added_count, publications_skipped_count
+            state.save_checkpoint(base_url, 1, total_pages)
+            first_page = 2
+
+        urls = [page_url(base_url, page_num_actual) for page_num_actual in range(first_page, total_pages + 1)]
+        state.load(urls)
+        contiguous = first_page - 1 # Last page such that every page up to it has been processed
+        last_page = total_pages
+
+        async with aclosing(crawler.fetch_ordered(urls, headers_for)) as results:
+            page_num_actual = first_page - 1
+            async for result in results:
+                page_num_actual += 1
+                if not result.ok:
+                    metrics.SCRAPER_PAGES.inc(source=source.name, outcome='failed')
+                    log(f"Error fetching {result.url}: {result.error}")
+                    continue
+
+                processed_count_on_page, skipped_count_on_page, all_known = process_listing_page(
+                    result, ingester, state, incremental, parse, source)
+                publications_added_count += processed_count_on_page
+                publications_skipped_count += skipped_count_on_page
+                log(f"Page {page_num_actual}/{total_pages} processed (via {result.source}). New publications added this run: {publications_added_count}. Skipped (existing): {publications_skipped_count}")
+
+                if contiguous == page_num_actual - 1:
+                    contiguous = page_num_actual
+                    state.save_checkpoint(base_url, contiguous, total_pages)
+
+                if incremental and all_known:
+                    log(f"Page {page_num_actual} holds no new publications; stopping early.")
+                    last_page = page_num_actual
+                    break
+
+        # A crawl with a failed page in the middle is resumed from that page next time.
+        if contiguous == last_page:
+            state.save_checkpoint(base_url, contiguous, total_pages, completed=True)
+        else:
+            log(f"Crawl incomplete; the next run resumes at page {contiguous + 1}.")
 
     except Exception as e:
-        print(f"An unexpected error occurred during scraping: {e}")
-        db_session.rollback()
-    finally:
-        if driver:
-            driver.quit() # Ensure the browser is closed
-        db_session.close()
-        print(f"Scraping finished. Total new publications added in this run: {publications_added_count}.")
-        print(f"Total publications skipped (already in DB): {publications_skipped_count}.")
+        log(f"An unexpected error occurred during scraping: {e}")
+    return publications_added_count, publications_skipped_count
 
-def process_page_documents(soup, db_session):
+def scrape_pipelined(sources, rate=REQUESTS_PER_SECOND, max_in_flight=MAX_IN_FLIGHT, use_browser=True,
+                     parser=None, parse_workers=None, batch_size=PIPELINE_BATCH_SIZE, dedup=True):
     """
-    Helper function to process documents on a single page.
-    Returns (added_count, skipped_count) for the page.
-    """
-    added_count = 0
-    skipped_count = 0
-
-    documents = soup.find_all("li", {"class": "list-result-item"})
-
-    if not documents:
-        return 0, 0
-
-    for doc in documents:
-        title_h3 = doc.find("h3", {"class": "title"})
-        if not title_h3:
-            continue
-
-        pub_link_tag = title_h3.find('a', {'class':'link'})
-        pub_title_span = title_h3.find('span')
-
-        if not pub_link_tag or not pub_title_span:
-            continue
-
-        pub_link = pub_link_tag.get('href')
-        pub_title = pub_title_span.text.strip()
-
-        authors_div = doc.find('div', {'class': 'relations persons'})
-        current_authors = []
-        if authors_div:
-            author_tags = authors_div.find_all('a', {'class': 'link person'})
-            for author_tag in author_tags:
-                author_name = author_tag.find('span').text.strip()
-                author_link = author_tag.get('href')
-
-                author_obj = db_session.query(Author).filter_by(name=author_name).first()
-                if not author_obj:
-                    author_obj = Author(name=author_name, author_link=author_link)
-                    db_session.add(author_obj)
-                    db_session.flush()
-                current_authors.append(author_obj)
-        
-        publication_year = None
-        year_div = doc.find('div', class_='search-result-group')
-        if year_div:
-            try:
-                year_text = year_div.get_text(strip=True)
-                match = re.search(r'\b(19|20)\d{2}\b', year_text) 
-                if match:
-                    publication_year = int(match.group(0))
-            except (ValueError, TypeError):
-                pass
-        
-        if publication_year is None:
-            date_span = doc.find('span', class_='date')
-            if date_span:
-                try:
-                    year_text_from_date = date_span.text.strip()
-                    match = re.search(r'\b(19|20)\d{2}\b', year_text_from_date)
-                    if match:
-                        publication_year = int(match.group(0))
-                except (ValueError, TypeError):
-                    pass
-
-        abstract_text = None
-        # Abstract extraction remains the same: it's not clearly visible in the list view HTML/image.
-        # To get the abstract, you would need to visit each individual publication link.
-
-        existing_publication = db_session.query(Publication).filter_by(publication_link=pub_link).first()
-
-        if existing_publication:
-            for author_obj in current_authors:
-                if author_obj not in existing_publication.authors:
-                    existing_publication.authors.append(author_obj)
-            skipped_count += 1
-        else:
-            publication = Publication(
-                title=pub_title,
-                publication_link=pub_link,
-                publication_year=publication_year,
-                abstract=abstract_text
-            )
-            publication.authors.extend(current_authors)
-            db_session.add(publication)
-            db_session.flush()
+    Full crawl of `sources` through the staged pipeline (app/pipeline.py):
+    pages are fetched concurrently, parsed in worker processes and written
+    in batches by a single writer, all at once. There is no early stop or
+    checkpointing, which need pages in order; use it for first loads and
+    full re-crawls. Without `dedup`, near-duplicates are left for
+    scripts/dedupe_publications.py to find afterwards.
+    """
+    parse = get_listing_parser(parser)
+    fallback = SeleniumFallback() if use_browser else None
+
+    async def crawl():
+        async with AsyncCrawler(rate=rate, max_in_flight=max_in_flight,
+                                browser_fallback=fallback, needs_browser=listing_needs_browser) as crawler:
+            firsts = await asyncio.gather(*(crawler.fetch(source.url) for source in sources))
+            items, prefetched = [], {}
+            for source, first in zip(sources, firsts):
+                if not first.ok:
+                    print(f"[{source.name}] Could not fetch {source.url}: {first.error}")
+                    continue
+                detected_pages = parse(first.text).total_pages
+                total_pages = min(detected_pages, source.max_pages or MAX_PAGES_UNBOUNDED)
+                print(f"[{source.name}] Total pages detected: {detected_pages}. Scraping up to {total_pages} pages.")
+                prefetched[source.url] = first.text
+                items.extend((source.name, page_url(source.url, page_num_actual))
+                             for page_num_actual in range(1, total_pages + 1))
+            fetch_url = http_fetcher(crawler, prefetched)
+
+            async def fetch(item):
+                return await fetch_url(item[1])
+
+            pipeline = IngestPipeline(BulkIngester(engine, dedup), parse, parse_workers, max_in_flight, batch_size,
+                                      source_of=lambda item: item[0])
+            return await pipeline.run_async(items, fetch)
 
-            fts_entry = PublicationFTS(
-                rowid=publication.id,
-                title=publication.title,
-                abstract=publication.abstract or ""
-            )
-            db_session.add(fts_entry)
-            db_session.flush()
+    try:
+        stats = asyncio.run(crawl())
+    finally:
+        if fallback:
+            fallback.close()
+    print(stats.summary())
+    return stats
 
-            added_count += 1
+def ingest_saved_pages(directory, parser=None, parse_workers=None, batch_size=PIPELINE_BATCH_SIZE, source=None,
+                       dedup=True):
+    """
+    Runs saved listing pages (*.html in `directory`) through the staged
+    pipeline, recording them under the source named `source` if given.
+    """
+    paths = sorted(glob.glob(os.path.join(directory, '*.html')))
+    if not paths:
+        raise SystemExit(f"No .html files in {directory}")
+    pipeline = IngestPipeline(BulkIngester(engine, dedup), get_listing_parser(parser), parse_workers, batch_size=batch_size,
+                              source_of=(lambda path: source) if source else None)
+    stats = pipeline.run(paths, fetch_file)
+    print(stats.summary())
+    return stats
 
-    return added_count, skipped_count
+def process_page_documents(soup, db_session):
+    """
+    Helper function to process documents on a single page through the
+    row-by-row ORM path. Returns (added_count, skipped_count) for the page.
+    """
+    return ingest_records_row_by_row(db_session, parse_page_documents(soup))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Scrape PurePortal publication listings into the database.")
+    parser.add_argument('--base-url', default=BASE_URL,
+                        help="Listing root to crawl when no --sources/--source is given (e.g. a local fixture server).")
+    parser.add_argument('--max-pages', type=int, default=MAX_PAGES,
+                        help="Page cap for --base-url and --source, and for --sources entries without max_pages.")
+    parser.add_argument('--sources', metavar='FILE',
+                        help="JSON list of listing roots to crawl (see sources.example.json).")
+    parser.add_argument('--source', action='append', default=[], metavar='[NAME=]URL',
+                        help="Listing root to crawl; repeat for several. Named after its unit if NAME is omitted.")
+    parser.add_argument('--only', action='append', default=[], metavar='NAME',
+                        help="Crawl only this configured source; repeatable.")
+    parser.add_argument('--max-sources', type=int, default=MAX_SOURCES_IN_FLIGHT,
+                        help="Sources crawled at the same time (they share the per-host rate limit).")
+    parser.add_argument('--list-sources', action='store_true',
+                        help="Print how many publications each source has contributed and exit.")
+    parser.add_argument('--rate', type=float, default=REQUESTS_PER_SECOND, help="Requests per second per host.")
+    parser.add_argument('--max-in-flight', type=int, default=MAX_IN_FLIGHT)
+    parser.add_argument('--no-browser', action='store_true', help="Never fall back to Selenium.")
+    parser.add_argument('--full', action='store_true',
+                        help="Re-download and re-parse every page: no conditional requests, no early stop.")
+    parser.add_argument('--restart', action='store_true', help="Ignore the checkpoint of an interrupted crawl.")
+    parser.add_argument('--with-abstracts', action='store_true',
+                        help="After the listing crawl, fetch detail pages for publications missing an abstract.")
+    parser.add_argument('--parser', choices=available_listing_parsers(),
+                        help="Listing page parser (default: the fastest installed; see app/parsing.py).")
+    parser.add_argument('--pipeline', action='store_true',
+                        help="Full crawl with concurrent fetching, parsing in worker processes and batched writes.")
+    parser.add_argument('--from-dir', help="Ingest saved listing pages (*.html) from this directory instead of crawling.")
+    parser.add_argument('--from-dir-source', metavar='NAME',
+                        help="Record pages ingested with --from-dir under this source name.")
+    parser.add_argument('--parse-workers', type=int, default=None, help="Parser processes for --pipeline/--from-dir (default: one per CPU).")
+    parser.add_argument('--batch-size', type=int, default=PIPELINE_BATCH_SIZE, help="Records per write transaction for --pipeline/--from-dir.")
+    parser.add_argument('--no-dedup', action='store_true',
+                        help="Skip the near-duplicate check in --pipeline/--from-dir and --with-abstracts "
+                             "(faster first loads); run scripts/dedupe_publications.py afterwards.")
+    parser.add_argument('--metrics-file',
+                        help="Write the run's metrics here in the Prometheus text format "
+                             "(e.g. for node_exporter's textfile collector).")
+    parser.add_argument('--slow-query-ms', type=float, default=metrics.SLOW_QUERY_MS,
+                        help="Log statements slower than this with their query plan (0: off).")
+    return parser.parse_args(argv)
+
+def configured_sources(args):
+    """The sources to crawl: --sources and --source entries (else --base-url), narrowed by --only."""
+    sources = load_sources(args.sources, args.max_pages) if args.sources else []
+    sources += [parse_source_arg(value, args.max_pages) for value in args.source]
+    if not sources:
+        sources = [make_source(args.base_url, max_pages=args.max_pages)]
+    return select_sources(check_unique(sources), args.only)
+
+def print_source_counts():
+    with engine.connect() as connection:
+        rows = source_counts(connection)
+    if not rows:
+        print("No publications have been recorded under a source yet.")
+    for source, publications, only_here, last_seen in rows:
+        print(f"{source:<40} {publications:>8} publications {only_here:>8} only here  last seen {last_seen}")
 
 
 if __name__ == "__main__":
-    scrape_publications()
+    args = parse_args()
+    if args.list_sources:
+        print_source_counts()
+        raise SystemExit(0)
+    try:
+        sources = configured_sources(args)
+    except (OSError, ValueError) as e:
+        raise SystemExit(f"Invalid source configuration: {e}")
+
+    metrics.instrument_engine(engine, 'writer', args.slow_query_ms)
+    if args.from_dir:
+        ingest_saved_pages(args.from_dir, args.parser, args.parse_workers, args.batch_size, args.from_dir_source,
+                           not args.no_dedup)
+    elif args.pipeline:
+        scrape_pipelined(sources, args.rate, args.max_in_flight, not args.no_browser,
+                         args.parser, args.parse_workers, args.batch_size, not args.no_dedup)
+    else:
+        scrape_publications(rate=args.rate, max_in_flight=args.max_in_flight, use_browser=not args.no_browser,
+                            incremental=not args.full, restart=args.restart, parser=args.parser,
+                            sources=sources, max_sources=args.max_sources)
+    if args.with_abstracts:
+        fetch_missing_abstracts(engine, rate=args.rate, dedup=not args.no_dedup)
+    # New vocabulary for "did you mean" suggestions (see app/spelling.py).
+    with engine.begin() as connection:
+        added, removed = refresh_spelling(connection)
+    print(f"Spelling dictionary: {added} terms added, {removed} removed.")
+    if args.metrics_file:
+        metrics.REGISTRY.write(args.metrics_file)
+        print(f"Metrics written to {args.metrics_file}")